@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from xaiographs import Explainer
+from xaiographs.common.utils import get_features_info, get_target_info, sample_by_target, xgprint
+from xaiographs.datasets import (load_body_performance_discretized, load_compas_discretized,
+                                 load_education_performance_discretized, load_phone_brand_preferences_discretized,
+                                 load_titanic_discretized)
+from xaiographs.exgraph.importance.lide_model import LIDEModel
+from xaiographs.exgraph.importance.lide_online import LIDEOnlineExplainer
+from xaiographs.exgraph.stats_calculator import StatsCalculator
+
+# CONSTANTS
+DATASETS = [('titanic', load_titanic_discretized),
+            ('body_performance', load_body_performance_discretized),
+            ('education_performance', load_education_performance_discretized),
+            ('phone_brand_preferences', load_phone_brand_preferences_discretized),
+            ('compas', load_compas_discretized)]
+LATENCY_NUM_FEATURES = 8
+LATENCY_NUM_ROWS = 200
+LATENCY_P99_TARGET_MS = 5.0
+MULTI_TARGET_NUM_FEATURES = 6
+MULTI_TARGET_NUM_ROWS = 5000
+STATS_NUM_SAMPLES = 100
+STATS_NUM_TARGETS = 3
+
+
+def _build_stats_calculator(num_rows: int, num_features: int, n_jobs: int = 1) -> StatsCalculator:
+    """
+    This function builds a StatsCalculator for a random dataset with a float feature and integer ones (10 distinct
+    values each)
+
+    :param num_rows:        Integer, representing the number of rows of the dataset
+    :param num_features:    Integer, representing the number of features of the dataset
+    :param n_jobs:          Integer, representing the number of processes used to count the edges
+    :return:                StatsCalculator object, ready to calculate the statistics
+    """
+    rng = np.random.default_rng(0)
+    feature_cols = ['f{}'.format(i) for i in range(num_features)]
+    target_cols = ['t{}'.format(t) for t in range(STATS_NUM_TARGETS)]
+    df = pd.DataFrame({feature_col: rng.integers(0, 10, size=num_rows) for feature_col in feature_cols})
+    df['f0'] = rng.normal(size=num_rows)
+    labels = rng.integers(0, STATS_NUM_TARGETS, size=num_rows)
+    df = pd.concat([df, pd.DataFrame(np.eye(STATS_NUM_TARGETS, dtype=int)[labels], columns=target_cols)], axis=1)
+    df.insert(0, 'id', np.arange(num_rows))
+    features_info = get_features_info(df=df, feature_cols=feature_cols, target_cols=target_cols)
+    target_info = get_target_info(df=df, target_cols=target_cols)
+    sample_ids_mask, sample_ids = sample_by_target(ids=df['id'].values, top1_targets=target_info.top1_targets,
+                                                   num_samples=STATS_NUM_SAMPLES, target_probs=target_info.target_probs,
+                                                   target_cols=target_cols)
+    return StatsCalculator(df=df, top1_targets=target_info.top1_targets, feature_cols=feature_cols,
+                           float_feature_cols=features_info.float_feature_columns, target_cols=target_cols,
+                           sample_ids_mask=sample_ids_mask, sample_ids=sample_ids, n_jobs=n_jobs)
+
+
+def benchmark_lide_online_latency(verbose: int = 1):
+    """
+    This function reports the latency of single row explanations for the bundled datasets (using at most 8 features,
+    as the Explainer does by default) and warns about those whose p99 latency is above the target
+
+    :param verbose: Verbosity level, where any value greater than 0 means the message is printed
+    """
+    for name, loader in DATASETS:
+        df, feature_cols, target_cols, _, _ = loader()
+        feature_cols = feature_cols[:LATENCY_NUM_FEATURES]
+        explainer = LIDEOnlineExplainer(LIDEModel.fit(df=df, feature_cols=feature_cols, target_cols=target_cols))
+        latencies = []
+        for row in df[feature_cols].head(LATENCY_NUM_ROWS).values.tolist():
+            start = time.perf_counter()
+            explainer.explain_one(row)
+            latencies.append(time.perf_counter() - start)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+        xgprint(verbose, 'INFO:     {}: {} features, explain_one latency p50 {:.3f} ms, p99 {:.3f} ms'.format(
+            name, len(feature_cols), p50, p99))
+        if p99 > LATENCY_P99_TARGET_MS:
+            xgprint(verbose, 'WARN:     {}: p99 latency is above the {} ms target'.format(
+                name, LATENCY_P99_TARGET_MS))
+
+
+def benchmark_multi_target_scaling(verbose: int = 1):
+    """
+    This function reports how the explainer fit time scales with the number of targets, up to 50 targets
+
+    :param verbose: Verbosity level, where any value greater than 0 means the message is printed
+    """
+    rng = np.random.default_rng(0)
+    feature_cols = ['f{}'.format(i) for i in range(MULTI_TARGET_NUM_FEATURES)]
+    for num_targets in [2, 10, 50]:
+        df = pd.DataFrame({feature_col: rng.integers(0, 4, size=MULTI_TARGET_NUM_ROWS) for feature_col in feature_cols})
+        labels = (df.values @ rng.integers(0, 5, size=MULTI_TARGET_NUM_FEATURES) +
+                  rng.integers(0, num_targets, size=MULTI_TARGET_NUM_ROWS))
+        target_cols = ['t{}'.format(t) for t in range(num_targets)]
+        df = pd.concat([df, pd.DataFrame(np.eye(num_targets, dtype=int)[labels % num_targets], columns=target_cols)],
+                       axis=1)
+        df.insert(0, 'id', np.arange(MULTI_TARGET_NUM_ROWS))
+        with tempfile.TemporaryDirectory() as path, contextlib.redirect_stdout(io.StringIO()):
+            explainer = Explainer(importance_engine='LIDE', destination_path=path,
+                                  number_of_features=MULTI_TARGET_NUM_FEATURES, verbose=0)
+            start = time.perf_counter()
+            explainer.fit(df=df, feature_cols=feature_cols, target_cols=target_cols, num_samples_local_expl=50,
+                          num_samples_global_expl=2000)
+            elapsed = time.perf_counter() - start
+        xgprint(verbose, 'INFO:     {} targets: fit in {:.2f} seconds'.format(num_targets, elapsed))
+
+
+def benchmark_stats_scaling(verbose: int = 1):
+    """
+    This function reports how nodes and edges statistics scale with the number of rows and features
+
+    :param verbose: Verbosity level, where any value greater than 0 means the message is printed
+    """
+    for num_rows, num_features in [(10000, 8), (100000, 8), (10000, 16), (10000, 32)]:
+        stats = _build_stats_calculator(num_rows=num_rows, num_features=num_features)
+        start = time.perf_counter()
+        stats.calculate_stats()
+        elapsed = time.perf_counter() - start
+        xgprint(verbose, 'INFO:     {} rows, {} features: stats in {:.2f} seconds'.format(
+            num_rows, num_features, elapsed))
+
+
+def benchmark_stats_n_jobs(verbose: int = 1):
+    """
+    This function reports how edges statistics scale with the number of processes for 40 features (780 feature pairs)
+
+    :param verbose: Verbosity level, where any value greater than 0 means the message is printed
+    """
+    for n_jobs in [1, -1]:
+        stats = _build_stats_calculator(num_rows=50000, num_features=40, n_jobs=n_jobs)
+        start = time.perf_counter()
+        stats.calculate_stats()
+        elapsed = time.perf_counter() - start
+        xgprint(verbose, 'INFO:     {} jobs: stats in {:.2f} seconds'.format(n_jobs, elapsed))
+
+
+BENCHMARKS = {'lide_online_latency': benchmark_lide_online_latency,
+              'multi_target_scaling': benchmark_multi_target_scaling,
+              'stats_n_jobs': benchmark_stats_n_jobs,
+              'stats_scaling': benchmark_stats_scaling}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Runs the XAIoGraphs benchmarks')
+    parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS),
+                        help='Benchmarks to be run, out of {} (default: all of them)'.format(', '.join(BENCHMARKS)))
+    benchmarks = parser.parse_args().benchmarks
+    unknown_benchmarks = [benchmark for benchmark in benchmarks if benchmark not in BENCHMARKS]
+    if unknown_benchmarks:
+        parser.error('unknown benchmarks: {}'.format(', '.join(unknown_benchmarks)))
+    for benchmark in benchmarks:
+        xgprint(1, 'INFO: Running benchmark {}'.format(benchmark))
+        BENCHMARKS[benchmark]()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+import numpy as np
+import pandas as pd
+import unittest
+
+from xaiographs.common.utils import get_encoded_features, get_feature_encoding, get_node_codes, get_target_info, \
+    sample_by_target
+
+TARGET_COLS = ['A', 'B', 'C', 'D']
+
+
+class UtilsUnitTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        rng = np.random.default_rng(0)
+        n_rows = 500
+        labels = rng.choice(len(TARGET_COLS), size=n_rows, p=[0.5, 0.3, 0.2, 0.0])
+        self.df = pd.DataFrame(np.eye(len(TARGET_COLS), dtype=int)[labels], columns=TARGET_COLS)
+        self.df.insert(0, 'id', rng.permutation(n_rows) + 1000)
+
+    def test_get_target_info(self):
+        """ Test: top1 targets and their probabilities, including targets which are never the top1 one
+        """
+        target_info = get_target_info(df=self.df, target_cols=TARGET_COLS)
+        expected_top1_targets = self.df[TARGET_COLS].idxmax(axis=1).values
+        np.testing.assert_array_equal(target_info.top1_targets, expected_top1_targets)
+        np.testing.assert_allclose(target_info.target_probs,
+                                   [np.mean(expected_top1_targets == target_col) for target_col in TARGET_COLS])
+
+    def test_sample_by_target(self):
+        """ Test: sampled ids are the same as sampling the rows of each target with pandas
+        """
+        target_info = get_target_info(df=self.df, target_cols=TARGET_COLS)
+        ids = self.df['id'].values
+        sample_ids_mask, sample_ids = sample_by_target(ids=ids, top1_targets=target_info.top1_targets, num_samples=50,
+                                                       target_probs=target_info.target_probs, target_cols=TARGET_COLS)
+        expected_sample_ids = []
+        for target_prob, target_col in zip(target_info.target_probs, TARGET_COLS):
+            expected_sample_ids += pd.Series(ids[target_info.top1_targets == target_col]).sample(
+                n=int(50 * target_prob), random_state=42).astype(str).tolist()
+        self.assertListEqual(sample_ids, expected_sample_ids)
+        np.testing.assert_array_equal(sample_ids_mask, np.isin(ids.astype(str), expected_sample_ids))
+
+    def test_get_feature_encoding(self):
+        """ Test: features are encoded into the codes of their sorted values, missing values getting the last ones, and
+        node codes are those of the sorted node names
+        """
+        df = pd.DataFrame({'id': [3, 1, 2, 0],
+                           'f0': ['b', 'a', None, 'b'],
+                           'f1': [0.5, 0.25, 0.5, 1.0]})
+        encoding = get_feature_encoding(df=df, feature_cols=['f0', 'f1'], float_feature_cols=['f1'])
+        self.assertEqual(encoding.codes.dtype, np.uint8)
+        np.testing.assert_array_equal(encoding.codes, [[1, 1], [0, 0], [2, 1], [1, 2]])
+        self.assertListEqual(encoding.categories[0].tolist(), ['a', 'b', None])
+        self.assertListEqual(encoding.node_names.tolist(), ['f0_None', 'f0_a', 'f0_b', 'f1_0.25', 'f1_0.50',
+                                                            'f1_1.00'])
+        self.assertListEqual(encoding.node_features.tolist(), ['f0'] * 3 + ['f1'] * 3)
+        self.assertListEqual(encoding.node_values.tolist(), ['None', 'a', 'b', '0.25', '0.50', '1.00'])
+
+        # Codes are looked up by ID and node codes are compacted to the nodes found
+        codes, cardinalities = get_encoded_features(encoding=encoding, df=df.iloc[[3, 1]], feature_cols=['f1'])
+        np.testing.assert_array_equal(codes, [[2], [0]])
+        np.testing.assert_array_equal(cardinalities, [3])
+        with self.assertRaises(ValueError):
+            get_encoded_features(encoding=encoding, df=pd.DataFrame({'id': [1, 7]}), feature_cols=['f1'])
+        node_codes, node_names = get_node_codes(df=df.iloc[[3, 1]], feature_cols=['f0', 'f1'],
+                                                float_feature_cols=['f1'], encoding=encoding)
+        self.assertListEqual(node_names[node_codes].tolist(), [['f0_b', 'f1_1.00'], ['f0_a', 'f1_0.25']])
+        self.assertListEqual(node_names.tolist(), ['f0_a', 'f0_b', 'f1_0.25', 'f1_1.00'])
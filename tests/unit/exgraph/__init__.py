@@ -15,3 +15,33 @@ for more details.
 You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
 see https://www.gnu.org/licenses/."""
 
+
+import numpy as np
+import pandas as pd
+
+
+def build_synthetic_dataset(n_rows: int = 200, with_f3: bool = False) -> pd.DataFrame:
+    """
+    This function builds the synthetic dataset shared by the LIDE tests. Target A is driven by the interaction of
+    features f0 and f1 and, when it's included, by feature f3, plus some noise. Target B is its complement
+
+    :param n_rows:  Integer, representing the number of rows
+    :param with_f3: Boolean, stating whether the binary feature f3 is included (default: False)
+    :return:        Pandas DataFrame, containing the id, the features (f0, f1, f2 and optionally f3) and the targets
+                    (A and B)
+    """
+    rng = np.random.default_rng(0)
+    columns = {'id': np.arange(n_rows),
+               'f0': rng.choice(['x', 'y'], size=n_rows),
+               'f1': rng.integers(0, 3, size=n_rows),
+               'f2': rng.choice(['low', 'mid', 'high'], size=n_rows)}
+    if with_f3:
+        columns['f3'] = rng.integers(0, 2, size=n_rows)
+    df = pd.DataFrame(columns)
+    if with_f3:
+        noise = (df['f3'] == 1) & (rng.random(n_rows) < 0.5)
+    else:
+        noise = rng.random(n_rows) < 0.2
+    df['A'] = (((df['f0'] == 'x') & (df['f1'] > 0)) | noise).astype(int)
+    df['B'] = 1 - df['A']
+    return df
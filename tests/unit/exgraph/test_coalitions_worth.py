@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+import numpy as np
+import pandas as pd
+import unittest
+
+from xaiographs.exgraph.importance.coalitions_worth import aggregate_rows, compute_coalitions_worth, \
+    encode_features, iter_coalitions_worth
+
+FEATURE_COLS = ['f0', 'f1', 'f2', 'f3']
+TARGET_COLS = ['A', 'B']
+
+
+class CoalitionsWorthUnitTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        rng = np.random.default_rng(1)
+        n_rows = 300
+        self.df_train = pd.DataFrame({'f0': rng.choice(['x', 'y', 'z'], size=n_rows),
+                                      'f1': rng.integers(0, 4, size=n_rows),
+                                      # High cardinality feature, so that the sorting aggregation is used as well
+                                      'f2': rng.integers(0, 1000, size=n_rows),
+                                      'f3': rng.random(n_rows).round(1),
+                                      'A': rng.random(n_rows)})
+        self.df_train['B'] = 1 - self.df_train['A']
+
+        # Some of the rows to be explained contain values which are not present in the train DataFrame
+        self.df_2_explain = pd.concat([self.df_train.sample(50, random_state=0),
+                                       self.df_train.head(5).assign(f2=-1)], ignore_index=True)
+
+    def __assert_worth(self, coalitions_worth: np.ndarray):
+        for coalition in range(coalitions_worth.shape[1]):
+            coalition_features = [f for i, f in enumerate(FEATURE_COLS) if coalition >> i & 1]
+            if len(coalition_features):
+                expected = self.df_2_explain[coalition_features].merge(
+                    self.df_train.groupby(coalition_features)[TARGET_COLS].mean().reset_index(),
+                    on=coalition_features, how='left')[TARGET_COLS].values
+            else:
+                expected = np.repeat(self.df_train[TARGET_COLS].mean().values.reshape(1, -1), len(self.df_2_explain),
+                                     axis=0)
+            np.testing.assert_allclose(coalitions_worth[:, coalition, :], expected, rtol=1e-12)
+
+    def test_iter_coalitions_worth(self):
+        """ Test: coalitions worth matches the conditional mean computed by grouping and merging DataFrames
+        """
+        codes, cardinalities = encode_features([self.df_train, self.df_2_explain], FEATURE_COLS)
+        train_codes, explain_codes = codes
+        expected_cardinalities = [3, 4, self.df_train['f2'].nunique() + 1, self.df_train['f3'].nunique()]
+        self.assertListEqual(cardinalities.tolist(), expected_cardinalities)
+        coalitions_worth = np.full((len(self.df_2_explain), 2 ** len(FEATURE_COLS), len(TARGET_COLS)), np.inf)
+        for coalition, coalition_worth in iter_coalitions_worth(codes=train_codes,
+                                                                targets=self.df_train[TARGET_COLS].values,
+                                                                cardinalities=cardinalities,
+                                                                query_codes=explain_codes):
+            coalitions_worth[:, coalition, :] = coalition_worth
+        self.__assert_worth(coalitions_worth)
+
+        # Rows with values not present in the train DataFrame have no worth for those coalitions including them
+        self.assertTrue(np.isnan(coalitions_worth[-5:, 4, :]).all())
+        self.assertFalse(np.isnan(coalitions_worth[-5:, 3, :]).any())
+
+    def test_iter_coalitions_worth_aggregated_rows(self):
+        """ Test: coalitions worth derived from the full features table matches the one computed from the train rows
+        """
+        # Train rows are duplicated so that the full features table has fewer rows than the train DataFrame
+        self.df_train = pd.concat([self.df_train, self.df_train.sample(100, random_state=1)], ignore_index=True)
+        (train_codes, explain_codes), cardinalities = encode_features([self.df_train, self.df_2_explain],
+                                                                      FEATURE_COLS)
+        group_codes, group_sums, group_counts = aggregate_rows(train_codes, self.df_train[TARGET_COLS].values,
+                                                               cardinalities)
+        self.assertEqual(len(group_codes), len(self.df_train[FEATURE_COLS].drop_duplicates()))
+        self.assertEqual(group_counts.sum(), len(self.df_train))
+        coalitions_worth = np.full((len(self.df_2_explain), 2 ** len(FEATURE_COLS), len(TARGET_COLS)), np.inf)
+        for coalition, coalition_worth in iter_coalitions_worth(codes=group_codes, targets=group_sums,
+                                                                cardinalities=cardinalities,
+                                                                query_codes=explain_codes, row_counts=group_counts):
+            coalitions_worth[:, coalition, :] = coalition_worth
+        self.__assert_worth(coalitions_worth)
+
+    def test_compute_coalitions_worth_parallel(self):
+        """ Test: coalitions worth doesn't depend on the number of processes used to compute it
+        """
+        (train_codes, explain_codes), cardinalities = encode_features([self.df_train, self.df_2_explain],
+                                                                      FEATURE_COLS)
+        targets = self.df_train[TARGET_COLS].values
+        coalitions_worth = compute_coalitions_worth(codes=train_codes, targets=targets, cardinalities=cardinalities,
+                                                    query_codes=explain_codes)
+        self.__assert_worth(coalitions_worth)
+        for n_jobs in [2, 3]:
+            np.testing.assert_array_equal(compute_coalitions_worth(codes=train_codes, targets=targets,
+                                                                   cardinalities=cardinalities,
+                                                                   query_codes=explain_codes, n_jobs=n_jobs),
+                                          coalitions_worth)
+
+    def test_iter_coalitions_worth_min_support(self):
+        """ Test: query rows whose coalition group is smaller than the minimum support take the parent coalition worth
+        """
+        (train_codes, explain_codes), cardinalities = encode_features([self.df_train, self.df_2_explain],
+                                                                      FEATURE_COLS)
+        targets = self.df_train[TARGET_COLS].values
+        coalitions_worth = compute_coalitions_worth(codes=train_codes, targets=targets, cardinalities=cardinalities,
+                                                    query_codes=explain_codes)
+        backed_off_worth = compute_coalitions_worth(codes=train_codes, targets=targets, cardinalities=cardinalities,
+                                                    query_codes=explain_codes, min_support=3)
+        for coalition in range(1, 2 ** len(FEATURE_COLS)):
+            coalition_features = [f for i, f in enumerate(FEATURE_COLS) if coalition >> i & 1]
+            counts = self.df_2_explain[coalition_features].merge(
+                self.df_train.groupby(coalition_features).size().rename('count').reset_index(),
+                on=coalition_features, how='left')['count'].fillna(0).values
+            parent = coalition & ~(1 << (coalition.bit_length() - 1))
+            np.testing.assert_array_equal(backed_off_worth[counts >= 3, coalition, :],
+                                          coalitions_worth[counts >= 3, coalition, :])
+            np.testing.assert_array_equal(backed_off_worth[counts < 3, coalition, :],
+                                          backed_off_worth[counts < 3, parent, :])
+        self.assertFalse(np.isnan(backed_off_worth).any())
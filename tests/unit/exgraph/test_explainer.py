@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+import contextlib
+import io
+import tempfile
+
+import numpy as np
+import pandas as pd
+import unittest
+
+from xaiographs.common.constants import IMPORTANCE_SUFFIX
+from xaiographs.common.utils import get_importance_columns
+from xaiographs.exgraph.explainer import Explainer
+
+FEATURE_COLS = ['f0', 'f1', 'f2']
+TARGET_COLS = ['A', 'B', 'C']
+
+
+class ExplainerUnitTest(unittest.TestCase):
+
+    def test_get_feature_value_explainability(self):
+        """ Test: gathering the importance of each ID-node pair through the ID index matches looking up each ID row
+        """
+        rng = np.random.default_rng(0)
+        n_rows = 50
+        importance_cols = get_importance_columns(feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        df_explanation = pd.DataFrame(rng.normal(size=(n_rows, len(importance_cols))).astype(np.float32),
+                                      columns=importance_cols)
+        df_explanation.insert(0, 'id', rng.permutation(n_rows) * 3)
+        top1_targets = rng.choice(TARGET_COLS, size=n_rows)
+        nodes_importance_cols = np.array([[str(df_explanation['id'].iloc[i]), '{}_0'.format(feature_col),
+                                           '{}_{}{}'.format(top1_targets[i], feature_col, IMPORTANCE_SUFFIX)]
+                                          for i in rng.permutation(n_rows) for feature_col in FEATURE_COLS])
+
+        feature_value_expl = Explainer._Explainer__get_feature_value_explainability(
+            df_explanation=df_explanation, nodes_importance_cols=nodes_importance_cols)
+        expected = np.array([df_explanation[row[2]].to_numpy()[df_explanation['id'].to_numpy() == int(row[0])].item()
+                             for row in nodes_importance_cols])
+        self.assertEqual(feature_value_expl.dtype, expected.dtype)
+        np.testing.assert_array_equal(feature_value_expl, expected)
+
+        # An ID which is not in the explained DataFrame must not silently read the importance of another row
+        nodes_importance_cols[-1, 0] = str(n_rows * 3)
+        with self.assertRaises(ValueError):
+            Explainer._Explainer__get_feature_value_explainability(df_explanation=df_explanation,
+                                                                   nodes_importance_cols=nodes_importance_cols)
+
+    def test_fit_multi_target(self):
+        """ Test: global target explainability has a row per feature and target and the importance values have a target
+        axis, when there are many targets
+        """
+        rng = np.random.default_rng(0)
+        n_rows, num_features, num_targets = 1000, 4, 10
+        df = pd.DataFrame({'f{}'.format(i): rng.integers(0, 4, size=n_rows) for i in range(num_features)})
+        labels = df.values @ rng.integers(0, 5, size=num_features) + rng.integers(0, num_targets, size=n_rows)
+        target_cols = ['t{}'.format(t) for t in range(num_targets)]
+        df = pd.concat([df, pd.DataFrame(np.eye(num_targets, dtype=int)[labels % num_targets], columns=target_cols)],
+                       axis=1)
+        df.insert(0, 'id', np.arange(n_rows))
+        with tempfile.TemporaryDirectory() as path, contextlib.redirect_stdout(io.StringIO()):
+            explainer = Explainer(importance_engine='LIDE', destination_path=path, number_of_features=num_features,
+                                  verbose=0)
+            explainer.fit(df=df, feature_cols=['f{}'.format(i) for i in range(num_features)], target_cols=target_cols,
+                          num_samples_local_expl=50, num_samples_global_expl=500)
+        self.assertEqual(len(explainer.global_target_explainability), num_features * num_targets)
+        self.assertTupleEqual(explainer.importance_values.shape[1:], (num_features, num_targets))
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+import numpy as np
+import pandas as pd
+import unittest
+
+from xaiographs.common.constants import FEATURE_IMPORTANCE, FEATURE_NAME, NODE_IMPORTANCE, NODE_IMPORTANCE_ABS, \
+    NODE_NAME, RANK, TARGET
+from xaiographs.common.utils import get_importance_columns
+from xaiographs.exgraph.importance.importance_calculator import ImportanceCalculator
+
+FEATURE_COLS = ['f0', 'f1', 'f2']
+TARGET_COLS = ['B', 'A']
+
+
+class ImportanceCalculatorUnitTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        rng = np.random.default_rng(0)
+        n_rows = 100
+        self.importance_cols = get_importance_columns(feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        df = pd.DataFrame({'id': np.arange(n_rows),
+                           'f0': rng.choice(['x', 'y', None], size=n_rows),
+                           'f1': rng.integers(0, 3, size=n_rows),
+                           # Different float values are rounded to the same node name
+                           'f2': rng.choice([0.5, 0.501, 1.25], size=n_rows)})
+        self.df = pd.concat([df, pd.DataFrame(rng.normal(size=(n_rows, len(self.importance_cols))),
+                                              columns=self.importance_cols)], axis=1)
+
+    def test_compute_global_graph_nodes_importance(self):
+        """ Test: global node importance is the mean importance of each feature value for each target
+        """
+        global_graph_nodes = ImportanceCalculator._ImportanceCalculator__compute_global_graph_nodes_importance(
+            df_explained=self.df, feature_cols=FEATURE_COLS, float_features=['f2'], target_cols=TARGET_COLS,
+            importance_cols=self.importance_cols)
+
+        node_importance = []
+        for feature_col in FEATURE_COLS:
+            node_names = self.df[feature_col].map(
+                ('f2_{:.02f}' if feature_col == 'f2' else feature_col + '_{}').format)
+            for target_col, importance_col in zip(TARGET_COLS, get_importance_columns([feature_col], TARGET_COLS)):
+                node_importance.append(pd.DataFrame({TARGET: target_col, NODE_NAME: node_names,
+                                                     NODE_IMPORTANCE: self.df[importance_col]}))
+        expected = pd.concat(node_importance).groupby([TARGET, NODE_NAME])[NODE_IMPORTANCE].mean().reset_index()
+        self.assertIn('f0_None', expected[NODE_NAME].values)
+        self.assertEqual(expected[NODE_NAME].str.startswith('f2').sum(), 2 * len(TARGET_COLS))
+        pd.testing.assert_frame_equal(global_graph_nodes[[TARGET, NODE_NAME, NODE_IMPORTANCE]], expected,
+                                      check_exact=False, rtol=1e-12)
+        np.testing.assert_array_equal(global_graph_nodes[NODE_IMPORTANCE_ABS],
+                                      global_graph_nodes[NODE_IMPORTANCE].abs())
+        np.testing.assert_array_equal(global_graph_nodes[RANK],
+                                      global_graph_nodes.groupby(TARGET)[NODE_IMPORTANCE_ABS].rank(method='dense',
+                                                                                                   ascending=False))
+
+    def test_compute_global_graph_nodes_importance_ties(self):
+        """ Test: nodes whose mean importance only differs by summation order share the same rank
+        """
+        importance_cols = get_importance_columns(feature_cols=['f0', 'f1'], target_cols=['A'])
+        df = pd.DataFrame({'id': np.arange(3), 'f0': ['x'] * 3, 'f1': ['y'] * 3,
+                           importance_cols[0]: [0.1, 0.2, 0.3], importance_cols[1]: [0.3, 0.2, 0.1]})
+        global_graph_nodes = ImportanceCalculator._ImportanceCalculator__compute_global_graph_nodes_importance(
+            df_explained=df, feature_cols=['f0', 'f1'], float_features=[], target_cols=['A'],
+            importance_cols=importance_cols)
+
+        np.testing.assert_allclose(global_graph_nodes[NODE_IMPORTANCE], 0.2, rtol=1e-12)
+        np.testing.assert_array_equal(global_graph_nodes[RANK], [1, 1])
+
+    def test_compute_global_explainability(self):
+        """ Test: global (target) explainability tables hold float importance and a categorical target column
+        """
+        importance_values = self.df[self.importance_cols].values.reshape(len(self.df), len(FEATURE_COLS),
+                                                                         len(TARGET_COLS))
+        global_target_explainability = \
+            ImportanceCalculator._ImportanceCalculator__compute_global_target_explainability(
+                importance_values=importance_values, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        self.assertIsInstance(global_target_explainability[TARGET].dtype, pd.CategoricalDtype)
+        self.assertListEqual(global_target_explainability[TARGET].tolist(), TARGET_COLS)
+        self.assertTrue(all(global_target_explainability[FEATURE_COLS].dtypes == np.float64))
+        np.testing.assert_allclose(global_target_explainability[FEATURE_COLS].values,
+                                   np.abs(importance_values).mean(axis=0).T)
+
+        global_explainability = ImportanceCalculator._ImportanceCalculator__compute_global_explainability(
+            global_target_explainability=global_target_explainability, feature_cols=FEATURE_COLS)
+        self.assertEqual(global_explainability[FEATURE_IMPORTANCE].dtype, np.float64)
+        self.assertTrue(global_explainability[FEATURE_IMPORTANCE].is_monotonic_decreasing)
+        np.testing.assert_allclose(global_explainability.set_index(FEATURE_NAME).loc[FEATURE_COLS,
+                                                                                     FEATURE_IMPORTANCE],
+                                   np.abs(importance_values).mean(axis=(0, 2)))
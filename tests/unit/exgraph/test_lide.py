@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+import os
+import tempfile
+import warnings
+from itertools import combinations
+from math import factorial
+
+import numpy as np
+import pandas as pd
+import unittest
+
+from xaiographs.common.utils import get_feature_encoding, get_features_info, get_target_info
+from xaiographs.exgraph.importance.lide import LIDE
+from tests.unit.exgraph import build_synthetic_dataset
+
+FEATURE_COLS = ['f0', 'f1', 'f2']
+TARGET_COLS = ['A', 'B']
+
+
+class LIDEUnitTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.df = build_synthetic_dataset()
+
+    def __brute_force_importance(self) -> np.ndarray:
+        """
+        Exact Shapley values of the conditional mean of the targets, computed by enumerating all the coalitions
+        """
+        n = len(FEATURE_COLS)
+        df = self.df
+        y = df[TARGET_COLS].values
+        importance = np.zeros((len(df), n, len(TARGET_COLS)))
+        for i in range(len(df)):
+            def worth(coalition):
+                mask = np.ones(len(df), dtype=bool)
+                for f in coalition:
+                    mask &= (df[FEATURE_COLS[f]] == df[FEATURE_COLS[f]].iloc[i]).values
+                return y[mask].mean(axis=0)
+            for f in range(n):
+                rest = [j for j in range(n) if j != f]
+                for k in range(n):
+                    for s in combinations(rest, k):
+                        weight = factorial(k) * factorial(n - k - 1) / factorial(n)
+                        importance[i, f, :] += weight * (worth(s + (f,)) - worth(s))
+            importance[i] += ((y[i] - worth(tuple(range(n)))) / n).reshape(1, -1)
+        return importance
+
+    def test_build_computational_graph(self):
+        """ Test: every feature links each coalition without it to the same coalition plus the feature
+        """
+        edges, weights = LIDE._LIDE__build_computational_graph(num_features=3)
+        np.testing.assert_array_equal(edges, np.array([[[0, 2, 4, 6], [1, 3, 5, 7]],
+                                                       [[0, 1, 4, 5], [2, 3, 6, 7]],
+                                                       [[0, 1, 2, 3], [4, 5, 6, 7]]]))
+        np.testing.assert_allclose(weights, np.array([[1 / 3, 1 / 6, 1 / 6, 1 / 3]] * 3))
+
+        # Shapley weights must add up to one for every feature
+        _, weights = LIDE._LIDE__build_computational_graph(num_features=10)
+        np.testing.assert_allclose(weights.sum(axis=1), np.ones(10))
+
+    def test_build_weight_matrix(self):
+        """ Test: each feature weight matrix column adds the Shapley weights of its input nodes and subtracts them from
+        its output nodes
+        """
+        edges, weights = LIDE._LIDE__build_computational_graph(num_features=4)
+        weight_matrix = LIDE._LIDE__build_weight_matrix(graph_edges=edges, weights=weights)
+        self.assertTupleEqual(weight_matrix.shape, (16, 4))
+        np.testing.assert_allclose(weight_matrix[-1, :], np.full(4, 1 / 4))
+        np.testing.assert_allclose(weight_matrix[0, :], np.full(4, -1 / 4))
+        np.testing.assert_allclose(weight_matrix.sum(axis=0), np.zeros(4), atol=1e-15)
+        np.testing.assert_array_equal(weight_matrix[edges[2, 1, :], 2], weights[2, :])
+
+    def test_computational_graph_cache(self):
+        """ Test: computational graphs are cached in memory and persisted on disk when a cache path is given
+        """
+        edges, weights = LIDE._LIDE__build_computational_graph(num_features=5)
+        with tempfile.TemporaryDirectory() as cache_path:
+            LIDE._TEMPLATES.clear()
+            cached_edges, cached_weights = LIDE._LIDE__get_computational_graph(num_features=5, cache_path=cache_path)
+            self.assertTrue(os.path.exists(os.path.join(cache_path, LIDE._TEMPLATE_FILE.format(
+                LIDE._TEMPLATE_VERSION, 5))))
+            self.assertIs(LIDE._LIDE__get_computational_graph(num_features=5)[0], cached_edges)
+
+            # Once the in-memory cache is cleared, the computational graph is loaded from disk
+            LIDE._TEMPLATES.clear()
+            loaded_edges, loaded_weights = LIDE._LIDE__get_computational_graph(num_features=5, cache_path=cache_path)
+            self.assertIsNot(loaded_edges, cached_edges)
+        np.testing.assert_array_equal(cached_edges, edges)
+        np.testing.assert_array_equal(loaded_edges, edges)
+        np.testing.assert_array_equal(cached_weights, weights)
+        np.testing.assert_array_equal(loaded_weights, weights)
+
+    def test_calculate_importance(self):
+        """ Test: LIDE importance matches the exact Shapley values of the conditional mean
+        """
+        features_info = get_features_info(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        target_info = get_target_info(df=self.df, target_cols=TARGET_COLS)
+        lide = LIDE(explainer_params={}, feature_cols=FEATURE_COLS, target_info=target_info)
+        lide.calculate_importance(df=self.df, features_info=features_info, num_samples=len(self.df), batch_size=64)
+        np.testing.assert_allclose(lide.importance_values, self.__brute_force_importance(), atol=1e-12)
+
+    def test_calculate_importance_lattice_aggregation(self):
+        """ Test: LIDE importance doesn't change when coalitions worth is derived from the full features table
+        """
+        features_info = get_features_info(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        target_info = get_target_info(df=self.df, target_cols=TARGET_COLS)
+        lide = LIDE(explainer_params={'lattice_aggregation': True}, feature_cols=FEATURE_COLS, target_info=target_info)
+        lide.calculate_importance(df=self.df, features_info=features_info, num_samples=len(self.df), batch_size=64)
+        np.testing.assert_allclose(lide.importance_values, self.__brute_force_importance(), atol=1e-12)
+
+    def test_calculate_importance_streaming(self):
+        """ Test: importance computed batch by batch in streaming mode is the same as the in-memory one
+        """
+        features_info = get_features_info(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        target_info = get_target_info(df=self.df, target_cols=TARGET_COLS)
+        importance_values = []
+        for explainer_params in [{}, {'streaming': True}]:
+            lide = LIDE(explainer_params=explainer_params, feature_cols=FEATURE_COLS, target_info=target_info)
+            lide.calculate_importance(df=self.df, features_info=features_info, num_samples=len(self.df), batch_size=64)
+            importance_values.append(lide.importance_values)
+        np.testing.assert_array_equal(importance_values[1], importance_values[0])
+
+    def test_calculate_importance_encoding(self):
+        """ Test: importance and global nodes importance don't change when features codes are taken from the encoding
+        of the whole dataset, even if it includes other features
+        """
+        df = self.df.assign(f3=np.arange(len(self.df)) % 7)
+        features_info = get_features_info(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        target_info = get_target_info(df=self.df, target_cols=TARGET_COLS)
+        encoding = get_feature_encoding(df=df, feature_cols=FEATURE_COLS + ['f3'], float_feature_cols=[])
+        results = []
+        for lide_encoding in [None, encoding]:
+            lide = LIDE(explainer_params={}, feature_cols=FEATURE_COLS, target_info=target_info, encoding=lide_encoding)
+            _, _, global_nodes_importance, _ = lide.calculate_importance(df=self.df, features_info=features_info,
+                                                                         num_samples=50, batch_size=64)
+            results.append((lide.importance_values, global_nodes_importance))
+        np.testing.assert_array_equal(results[1][0], results[0][0])
+        pd.testing.assert_frame_equal(results[1][1], results[0][1])
+
+    def test_calculate_importance_float32(self):
+        """ Test: importance computed in float32 stays within the additivity error bound of the float64 one
+        """
+        features_info = get_features_info(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        target_info = get_target_info(df=self.df, target_cols=TARGET_COLS)
+        lide = LIDE(explainer_params={}, feature_cols=FEATURE_COLS, target_info=target_info, dtype=np.float32)
+        lide.calculate_importance(df=self.df, features_info=features_info, num_samples=len(self.df), batch_size=64)
+        self.assertEqual(lide.importance_values.dtype, np.float32)
+        eps_error = LIDE._get_eps_error(num_features=len(FEATURE_COLS), dtype=np.float32)
+        self.assertLess(eps_error, 1e-4)
+        np.testing.assert_allclose(lide.importance_values, self.__brute_force_importance(), atol=eps_error)
+
+    def test_calculate_importance_explanation_frame(self):
+        """ Test: importance and reliability columns of the explained DataFrame are appended as a single block, taken
+        straight from the importance tensor
+        """
+        features_info = get_features_info(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        target_info = get_target_info(df=self.df, target_cols=TARGET_COLS)
+        lide = LIDE(explainer_params={}, feature_cols=FEATURE_COLS, target_info=target_info)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', pd.errors.PerformanceWarning)
+            df_explanation = lide.calculate_importance(df=self.df, features_info=features_info,
+                                                       num_samples=len(self.df), batch_size=64)[3]
+        np.testing.assert_array_equal(df_explanation[features_info.importance_columns].values,
+                                      lide.importance_values.reshape(len(self.df), -1))
+        self.assertListEqual(list(df_explanation.columns[-len(TARGET_COLS) * (len(FEATURE_COLS) + 1):]),
+                             features_info.importance_columns + features_info.reliability_columns)
+
+    def test_sanity_check(self):
+        """ Test: sanity check results are stored by scope, checking every sample, a sample of them or none of them
+        depending on the policy, without changing the importance
+        """
+        features_info = get_features_info(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        target_info = get_target_info(df=self.df, target_cols=TARGET_COLS)
+        importance_values = []
+        for explainer_params, num_checked in [({}, len(self.df)),
+                                              ({'sanity_check': 'sampled', 'sanity_check_samples': 50}, 50),
+                                              ({'sanity_check': 'off'}, None)]:
+            lide = LIDE(explainer_params=explainer_params, feature_cols=FEATURE_COLS, target_info=target_info)
+            lide.calculate_importance(df=self.df, features_info=features_info, num_samples=len(self.df), batch_size=64)
+            importance_values.append(lide.importance_values)
+            if num_checked is None:
+                self.assertDictEqual(lide.sanity_checks, {})
+                continue
+            self.assertSetEqual(set(lide.sanity_checks), {'aggregated', 'original'})
+            for sanity_check in lide.sanity_checks.values():
+                self.assertEqual(sanity_check.num_checked, num_checked)
+                np.testing.assert_array_equal(sanity_check.num_discrepancies, np.zeros(len(TARGET_COLS)))
+                self.assertEqual(sanity_check.max_abs_error.shape, (len(TARGET_COLS),))
+                self.assertLess(sanity_check.max_abs_error.max(), 1e-12)
+        np.testing.assert_array_equal(importance_values[1], importance_values[0])
+        np.testing.assert_array_equal(importance_values[2], importance_values[0])
+
+        with self.assertRaises(ValueError):
+            LIDE(explainer_params={'sanity_check': 'partial'}, feature_cols=FEATURE_COLS, target_info=target_info)
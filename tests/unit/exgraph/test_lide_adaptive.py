@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+import itertools
+from unittest import mock
+
+import numpy as np
+import unittest
+
+from xaiographs.common.utils import get_features_info, get_target_info
+from xaiographs.exgraph.importance.lide import LIDE
+from xaiographs.exgraph.importance.lide_adaptive import LIDEAdaptive
+from tests.unit.exgraph import build_synthetic_dataset
+
+FEATURE_COLS = ['f0', 'f1', 'f2', 'f3']
+TARGET_COLS = ['A', 'B']
+
+
+class LIDEAdaptiveUnitTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        df = build_synthetic_dataset(n_rows=300, with_f3=True)
+        self.df = df
+        self.features_info = get_features_info(df=df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        self.target_info = get_target_info(df=df, target_cols=TARGET_COLS)
+
+    def __calculate_importance(self, importance_calculator):
+        importance_calculator.calculate_importance(df=self.df, features_info=self.features_info,
+                                                   num_samples=len(self.df), batch_size=64)
+        return importance_calculator
+
+    def test_sample_block(self):
+        """ Test: every feature is found once at each position of a block and each permutation is followed by its
+        reverse
+        """
+        block = LIDEAdaptive._LIDEAdaptive__sample_block(rng=np.random.default_rng(0), num_features=5)
+        self.assertTupleEqual(block.shape, (10, 5))
+        np.testing.assert_array_equal(np.sort(block, axis=1), np.tile(np.arange(5), (10, 1)))
+        np.testing.assert_array_equal(np.sort(block[:5], axis=0), np.tile(np.arange(5).reshape(-1, 1), (1, 5)))
+        np.testing.assert_array_equal(block[5:], block[:5, ::-1])
+
+    def test_calculate_importance(self):
+        """ Test: sampling stops once the standard error of every importance value is below the tolerance, which
+        bounds the distance to the LIDE importance, and the estimation is exactly efficient
+        """
+        lide = self.__calculate_importance(LIDE(explainer_params={}, feature_cols=FEATURE_COLS,
+                                                target_info=self.target_info))
+        lide_adaptive = self.__calculate_importance(LIDEAdaptive(explainer_params={'tolerance': 0.005},
+                                                                 feature_cols=FEATURE_COLS,
+                                                                 target_info=self.target_info))
+        self.assertTrue(np.all(lide_adaptive.importance_std_errors < 0.005))
+        self.assertTrue(np.all(lide_adaptive.num_permutations >= 2 * LIDEAdaptive._MIN_BLOCKS * len(FEATURE_COLS)))
+        self.assertLess(np.max(np.abs(lide_adaptive.importance_values - lide.importance_values)), 5 * 0.005)
+        np.testing.assert_allclose(lide_adaptive.importance_values.sum(axis=1), lide.importance_values.sum(axis=1),
+                                   atol=1e-12)
+
+    def test_calculate_importance_time_budget(self):
+        """ Test: sampling stops once the time budget is exhausted even if the tolerance hasn't been reached, right
+        after the permutation which exhausted it, and the importance of the unfinished first block is still efficient
+        """
+        lide_adaptive = self.__calculate_importance(LIDEAdaptive(explainer_params={'tolerance': 0.0,
+                                                                                   'time_budget': 0.0},
+                                                                 feature_cols=FEATURE_COLS,
+                                                                 target_info=self.target_info))
+        np.testing.assert_array_equal(lide_adaptive.num_permutations, np.ones(len(self.df)))
+        self.assertTrue(np.all(np.isnan(lide_adaptive.importance_std_errors)))
+        self.assertEqual(lide_adaptive.sanity_checks['aggregated'].num_discrepancies.sum(), 0)
+
+    def test_calculate_importance_unfinished_block(self):
+        """ Test: a block left unfinished when the time budget is exhausted is dropped, once the first one is complete
+        """
+        # The clock is read when sampling starts and after each permutation: it runs out at the first permutation of
+        # the second block
+        clock = itertools.chain([0.0] * (1 + 2 * len(FEATURE_COLS)), itertools.repeat(10.0))
+        lide_adaptive = LIDEAdaptive(explainer_params={'tolerance': 0.0, 'time_budget': 1.0}, feature_cols=FEATURE_COLS,
+                                     target_info=self.target_info)
+        with mock.patch('xaiographs.exgraph.importance.lide_adaptive.time.monotonic', side_effect=clock):
+            self.__calculate_importance(lide_adaptive)
+        np.testing.assert_array_equal(lide_adaptive.num_permutations, np.full(len(self.df), 2 * len(FEATURE_COLS)))
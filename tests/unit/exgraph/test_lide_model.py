@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import unittest
+
+from xaiographs.common.utils import get_features_info, get_target_info
+from xaiographs.exgraph.importance.lide import LIDE
+from xaiographs.exgraph.importance.lide_model import LIDEModel
+from tests.unit.exgraph import build_synthetic_dataset
+
+FEATURE_COLS = ['f0', 'f1', 'f2']
+TARGET_COLS = ['A', 'B']
+
+
+class LIDEModelUnitTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.df = build_synthetic_dataset()
+
+    def test_explain(self):
+        """ Test: importance explained from the fitted lookup tables is the same as the LIDE one
+        """
+        features_info = get_features_info(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        target_info = get_target_info(df=self.df, target_cols=TARGET_COLS)
+        lide = LIDE(explainer_params={}, feature_cols=FEATURE_COLS, target_info=target_info)
+        lide.calculate_importance(df=self.df, features_info=features_info, num_samples=len(self.df), batch_size=64)
+        model = LIDEModel.fit(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        np.testing.assert_allclose(model.explain(self.df, batch_size=64), lide.importance_values, atol=1e-12)
+        np.testing.assert_allclose(model.phi0, self.df[TARGET_COLS].values.mean(axis=0))
+
+    def test_explain_unseen_values(self):
+        """ Test: rows whose features values were never seen get NaN importance, the rest are unaffected
+        """
+        model = LIDEModel.fit(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        df_new = self.df[FEATURE_COLS].head(3).copy()
+        df_new.loc[1, 'f2'] = 'unknown'
+        importance = model.explain(df_new)
+        self.assertTrue(np.all(np.isnan(importance[1])))
+        np.testing.assert_allclose(importance[[0, 2]], model.explain(df_new.loc[[0, 2]]), atol=1e-15)
+
+    def test_save_load(self):
+        """ Test: a persisted model is reloaded with the same lookup tables, and other format versions are rejected
+        """
+        model = LIDEModel.fit(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        with tempfile.TemporaryDirectory() as path:
+            model_file = os.path.join(path, 'model.npz')
+            model.save(model_file)
+            loaded_model = LIDEModel.load(model_file)
+            self.assertListEqual(loaded_model.feature_cols, FEATURE_COLS)
+            self.assertListEqual(loaded_model.target_cols, TARGET_COLS)
+            np.testing.assert_array_equal(loaded_model.explain(self.df), model.explain(self.df))
+
+            with np.load(model_file) as persisted_model:
+                arrays = dict(persisted_model)
+            arrays[LIDEModel._VERSION] = np.array(LIDEModel._MODEL_VERSION + 1)
+            np.savez(model_file, **arrays)
+            with self.assertRaises(ValueError):
+                LIDEModel.load(model_file)
+
+    def test_update(self):
+        """ Test: updating a model with new rows, including unseen feature values, is the same as fitting it with all
+        the rows
+        """
+        df_delta = self.df.tail(50).copy()
+        df_delta.loc[df_delta.index[:10], 'f0'] = 'z'
+        df_delta.loc[df_delta.index[5:15], 'f2'] = 'unknown'
+        df = pd.concat([self.df, df_delta], ignore_index=True)
+        model = LIDEModel.fit(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        model.update(df_delta)
+        np.testing.assert_allclose(model.explain(df),
+                                   LIDEModel.fit(df=df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS).explain(df),
+                                   atol=1e-15)
+        np.testing.assert_allclose(model.phi0, df[TARGET_COLS].values.mean(axis=0))
+
+    def test_update_decay(self):
+        """ Test: with a decay factor, the rows the model already holds are down-weighted before adding the new ones
+        """
+        df_old, df_new = self.df.head(120), self.df.tail(80)
+        model = LIDEModel.fit(df=df_old, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        model.update(df_new, decay=0.5)
+        expected_phi0 = ((0.5 * df_old[TARGET_COLS].values.sum(axis=0) + df_new[TARGET_COLS].values.sum(axis=0)) /
+                         (0.5 * len(df_old) + len(df_new)))
+        np.testing.assert_allclose(model.phi0, expected_phi0)
+        with self.assertRaises(ValueError):
+            model.update(df_new, decay=0.0)
+
+    def test_remove(self):
+        """ Test: a model kept on a sliding window by adding and removing batches is the same as the one fitted with
+        the rows in the window, and rows which were never added can't be removed
+        """
+        batches = [self.df.iloc[start:start + 50] for start in range(0, len(self.df), 50)]
+        model = LIDEModel.fit(df=pd.concat(batches[:2]), feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        for i in range(2, len(batches)):
+            model.update(batches[i])
+            model.remove(batches[i - 2])
+        window = pd.concat(batches[-2:])
+        np.testing.assert_allclose(model.explain(window), LIDEModel.fit(df=window, feature_cols=FEATURE_COLS,
+                                                                        target_cols=TARGET_COLS).explain(window),
+                                   atol=1e-15)
+
+        df_unknown = self.df.head(5).copy()
+        df_unknown['f2'] = 'unknown'
+        with self.assertRaises(ValueError):
+            model.remove(df_unknown)
+        with self.assertRaises(ValueError):
+            model.remove(pd.concat([batches[0]] * 3))
+
+    def test_min_support_empty_tables(self):
+        """ Test: coalition tables emptied by the minimum support are backed off to the parent coalition, just like
+        LIDE does
+        """
+        rng = np.random.default_rng(0)
+        n_rows = 300
+        feature_cols = ['h0', 'h1', 'b']
+        df = pd.DataFrame({'id': np.arange(n_rows), 'h0': rng.integers(0, 100, size=n_rows),
+                           'h1': rng.integers(0, 100, size=n_rows), 'b': rng.integers(0, 2, size=n_rows)})
+        df['A'] = rng.integers(0, 2, size=n_rows)
+        df['B'] = 1 - df['A']
+        model = LIDEModel.fit(df=df, feature_cols=feature_cols, target_cols=TARGET_COLS, min_support=5)
+        self.assertEqual(len(model.get_coalition_table(2 ** len(feature_cols) - 1)[0]), 0)
+
+        features_info = get_features_info(df=df, feature_cols=feature_cols, target_cols=TARGET_COLS)
+        target_info = get_target_info(df=df, target_cols=TARGET_COLS)
+        lide = LIDE(explainer_params={'min_support': 5}, feature_cols=feature_cols, target_info=target_info)
+        lide.calculate_importance(df=df, features_info=features_info, num_samples=len(df), batch_size=64)
+        np.testing.assert_allclose(model.explain(df, batch_size=64), lide.importance_values, atol=1e-12)
+
+    def test_rejected_update(self):
+        """ Test: updates and removals which are rejected leave the model unchanged, its decay included
+        """
+        def get_state(lide_model):
+            with tempfile.TemporaryDirectory() as path:
+                model_file = os.path.join(path, 'model.npz')
+                lide_model.save(model_file)
+                with np.load(model_file) as persisted_model:
+                    return {name: persisted_model[name] for name in persisted_model.files}
+
+        df_unknown = self.df.head(5).copy()
+        df_unknown['f2'] = 'unknown'
+        model = LIDEModel.fit(df=self.df.head(100), feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        min_support_model = LIDEModel.fit(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS,
+                                          min_support=12)
+        for lide_model, rejected_update in [(model, lambda: model.remove(df_unknown)),
+                                            (model, lambda: model.remove(pd.concat([self.df.head(100)] * 2))),
+                                            (min_support_model, lambda: min_support_model.update(self.df.tail(10),
+                                                                                                 decay=0.5))]:
+            state = get_state(lide_model)
+            with self.assertRaises(ValueError):
+                rejected_update()
+            for name, values in get_state(lide_model).items():
+                np.testing.assert_array_equal(values, state[name], err_msg=name)
+
+    def test_min_support(self):
+        """ Test: a model fitted with a minimum support keeps fewer entries, backs off to the parent coalition just like
+        LIDE does, is persisted along with its minimum support and can't be updated
+        """
+        features_info = get_features_info(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        target_info = get_target_info(df=self.df, target_cols=TARGET_COLS)
+        lide = LIDE(explainer_params={'min_support': 12}, feature_cols=FEATURE_COLS, target_info=target_info)
+        lide.calculate_importance(df=self.df, features_info=features_info, num_samples=len(self.df), batch_size=64)
+        model = LIDEModel.fit(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS, min_support=12)
+        full_model = LIDEModel.fit(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        self.assertEqual(model.min_support, 12)
+        self.assertLess(len(model.get_coalition_table(2 ** len(FEATURE_COLS) - 1)[0]),
+                        len(full_model.get_coalition_table(2 ** len(FEATURE_COLS) - 1)[0]))
+        np.testing.assert_allclose(model.explain(self.df, batch_size=64), lide.importance_values, atol=1e-12)
+
+        # Unknown values back off as well
+        df_new = self.df[FEATURE_COLS].head(3).copy()
+        df_new.loc[1, 'f2'] = 'unknown'
+        self.assertFalse(np.isnan(model.explain(df_new)).any())
+
+        with tempfile.TemporaryDirectory() as path:
+            model_file = os.path.join(path, 'model.npz')
+            model.save(model_file)
+            loaded_model = LIDEModel.load(model_file)
+            self.assertEqual(loaded_model.min_support, 12)
+            np.testing.assert_array_equal(loaded_model.explain(self.df), model.explain(self.df))
+        with self.assertRaises(ValueError):
+            model.update(self.df.head(10))
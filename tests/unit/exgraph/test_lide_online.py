@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+import numpy as np
+import unittest
+
+from xaiographs.exgraph.importance.lide_model import LIDEModel
+from xaiographs.exgraph.importance.lide_online import LIDEOnlineExplainer
+from tests.unit.exgraph import build_synthetic_dataset
+
+FEATURE_COLS = ['f0', 'f1', 'f2']
+TARGET_COLS = ['A', 'B']
+
+
+class LIDEOnlineExplainerUnitTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        df = build_synthetic_dataset()
+        self.df = df
+        self.model = LIDEModel.fit(df=df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+
+    def test_explain_batch(self):
+        """ Test: importance explained from the hash tables is the same as the one explained by the model
+        """
+        explainer = LIDEOnlineExplainer(self.model)
+        rows = self.df[FEATURE_COLS].values.tolist()
+        np.testing.assert_allclose(explainer.explain_batch(rows), self.model.explain(self.df[FEATURE_COLS]),
+                                   atol=1e-15)
+        np.testing.assert_allclose(explainer.explain_batch(rows, targets=self.df[TARGET_COLS].values.tolist()),
+                                   self.model.explain(self.df), atol=1e-15)
+
+    def test_explain_one(self):
+        """ Test: rows are explained the same way whether they're given as sequences or mappings, and unknown values
+        lead to NaN importance
+        """
+        explainer = LIDEOnlineExplainer(self.model)
+        row = self.df[FEATURE_COLS].iloc[0].to_dict()
+        importance = explainer.explain_one(row)
+        self.assertTupleEqual(importance.shape, (len(FEATURE_COLS), len(TARGET_COLS)))
+        np.testing.assert_array_equal(importance, explainer.explain_one([row[f] for f in FEATURE_COLS]))
+        np.testing.assert_allclose(importance, self.model.explain(self.df[FEATURE_COLS].head(1))[0], atol=1e-15)
+        self.assertTrue(np.all(np.isnan(explainer.explain_one(dict(row, f2='unknown')))))
+
+        # Every row explained one at a time matches the model
+        rows = self.df[FEATURE_COLS].values.tolist()
+        np.testing.assert_allclose(np.stack([explainer.explain_one(row) for row in rows]),
+                                   self.model.explain(self.df[FEATURE_COLS]), atol=1e-15)
+
+    def test_explain_batch_min_support(self):
+        """ Test: rows are backed off to the parent coalitions the same way the model does when it's fitted with a
+        minimum support
+        """
+        model = LIDEModel.fit(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS, min_support=12)
+        explainer = LIDEOnlineExplainer(model)
+        df_new = self.df[FEATURE_COLS].head(20).copy()
+        df_new.loc[df_new.index[:3], 'f2'] = 'unknown'
+        np.testing.assert_allclose(explainer.explain_batch(df_new.values.tolist()), model.explain(df_new),
+                                   atol=1e-15)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+import numpy as np
+import pandas as pd
+import unittest
+
+from xaiographs.common.utils import get_features_info, get_target_info
+from xaiographs.exgraph.importance.lide import LIDE
+from xaiographs.exgraph.importance.lide_sampled import LIDESampled
+from tests.unit.exgraph import build_synthetic_dataset
+
+FEATURE_COLS = ['f0', 'f1', 'f2', 'f3']
+TARGET_COLS = ['A', 'B']
+
+
+class LIDESampledUnitTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        df = build_synthetic_dataset(n_rows=300, with_f3=True)
+        self.df = df
+        self.features_info = get_features_info(df=df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        self.target_info = get_target_info(df=df, target_cols=TARGET_COLS)
+
+    def __calculate_importance(self, importance_calculator):
+        importance_calculator.calculate_importance(df=self.df, features_info=self.features_info,
+                                                   num_samples=len(self.df), batch_size=64)
+        return importance_calculator
+
+    def test_sample_permutations(self):
+        """ Test: every sampled row is a permutation of the features and sampling is reproducible given the seed
+        """
+        permutations = LIDESampled._LIDESampled__sample_permutations(num_features=6, num_permutations=20, seed=1)
+        self.assertTupleEqual(permutations.shape, (20, 6))
+        np.testing.assert_array_equal(np.sort(permutations, axis=1), np.tile(np.arange(6), (20, 1)))
+        np.testing.assert_array_equal(
+            permutations, LIDESampled._LIDESampled__sample_permutations(num_features=6, num_permutations=20, seed=1))
+
+    def test_calculate_importance(self):
+        """ Test: sampled importance converges to the LIDE one within a few standard errors and is exactly efficient
+        """
+        lide = self.__calculate_importance(LIDE(explainer_params={}, feature_cols=FEATURE_COLS,
+                                                target_info=self.target_info))
+        lide_sampled = self.__calculate_importance(LIDESampled(explainer_params={'num_permutations': 200},
+                                                               feature_cols=FEATURE_COLS,
+                                                               target_info=self.target_info))
+        std_errors = lide_sampled.importance_std_errors
+        self.assertTupleEqual(std_errors.shape, lide.importance_values.shape)
+        self.assertTrue(np.all(np.abs(lide_sampled.importance_values - lide.importance_values)
+                               <= 5 * std_errors + 1e-12))
+        np.testing.assert_allclose(lide_sampled.importance_values.sum(axis=1), lide.importance_values.sum(axis=1),
+                                   atol=1e-12)
+
+    def test_calculate_importance_seed(self):
+        """ Test: sampled importance is reproducible given the seed and changes with it
+        """
+        importance_values = []
+        for seed in [7, 7, 8]:
+            lide_sampled = self.__calculate_importance(LIDESampled(explainer_params={'num_permutations': 5,
+                                                                                     'seed': seed},
+                                                                   feature_cols=FEATURE_COLS,
+                                                                   target_info=self.target_info))
+            importance_values.append(lide_sampled.importance_values)
+        np.testing.assert_array_equal(importance_values[0], importance_values[1])
+        self.assertFalse(np.array_equal(importance_values[0], importance_values[2]))
+
+    def test_sanity_check_many_features(self):
+        """ Test: the local accuracy tolerance grows linearly with the number of features, so that a wrong estimate is
+        still caught with 40 features in float32, while the right one passes the check
+        """
+        class WrongLIDESampled(LIDESampled):
+            def _local_importance(self, batch_size, params):
+                importance, phi0, ground_truth = super(WrongLIDESampled, self)._local_importance(batch_size, params)
+                importance[0, 0, 0] += 1e-4
+                return importance, phi0, ground_truth
+
+        rng = np.random.default_rng(0)
+        n_rows, num_features = 200, 40
+        feature_cols = ['g{}'.format(i) for i in range(num_features)]
+        df = pd.DataFrame(rng.integers(0, 2, size=(n_rows, num_features)), columns=feature_cols)
+        df['A'] = (df[feature_cols[:3]].sum(axis=1) > 1).astype(int)
+        df['B'] = 1 - df['A']
+        df.insert(0, 'id', np.arange(n_rows))
+        features_info = get_features_info(df=df, feature_cols=feature_cols, target_cols=TARGET_COLS)
+        target_info = get_target_info(df=df, target_cols=TARGET_COLS)
+        self.assertLess(LIDESampled._get_eps_error(num_features=num_features, dtype=np.float32), 1e-5)
+        for importance_calculator, num_discrepancies in [(LIDESampled, 0), (WrongLIDESampled, 1)]:
+            lide_sampled = importance_calculator(explainer_params={'num_permutations': 10}, feature_cols=feature_cols,
+                                                 target_info=target_info, dtype=np.float32)
+            lide_sampled.calculate_importance(df=df, features_info=features_info, num_samples=n_rows, batch_size=64)
+            self.assertEqual(lide_sampled.sanity_checks['aggregated'].num_discrepancies.sum(), num_discrepancies)
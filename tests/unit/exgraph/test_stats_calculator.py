@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+import itertools
+
+import numpy as np
+import pandas as pd
+import unittest
+
+from xaiographs.common.constants import COUNT, ID, NODE_COUNT, NODE_NAME, TARGET
+from xaiographs.common.utils import get_features_info, get_target_info, sample_by_target
+from xaiographs.exgraph.stats_calculator import NODE_1, NODE_2, StatsCalculator
+
+FEATURE_COLS = ['f0', 'f1', 'f2', 'f3']
+TARGET_COLS = ['A', 'B', 'C']
+
+
+class StatsCalculatorUnitTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        rng = np.random.default_rng(0)
+        n_rows = 300
+        df = pd.DataFrame({'id': np.arange(n_rows),
+                           'f0': rng.choice(['x', 'y', None], size=n_rows),
+                           'f1': rng.integers(0, 4, size=n_rows),
+                           'f2': np.where(rng.random(n_rows) < 0.1, np.nan, rng.normal(size=n_rows).round(3)),
+                           'f3': rng.choice(['p', 'q', 'r'], size=n_rows)})
+        df = pd.concat([df, pd.DataFrame(np.eye(len(TARGET_COLS), dtype=int)[rng.integers(0, 3, size=n_rows)],
+                                         columns=TARGET_COLS)], axis=1)
+        features_info = get_features_info(df=df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        self.target_info = get_target_info(df=df, target_cols=TARGET_COLS)
+        self.sample_ids_mask, self.sample_ids = sample_by_target(ids=df[ID].values,
+                                                                 top1_targets=self.target_info.top1_targets,
+                                                                 num_samples=20,
+                                                                 target_probs=self.target_info.target_probs,
+                                                                 target_cols=TARGET_COLS)
+        self.stats = StatsCalculator(df=df, top1_targets=self.target_info.top1_targets, feature_cols=FEATURE_COLS,
+                                     float_feature_cols=features_info.float_feature_columns, target_cols=TARGET_COLS,
+                                     sample_ids_mask=self.sample_ids_mask, sample_ids=self.sample_ids)
+        # Node names of every row and feature, just like they're displayed
+        self.df_nodes = pd.DataFrame({feature_col: feature_col + '_' + (
+            df[feature_col].apply('{:.02f}'.format) if feature_col == 'f2' else df[feature_col].map(str))
+            for feature_col in FEATURE_COLS})
+        self.df = df
+
+    def test_calculate_edges_stats(self):
+        """ Test: edges are counted for every pair of features and propagated to the edges of the sampled ids
+        """
+        edges_stats = self.stats.calculate_stats()[0]
+        expected = pd.concat([self.df_nodes[list(pair)].value_counts().reset_index(name=COUNT).rename(
+            columns={pair[0]: NODE_1, pair[1]: NODE_2}) for pair in itertools.combinations(FEATURE_COLS, 2)])
+        expected = expected.sort_values(by=[NODE_1, NODE_2]).reset_index(drop=True)
+        pd.testing.assert_frame_equal(edges_stats.global_stats, expected)
+
+        num_pairs = len(FEATURE_COLS) * (len(FEATURE_COLS) - 1) // 2
+        local_stats = edges_stats.local_stats
+        self.assertEqual(len(local_stats), len(self.sample_ids) * num_pairs)
+        self.assertListEqual(list(local_stats.columns), [ID, TARGET, NODE_1, NODE_2, COUNT])
+        self.assertTrue(local_stats[ID].is_monotonic_increasing)
+        np.testing.assert_array_equal(np.unique(local_stats[ID].astype(str)), np.sort(self.sample_ids))
+        merged = local_stats.merge(expected, on=[NODE_1, NODE_2], suffixes=('', '_global'))
+        np.testing.assert_array_equal(merged[COUNT], merged[COUNT + '_global'])
+
+    def test_calculate_edges_stats_unsorted_ids(self):
+        """ Test: local edges are only built for the sampled ids, sorted by ID, whatever the order of the rows
+        """
+        features_info = get_features_info(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        rows = np.random.default_rng(1).permutation(len(self.df))
+        stats = StatsCalculator(df=self.df.iloc[rows].reset_index(drop=True),
+                                top1_targets=self.target_info.top1_targets[rows], feature_cols=FEATURE_COLS,
+                                float_feature_cols=features_info.float_feature_columns, target_cols=TARGET_COLS,
+                                sample_ids_mask=self.sample_ids_mask[rows], sample_ids=self.sample_ids)
+        edges_stats = stats.calculate_stats()[0]
+        expected = self.stats.calculate_stats()[0]
+        pd.testing.assert_frame_equal(edges_stats.global_stats, expected.global_stats)
+        pd.testing.assert_frame_equal(edges_stats.local_stats, expected.local_stats)
+
+    def test_calculate_edges_stats_n_jobs(self):
+        """ Test: edges counted by a pool of processes are the same as the ones counted in the current process
+        """
+        features_info = get_features_info(df=self.df, feature_cols=FEATURE_COLS, target_cols=TARGET_COLS)
+        stats = StatsCalculator(df=self.df, top1_targets=self.target_info.top1_targets, feature_cols=FEATURE_COLS,
+                                float_feature_cols=features_info.float_feature_columns, target_cols=TARGET_COLS,
+                                sample_ids_mask=self.sample_ids_mask, sample_ids=self.sample_ids, n_jobs=2)
+        edges_stats = stats.calculate_stats()[0]
+        expected = self.stats.calculate_stats()[0]
+        pd.testing.assert_frame_equal(edges_stats.global_stats, expected.global_stats)
+        pd.testing.assert_frame_equal(edges_stats.local_stats, expected.local_stats)
+
+    def test_calculate_stats_many_features(self):
+        """ Test: there's a local edge per sampled id and pair of features and a node per row and feature, for a float
+        feature along with many integer ones
+        """
+        rng = np.random.default_rng(0)
+        n_rows, num_features = 500, 16
+        feature_cols = ['g{}'.format(i) for i in range(num_features)]
+        df = pd.DataFrame({feature_col: rng.integers(0, 10, size=n_rows) for feature_col in feature_cols})
+        df['g0'] = rng.normal(size=n_rows)
+        df = pd.concat([df, pd.DataFrame(np.eye(len(TARGET_COLS), dtype=int)[rng.integers(0, 3, size=n_rows)],
+                                         columns=TARGET_COLS)], axis=1)
+        df.insert(0, ID, np.arange(n_rows))
+        features_info = get_features_info(df=df, feature_cols=feature_cols, target_cols=TARGET_COLS)
+        target_info = get_target_info(df=df, target_cols=TARGET_COLS)
+        sample_ids_mask, sample_ids = sample_by_target(ids=df[ID].values, top1_targets=target_info.top1_targets,
+                                                       num_samples=50, target_probs=target_info.target_probs,
+                                                       target_cols=TARGET_COLS)
+        stats = StatsCalculator(df=df, top1_targets=target_info.top1_targets, feature_cols=feature_cols,
+                                float_feature_cols=features_info.float_feature_columns, target_cols=TARGET_COLS,
+                                sample_ids_mask=sample_ids_mask, sample_ids=sample_ids)
+        edges_stats, _, _, nodes_importance_columns = stats.calculate_stats()
+        self.assertEqual(len(edges_stats.local_stats), len(sample_ids) * num_features * (num_features - 1) // 2)
+        self.assertEqual(len(nodes_importance_columns), n_rows * num_features)
+
+    def test_calculate_nodes_stats(self):
+        """ Test: nodes are counted globally and listed, along with their importance column, for each ID
+        """
+        nodes_stats, nodes_importance_columns = self.stats.calculate_stats()[1::2]
+        expected = self.df_nodes.melt()['value'].value_counts().sort_index()
+        np.testing.assert_array_equal(nodes_stats.global_stats[NODE_NAME], expected.index)
+        np.testing.assert_array_equal(nodes_stats.global_stats[NODE_COUNT], expected.values)
+
+        self.assertTupleEqual(nodes_importance_columns.shape, (len(self.df) * len(FEATURE_COLS), 3))
+        np.testing.assert_array_equal(nodes_importance_columns[:, 0],
+                                      np.repeat(self.df[ID].astype(str), len(FEATURE_COLS)))
+        np.testing.assert_array_equal(nodes_importance_columns[:, 1], self.df_nodes.values.ravel())
+        np.testing.assert_array_equal(nodes_importance_columns[:, 2],
+                                      ['{}_{}_imp'.format(target, feature_col)
+                                       for target in self.target_info.top1_targets for feature_col in FEATURE_COLS])
+
+        local_stats = nodes_stats.local_stats
+        self.assertEqual(len(local_stats), len(self.sample_ids) * len(FEATURE_COLS))
+        np.testing.assert_array_equal(local_stats[NODE_NAME],
+                                      self.df_nodes.values[self.sample_ids_mask].ravel())
+        np.testing.assert_array_equal(np.unique(local_stats[ID]), np.sort(self.sample_ids))
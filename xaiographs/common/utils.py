@@ -16,13 +16,36 @@ You should have received a copy of the Affero GNU General Public License along w
 see https://www.gnu.org/licenses/."""
 
 
-from typing import Any, List, NamedTuple, Tuple
+import os
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, List, NamedTuple, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
 from xaiographs.common.constants import ID, IMPORTANCE_SUFFIX, RELIABILITY, TARGET
 
+# Shared arrays are described by the shared memory block name, the array shape, the array dtype and the array memory
+# layout ('C' or 'F')
+SharedArray = Tuple[str, Tuple[int, ...], str, str]
+
+
+class FeatureEncoding(NamedTuple):
+    """FeatureEncoding provides the structure to store the features encoded once for a whole dataset: the ID of each
+    row (used to find the codes of any subset of rows), the code of each row value for each feature (the smallest
+    unsigned integer type fitting every code), the distinct values of each feature (the dictionary decoding its codes)
+    and the graph nodes (feature_value) those values lead to, along with the feature and the formatted value of each
+    node. Node names are sorted, so that the node code of each value is its position among the node names
+    """
+    feature_columns: List[str]
+    ids: pd.Index
+    codes: np.ndarray
+    categories: List[np.ndarray]
+    value_nodes: List[np.ndarray]
+    node_names: np.ndarray
+    node_features: np.ndarray
+    node_values: np.ndarray
+
 
 class FeaturesInfo(NamedTuple):
     """FeaturesInfo provides the structure to store the column names of different features families: features columns
@@ -45,6 +68,39 @@ class TargetInfo(NamedTuple):
     top1_targets: np.ndarray
 
 
+def attach_shared_array(shared_array: SharedArray) -> Tuple[SharedMemory, np.ndarray]:
+    """
+    This function attaches to an array placed in shared memory by another process
+
+    :param shared_array:    Tuple, describing the shared array (shared memory block name, shape, dtype and order)
+    :return:                Tuple containing the shared memory block (it must be closed once the array is no longer
+                            used) and the numpy array backed by it
+    """
+    name, shape, dtype, order = shared_array
+    shared_memory = SharedMemory(name=name)
+    return shared_memory, np.ndarray(shape, dtype=dtype, buffer=shared_memory.buf, order=order)
+
+
+def create_shared_array(shape: Tuple[int, ...], dtype: np.dtype, array: np.ndarray = None,
+                        order: str = 'C') -> Tuple[SharedMemory, SharedArray]:
+    """
+    This function creates an array in a new shared memory block, so that it can be accessed by other processes without
+    pickling it
+
+    :param shape:   Tuple of integers, representing the shape of the array
+    :param dtype:   Numpy dtype of the array
+    :param array:   Numpy array, whose content is copied to the shared array (default: None, it's left uninitialized)
+    :param order:   String, representing the memory layout of the array: 'C' (row-major) or 'F' (column-major)
+    :return:        Tuple containing the shared memory block (it must be closed and unlinked by the caller) and the
+                    description of the shared array
+    """
+    dtype = np.dtype(dtype)
+    shared_memory = SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+    if array is not None:
+        np.ndarray(shape, dtype=dtype, buffer=shared_memory.buf, order=order)[...] = array
+    return shared_memory, (shared_memory.name, shape, dtype.str, order)
+
+
 def filter_by_ids(df: pd.DataFrame, sample_id_mask: np.ndarray, n_repetitions: int = 0):
     """
     This function indexes the given pandas DataFrame by applying the previously generated sample ids mask. This
@@ -63,6 +119,73 @@ def filter_by_ids(df: pd.DataFrame, sample_id_mask: np.ndarray, n_repetitions: i
         return df[np.repeat(sample_id_mask, n_repetitions)]
 
 
+def get_encoded_features(encoding: FeatureEncoding, df: pd.DataFrame,
+                         feature_cols: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    This function retrieves the codes of the given features for the rows of a DataFrame, which must be a subset of the
+    encoded dataset rows. Rows are found by their ID
+
+    :param encoding:        NamedTuple, containing the features encoded for the whole dataset
+    :param df:              Pandas DataFrame, containing the ID column of the rows whose codes are retrieved
+    :param feature_cols:    List of strings containing the column names for the features
+    :return:                Tuple containing a numpy matrix of integers with the code of each row and feature (n_rows x
+                            n_features) and a numpy array with the number of codes (cardinality) of each feature
+    """
+    rows = encoding.ids.get_indexer(df[ID])
+    if (rows < 0).any():
+        raise ValueError('The rows whose codes are retrieved must be a subset of the encoded dataset, {} IDs were not '
+                         'encoded'.format(np.count_nonzero(rows < 0)))
+    features = [encoding.feature_columns.index(feature_col) for feature_col in feature_cols]
+    return (encoding.codes[np.ix_(rows, features)].astype(np.int64),
+            np.array([len(encoding.categories[feature]) for feature in features], dtype=np.int64))
+
+
+def get_feature_encoding(df: pd.DataFrame, feature_cols: List[str], float_feature_cols: List[str]) -> FeatureEncoding:
+    """
+    This function encodes each feature of a dataset into integer codes of its sorted distinct values, so that every
+    stage can work with the codes instead of the raw values. Missing values are told apart by their string
+    representation (None, nan...) and get the last codes. The graph node names (feature_value) are only formatted for
+    the distinct values (float values are rounded to two decimals) and, since different values may lead to the same node
+    name, they're encoded again, sorted just like grouping by them would do
+
+    :param df:                  Pandas DataFrame, containing the ID and the features to be encoded
+    :param feature_cols:        List of strings containing the column names for the features
+    :param float_feature_cols:  List of strings containing the column names for the float type features
+    :return:                    NamedTuple, containing the features encoded for the whole dataset
+    """
+    codes = np.empty((len(df), len(feature_cols)), dtype=np.int64)
+    categories, value_names, value_features = [], [], []
+    for i, feature_col in enumerate(feature_cols):
+        feature_codes, values = pd.factorize(df[feature_col], sort=True)
+        values = np.asarray(values, dtype=object)
+        value_format = '{:.02f}' if feature_col in float_feature_cols else '{}'
+        names = [value_format.format(value) for value in values]
+        missing = feature_codes < 0
+        if missing.any():
+            missing_codes, missing_names = pd.factorize(df[feature_col][missing].astype(str))
+            feature_codes[missing] = missing_codes + len(values)
+            first_missing = np.unique(missing_codes, return_index=True)[1]
+            values = np.concatenate((values, np.asarray(df[feature_col][missing], dtype=object)[first_missing]))
+            names.extend(missing_names)
+        codes[:, i] = feature_codes
+        categories.append(values)
+        value_names.extend('_'.join([feature_col, name]) for name in names)
+        value_features.extend([i] * len(names))
+    node_names, first_values, name_codes = np.unique(np.array(value_names, dtype=str), return_index=True,
+                                                     return_inverse=True)
+    node_features = np.array(feature_cols, dtype=object)[np.array(value_features, dtype=np.int64)[first_values]]
+    node_values = np.array([node_name[len(node_feature) + 1:] for node_name, node_feature in
+                            zip(node_names, node_features)], dtype=object)
+    offsets = np.cumsum([0] + [len(values) for values in categories])
+
+    return FeatureEncoding(feature_columns=list(feature_cols), ids=pd.Index(df[ID]),
+                           codes=codes.astype(np.min_scalar_type(max(codes.max(initial=0), 0))),
+                           categories=categories,
+                           value_nodes=[name_codes.reshape(-1)[start:end] for start, end in zip(offsets[:-1],
+                                                                                                offsets[1:])],
+                           node_names=node_names, node_features=node_features, node_values=node_values)
+
+
 def get_features_info(df: pd.DataFrame, feature_cols: List[str], target_cols: List[str]) -> FeaturesInfo:
     """
     This function gathers all the necessary lists of feature columns names that will be used all through the execution
@@ -100,6 +223,50 @@ def get_importance_columns(feature_cols: List[str], target_cols: List[str]) -> L
             in target_cols]
 
 
+def get_n_jobs(n_jobs: int) -> int:
+    """
+    This function computes the actual number of processes to be used given the requested number of jobs. As usual,
+    negative values are relative to the number of available CPUs (-1 means all of them, -2 all but one and so on)
+
+    :param n_jobs:  Integer, representing the requested number of jobs
+    :return:        Integer, representing the number of processes to be used (at least one)
+    """
+    if n_jobs < 0:
+        n_jobs = (os.cpu_count() or 1) + 1 + n_jobs
+    return max(n_jobs, 1)
+
+
+def get_node_codes(df: pd.DataFrame, feature_cols: List[str], float_feature_cols: List[str],
+                   encoding: Optional[FeatureEncoding] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    This function encodes each feature value into the code of its graph node (feature_value). Values are taken from
+    the features encoded for the whole dataset when given, otherwise the given DataFrame is encoded (see
+    `get_feature_encoding`). Only the nodes found in the DataFrame are kept
+
+    :param df:                  Pandas DataFrame, containing the ID and the features to be encoded
+    :param feature_cols:        List of strings containing the column names for the features
+    :param float_feature_cols:  List of strings containing the column names for the float type features
+    :param encoding:            NamedTuple, containing the features encoded for the whole dataset, which the DataFrame
+                                rows are a subset of (default: None, the DataFrame is encoded)
+    :return:                    Tuple containing a numpy matrix with the node code of each row and feature (n_rows x
+                                n_features) and a numpy array with the sorted node names, so that the node name of any
+                                code is found at its position
+    """
+    if encoding is None:
+        encoding = get_feature_encoding(df=df, feature_cols=feature_cols, float_feature_cols=float_feature_cols)
+    value_codes, _ = get_encoded_features(encoding=encoding, df=df, feature_cols=feature_cols)
+    node_codes = np.empty_like(value_codes)
+    for i, feature_col in enumerate(feature_cols):
+        node_codes[:, i] = encoding.value_nodes[encoding.feature_columns.index(feature_col)][value_codes[:, i]]
+
+    # Node codes are compacted to the nodes found, keeping their order
+    nodes = np.flatnonzero(np.bincount(node_codes.ravel(), minlength=len(encoding.node_names)))
+    code_map = np.zeros(len(encoding.node_names), dtype=np.int64)
+    code_map[nodes] = np.arange(len(nodes))
+
+    return code_map[node_codes], encoding.node_names[nodes]
+
+
 def get_reliability_columns(target_cols: List[str]) -> List[str]:
     """
     This function builds the names of those columns containing the reliability values for all possible targets
@@ -110,6 +277,32 @@ def get_reliability_columns(target_cols: List[str]) -> List[str]:
     return ['{}_{}'.format(target_col, RELIABILITY) for target_col in target_cols]
 
 
+def get_sample_indices_by_target(top1_targets: np.ndarray, num_samples: int, target_probs: np.ndarray,
+                                 target_cols: List[str]) -> np.ndarray:
+    """
+    This function samples row positions so that the given target ratios are kept. Rows are grouped by their top1
+    target at once (stable sort), so that each target only draws the positions of its own rows. Each target draws the
+    same sample as `pandas.Series.sample(n, random_state=42)` on its rows would
+
+    :param top1_targets:    Numpy array containing the top1 target for each row
+    :param num_samples:     Integer representing the number of samples which will be calculated
+    :param target_probs:    Numpy array containing the probability for each target. It's used to calculate the ratio
+                            for each target
+    :param target_cols:     List of strings containing the possible targets
+    :return:                Numpy array containing the sampled row positions, grouped by target in the order given by
+                            `target_cols`
+    """
+    target_codes = pd.Categorical(top1_targets, categories=target_cols).codes.astype(np.int64)
+    rows_by_target = np.argsort(target_codes, kind='stable')
+    target_counts = np.bincount(target_codes + 1, minlength=len(target_cols) + 1)
+    target_ends = np.cumsum(target_counts)[1:]
+    samples_by_target = (num_samples * np.asarray(target_probs)).astype(int)
+    return np.concatenate([rows_by_target[end - count:end][np.random.RandomState(42).choice(count, size=n,
+                                                                                            replace=False)]
+                           for end, count, n in zip(target_ends, target_counts[1:], samples_by_target)]
+                          + [np.empty(0, dtype=np.int64)])
+
+
 def get_target_info(df: pd.DataFrame, target_cols: List[str]) -> TargetInfo:
     """
     This function calculates some information of interest referring to some DataFrame target. This information consists
@@ -124,10 +317,8 @@ def get_target_info(df: pd.DataFrame, target_cols: List[str]) -> TargetInfo:
                             showing the top1 targets indexes
     """
     top1_argmax = np.argmax(df[target_cols].values, axis=1)
-    top1_targets = np.array([target_cols[am] for am in top1_argmax])
-    target_unique_values, target_unique_counts = np.unique(top1_targets, return_counts=True)
-    target_probs_dict = dict(zip(target_unique_values, target_unique_counts / len(df)))
-    target_probs = np.array([target_probs_dict[t] for t in target_cols])
+    top1_targets = np.array(target_cols)[top1_argmax]
+    target_probs = np.bincount(top1_argmax, minlength=len(target_cols)) / len(df)
 
     return TargetInfo(target_columns=target_cols, target_probs=target_probs, top1_argmax=top1_argmax,
                       top1_targets=top1_targets)
@@ -148,7 +339,8 @@ def sample_by_target(ids: np.ndarray, top1_targets: np.ndarray, num_samples: int
     :param target_probs:    Numpy array containing the probability for each target. It's used to calculate the ratio
                             for each target
     :param target_cols:     List of strings containing the possible targets
-    :param target_col:      String representing the target col name (default: 'target')
+    :param target_col:      String representing the target col name, no longer used since rows are grouped by target
+                            without building a DataFrame (default: 'target')
     :return:                Tuple containing both, a numpy array containing boolean values which will be used to
                             filter any given DataFrame and a list containing the ids used as sample
     """
@@ -156,23 +348,17 @@ def sample_by_target(ids: np.ndarray, top1_targets: np.ndarray, num_samples: int
     # samples will be taken
     assert len(ids) > num_samples, "requested local sample size can't be greater nor equal than the global size"
 
-    # A Pandas DataFrame containing a first column representing the id and a second column with the top1 target for that
-    # row
-    df_ids_target = pd.DataFrame(np.concatenate((ids.reshape(-1, 1), top1_targets.reshape(-1, 1)), axis=1),
-                                 columns=[ID, target_col])
-
-    # For each possible target, rows are filtered by that target and the number of ids to retrieve is computed by using
-    # the target probability and the number of requested samples
-    sample_ids = []
-    for target_prob, target_col_value in zip(target_probs, target_cols):
-        n_samples_by_target = int(num_samples * target_prob)
-        sample_ids += df_ids_target[df_ids_target[target_col] == target_col_value][ID].sample(
-            n=n_samples_by_target, random_state=42).values.tolist()
+    # For each possible target, the number of ids to retrieve is computed by using the target probability and the number
+    # of requested samples
+    sample_indices = get_sample_indices_by_target(top1_targets=top1_targets, num_samples=num_samples,
+                                                  target_probs=target_probs, target_cols=target_cols)
 
     # IDs which will be used as sample are turned into a boolean mask
-    sample_ids_mask = np.isin(df_ids_target[ID].values, sample_ids)
+    sample_ids_mask = np.zeros(len(ids), dtype=bool)
+    sample_ids_mask[sample_indices] = True
 
-    return sample_ids_mask, sample_ids
+    # Sampled ids are returned as strings, just like the rest of the flow expects them
+    return sample_ids_mask, ids[sample_indices].astype(str).tolist()
 
 
 def xgprint(verbose: int = 0, *args, **kwargs) -> None:
@@ -16,14 +16,14 @@ You should have received a copy of the Affero GNU General Public License along w
 see https://www.gnu.org/licenses/."""
 
 
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 import numpy as np
 import pandas as pd
 
 from xaiographs.common.constants import FEATURE_VALUE, ID, IMPORTANCE, RANK, TARGET, RELIABILITY
-from xaiographs.common.utils import FeaturesInfo, TargetInfo, get_features_info, get_target_info, sample_by_target, \
-    xgprint
+from xaiographs.common.utils import FeaturesInfo, TargetInfo, get_feature_encoding, get_features_info, \
+    get_target_info, sample_by_target, xgprint
 from xaiographs.exgraph.exporter import Exporter
 from xaiographs.exgraph.feature_selector import FeatureSelector
 from xaiographs.exgraph.importance.importance_calculator import ImportanceCalculator
@@ -48,7 +48,11 @@ class Explainer(object):
         The name of the method use to compute feature importance.
 
         .. important::
-           LIDE is the available option for version 0.0.2
+           LIDE, LIDE_ADAPTIVE and LIDE_SAMPLED are the available options. LIDE_SAMPLED estimates the same \
+           importance as LIDE from a sample of feature permutations, so that its cost grows linearly with the number \
+           of features instead of exponentially. It is meant for a high number of features. LIDE_ADAPTIVE keeps \
+           sampling permutations until the standard error of the importance falls below a tolerance, instead of \
+           sampling a fixed number of them.
 
     destination_path : str, default='./xaioweb_files'
         The path where output XAIoWeb files will be stored.
@@ -62,10 +66,61 @@ class Explainer(object):
         .. hint::
            Any value greater than 0 means verbosity is on.
 
+    importance_engine_params : dict, default=None
+        Additional parameters for the chosen importance engine. LIDE supports the following ones:
+
+        - ``template_cache_path``: directory where the LIDE computational graphs (which only depend on the number of \
+          features) are persisted, so that they can be reused by other processes instead of being rebuilt. \
+          Computational graphs are always cached in memory for the current process.
+        - ``lattice_aggregation``: if ``True``, the training rows are first aggregated into a single table of target \
+          sums and counts per distinct combination of feature values, and every coalition worth is derived from that \
+          table, so that the training rows are only scanned once. It pays off when many rows share the same feature \
+          values. Default is ``False``.
+        - ``min_support``: minimum number of training rows sharing the coalition feature values for the coalition \
+          worth to be used. Worths estimated from fewer rows back off to the worth of the coalition without its last \
+          feature, which makes importance more stable on high cardinality features. Default is ``1`` (no back-off).
+        - ``sanity_check``: local accuracy sanity check policy, that is, how many explained samples are checked for \
+          their importance plus phi0 to add up to their target values: ``'full'`` checks all of them, ``'sampled'`` \
+          checks a random sample of them and ``'off'`` skips the check. Results (number of checked samples and, for \
+          each target, the number of discrepancies and the maximum absolute error) are kept by the importance \
+          calculator instead of being printed. Default is ``'full'``.
+        - ``sanity_check_samples``: number of samples checked when ``sanity_check`` is ``'sampled'``. Default is \
+          ``1000``.
+        - ``streaming``: if ``True``, coalition worths are computed batch by batch (see ``batch_size_expl`` in \
+          :meth:`fit`) along with the importance, so that peak memory is bounded by the batch size instead of the \
+          number of samples to be explained times the number of coalitions. Results are the same, but the training \
+          rows are aggregated once per batch. Default is ``False``.
+
+        LIDE_SAMPLED supports ``lattice_aggregation``, ``min_support``, ``sanity_check`` and \
+        ``sanity_check_samples`` as well as the following ones:
+
+        - ``num_permutations``: number of sampled feature permutations, that is, the sampling budget. The standard \
+          error of the estimated importance decreases with its square root. Default is ``100``.
+        - ``seed``: seed used to sample the permutations, so that the results are reproducible. Default is ``42``.
+
+        LIDE_ADAPTIVE supports ``lattice_aggregation``, ``min_support``, ``sanity_check``, ``sanity_check_samples`` \
+        and ``seed`` as well as the following ones:
+
+        - ``tolerance``: standard error below which the importance of a sample is considered to have converged. \
+          Permutations are sampled in blocks where each feature is found once at each position, along with their \
+          reverse permutations, and samples are no longer refined once all of their importance values have converged. \
+          Default is ``0.01``.
+        - ``time_budget``: maximum number of seconds spent sampling permutations, whether or not every sample has \
+          converged. It's checked after each permutation, so it's exceeded by a single permutation at most. Default \
+          is ``60``.
+
+    n_jobs : int, default=1
+        Number of processes used to compute the feature importance and to count the graph edges (feature-value \
+        pairs co-occurrences). Negative values are relative to the number of CPUs, so ``-1`` means all of them.
+
+        .. hint::
+           Results don't depend on the number of processes, so it can be safely increased on multicore machines.
+
     """
 
     def __init__(self, importance_engine: str, destination_path: str = './xaioweb_files',
-                 number_of_features: int = 8, verbose: int = 0):
+                 number_of_features: int = 8, verbose: int = 0, importance_engine_params: Dict = None,
+                 n_jobs: int = 1):
         self.__global_explainability = None
         self.__global_frequency_feature_value = None
         self.__global_target_feature_value_explainability = None
@@ -78,6 +133,8 @@ class Explainer(object):
         self.__top_features_by_target = None
         self.__destination_path = destination_path
         self.__engine = importance_engine
+        self.__engine_params = importance_engine_params if importance_engine_params is not None else {}
+        self.__n_jobs = n_jobs
         self.__number_of_features = number_of_features
         self.__verbose = verbose
 
@@ -426,8 +483,31 @@ class Explainer(object):
 
         return features_info, target_info
 
+    @staticmethod
+    def __get_feature_value_explainability(df_explanation: pd.DataFrame,
+                                           nodes_importance_cols: np.ndarray) -> np.ndarray:
+        """
+        This function retrieves the importance of each ID-node pair from the explained DataFrame. Row positions are
+        looked up through an ID index and column positions through the distinct importance column names, so that all
+        the values are gathered at once
+
+        :param df_explanation:          Pandas DataFrame, which has been explained
+        :param nodes_importance_cols:   Numpy matrix, containing for each ID-node pair, the ID, the node name and the
+                                        name of the column containing its importance value
+        :return:                        Numpy array, containing the importance value of each ID-node pair
+        :raises:                        ValueError if any of the IDs is not found in the explained DataFrame
+        """
+        row_positions = pd.Index(df_explanation[ID].to_numpy()).get_indexer(
+            nodes_importance_cols[:, 0].astype(np.int64))
+        if (row_positions < 0).any():
+            raise ValueError('The ID-node pairs must belong to the explained dataset, {} IDs were not found in the '
+                             'explained DataFrame'.format(np.count_nonzero(row_positions < 0)))
+        importance_cols, col_positions = np.unique(nodes_importance_cols[:, 2], return_inverse=True)
+        return df_explanation[importance_cols].to_numpy(dtype=np.float64)[row_positions, col_positions]
+
     def fit(self, df: pd.DataFrame, feature_cols: List[str], target_cols: List[str], num_samples_local_expl: int = 100,
-            num_samples_global_expl: int = 50000, batch_size_expl: int = 5000, train_stratify: bool = True):
+            num_samples_global_expl: int = 50000, batch_size_expl: int = 5000, train_stratify: bool = True,
+            dtype: np.dtype = np.float64):
         """It coordinates all the steps of the explanation process which consists of the following parts:
 
         - Feature selection, takes care of determining which are top K most relevant features. K is defined by the \
@@ -467,6 +547,17 @@ class Explainer(object):
             When ``train_size`` is different from 0.0, this parameter can be set to True so that the train/test split \
             will keep the target ratio in both of the resulting dataset partitions.
 
+        dtype: numpy.dtype, default=numpy.float64
+            Floating point type used to store the coalition worths and to compute the importance and its global \
+            aggregation. ``numpy.float32`` halves the memory and bandwidth. Target aggregation always runs in double \
+            precision.
+
+            .. note::
+               The local accuracy sanity check tolerance is scaled to the chosen type. For ``n`` features and unit \
+               roundoff ``u`` (``2**-24`` for ``numpy.float32``), the additivity error of each sample and target \
+               versus ``numpy.float64`` is bounded by ``(2n * (2**n + 1) + (n + 1) * (2n + 1) + 1) * u``, which is \
+               about ``2.5e-4`` for 8 features.
+
         """
         if num_samples_global_expl < num_samples_local_expl:
             print('ERROR: num_samples_global_expl ({}) < num_samples_local_exp ({}): Number of samples for global '
@@ -480,9 +571,14 @@ class Explainer(object):
         features_info, target_info = Explainer.__get_common_info(df=df, feature_cols=feature_cols,
                                                                  target_cols=target_cols)
 
+        # Features are encoded once into integer codes, which are then looked up by ID in every stage
+        encoding = get_feature_encoding(df=df, feature_cols=features_info.feature_columns,
+                                        float_feature_cols=features_info.float_feature_columns)
+
         # Feature selector is instantiated
         selector = FeatureSelector(df=df, feature_cols=features_info.feature_columns, target_info=target_info,
-                                   number_of_features=self.__number_of_features, verbose=self.__verbose)
+                                   number_of_features=self.__number_of_features, verbose=self.__verbose,
+                                   encoding=encoding)
 
         # Then it's used to select the top K features
         topk_features = selector.select_topk()
@@ -499,11 +595,14 @@ class Explainer(object):
         #   An ImportanceCalculator object is used to compute importance values
         imp_calc_factory = ImportanceCalculatorFactory()
         importance_calculator = imp_calc_factory.build_importance_calculator(name=self.__engine,
-                                                                             explainer_params={},
+                                                                             explainer_params=self.__engine_params,
                                                                              feature_cols=features_info.feature_columns,
                                                                              target_info=target_info,
                                                                              train_stratify=train_stratify,
-                                                                             verbose=self.__verbose)
+                                                                             verbose=self.__verbose,
+                                                                             n_jobs=self.__n_jobs,
+                                                                             dtype=dtype,
+                                                                             encoding=encoding)
         top1_importance_features, global_explainability, global_nodes_importance, df_explanation_global = (
             importance_calculator.calculate_importance(df=df, features_info=features_info,
                                                        num_samples=num_samples_global_expl, batch_size=batch_size_expl))
@@ -541,13 +640,13 @@ class Explainer(object):
                                 feature_cols=features_info.feature_columns,
                                 float_feature_cols=features_info.float_feature_columns,
                                 target_cols=target_info.target_columns,
-                                sample_ids_mask=sample_ids_mask, sample_ids=sample_ids, verbose=self.__verbose)
+                                sample_ids_mask=sample_ids_mask, sample_ids=sample_ids, verbose=self.__verbose,
+                                n_jobs=self.__n_jobs, encoding=encoding)
         edges_stats, nodes_stats, target_distribution, importance_col_stats = stats.calculate_stats()
 
         # local_feature_value_explainability property is computed
-        feature_value_expl = np.array([df_explanation_global[id_imp_row[2]].to_numpy()[
-                                           df_explanation_global[ID].to_numpy() == int(id_imp_row[0])].item() for
-                                       id_imp_row in importance_col_stats])
+        feature_value_expl = Explainer.__get_feature_value_explainability(df_explanation=df_explanation_global,
+                                                                          nodes_importance_cols=importance_col_stats)
         self.__local_feature_value_explainability = np.concatenate((np.delete(importance_col_stats, 2, axis=1),
                                                                     feature_value_expl.reshape(-1, 1)), axis=1)
 
@@ -560,7 +659,8 @@ class Explainer(object):
         exporter.export(features_info=features_info, target_info=target_info, sample_ids_mask=sample_ids_mask,
                         global_target_explainability=top1_importance_features,
                         global_explainability=global_explainability, global_nodes_importance=global_nodes_importance,
-                        edges_info=edges_stats, nodes_info=nodes_stats, target_distribution=target_distribution)
+                        edges_info=edges_stats, nodes_info=nodes_stats, target_distribution=target_distribution,
+                        encoding=encoding)
 
         # Properties from Exporter module are retrieved
         self.__global_explainability = exporter.global_explainability
@@ -17,7 +17,7 @@ see https://www.gnu.org/licenses/."""
 
 
 import os
-from typing import List
+from typing import List, Optional
 
 import numpy as np
 import pandas as pd
@@ -25,7 +25,7 @@ import pandas as pd
 from xaiographs.common.constants import COUNT, FEATURE, FEATURE_IMPORTANCE, FEATURE_NAME, ID, IMPORTANCE, \
     IMPORTANCE_SUFFIX, FEATURE_VALUE, NODE_COUNT, NODE_IMPORTANCE, NODE_IMPORTANCE_ABS, NODE_NAME, NODE_NAME_RATIO, \
     RELIABILITY, RANK, TARGET
-from xaiographs.common.utils import FeaturesInfo, TargetInfo, xgprint
+from xaiographs.common.utils import FeatureEncoding, FeaturesInfo, TargetInfo, xgprint
 from xaiographs.exgraph.stats_calculator import StatsResults
 
 # CONSTANTS
@@ -101,13 +101,12 @@ class Exporter(object):
         :return: pd.DataFrame, containing each feature ranked by its global importance
         """
         if self.__global_explainability is not None:
-            self.__global_explainability[RANK] = pd.to_numeric(
-                self.__global_explainability[FEATURE_IMPORTANCE].rank(ascending=False).astype('int'),
-                downcast="unsigned")
-            self.__global_explainability[FEATURE_IMPORTANCE] = pd.to_numeric(
-                self.__global_explainability[FEATURE_IMPORTANCE], downcast="float")
-            return self.__global_explainability[[FEATURE_NAME, FEATURE_IMPORTANCE, RANK]].rename(
-                columns={FEATURE_NAME: FEATURE, FEATURE_IMPORTANCE: IMPORTANCE})
+            df_global_explainability = self.__global_explainability[[FEATURE_NAME]].rename(
+                columns={FEATURE_NAME: FEATURE})
+            df_global_explainability[IMPORTANCE] = self.__global_explainability[FEATURE_IMPORTANCE].astype(np.float32)
+            df_global_explainability[RANK] = self.__to_unsigned(
+                self.__global_explainability[FEATURE_IMPORTANCE].rank(ascending=False))
+            return df_global_explainability
         else:
             return None
 
@@ -119,10 +118,11 @@ class Exporter(object):
         :return: pd.DataFrame, containing the number of times each feature-value occurs
         """
         if self.__global_nodes_info is not None:
-            self.__global_nodes_info[NODE_COUNT] = pd.to_numeric(self.__global_nodes_info[NODE_COUNT],
-                                                                 downcast="unsigned")
-            return self.__global_nodes_info[[NODE_NAME, NODE_COUNT]].drop_duplicates(subset=[NODE_NAME]).rename(
-                columns={NODE_NAME: FEATURE_VALUE, NODE_COUNT: FREQUENCY})
+            df_global_frequency_feature_value = self.__global_nodes_info[[NODE_NAME, NODE_COUNT]].drop_duplicates(
+                subset=[NODE_NAME]).rename(columns={NODE_NAME: FEATURE_VALUE, NODE_COUNT: FREQUENCY})
+            df_global_frequency_feature_value[FREQUENCY] = self.__to_unsigned(
+                df_global_frequency_feature_value[FREQUENCY])
+            return df_global_frequency_feature_value
         else:
             return None
 
@@ -135,20 +135,16 @@ class Exporter(object):
         :return: pd.DataFrame, containing each feature ranked by its global importance by target value
         """
         if self.__global_target_explainability is not None:
-            df_rows = list()
-            for _, v in self.__global_target_explainability.iterrows():
-                target_val = ''
-                for i, val in enumerate(v):
-                    if isinstance(val, str):
-                        target_val = val
-                        continue
-                    df_rows.append([target_val, self.__global_target_explainability.columns[i], val])
-            df_global_target_explainability = pd.DataFrame(df_rows, columns=[TARGET, FEATURE, IMPORTANCE])
-            df_global_target_explainability[RANK] = pd.to_numeric(
-                df_global_target_explainability.groupby(TARGET)[IMPORTANCE].rank(ascending=False).astype('int'),
-                downcast="unsigned")
-            df_global_target_explainability[IMPORTANCE] = pd.to_numeric(df_global_target_explainability[IMPORTANCE],
-                                                                        downcast="float")
+            feature_cols = list(self.__global_target_explainability.columns.drop(TARGET))
+            importance = self.__global_target_explainability[feature_cols].values
+            df_global_target_explainability = pd.DataFrame({
+                TARGET: np.repeat(self.__global_target_explainability[TARGET].values, len(feature_cols)),
+                FEATURE: np.tile(feature_cols, len(importance)),
+                IMPORTANCE: importance.ravel()})
+            df_global_target_explainability[RANK] = self.__to_unsigned(
+                df_global_target_explainability.groupby(TARGET, observed=True)[IMPORTANCE].rank(ascending=False))
+            df_global_target_explainability[IMPORTANCE] = df_global_target_explainability[IMPORTANCE].astype(
+                np.float32)
             return df_global_target_explainability.sort_values(by=[TARGET, RANK])
         else:
             return None
@@ -163,14 +159,28 @@ class Exporter(object):
                  occurrences of that feature-value pair linked to the target value being processed
         """
         if self.__global_nodes_info is not None:
-            self.__global_nodes_info[NODE_IMPORTANCE] = pd.to_numeric(self.__global_nodes_info[NODE_IMPORTANCE],
-                                                                      downcast="float")
-            self.__global_nodes_info[RANK] = pd.to_numeric(self.__global_nodes_info[RANK], downcast="unsigned")
-            return self.__global_nodes_info[[TARGET, NODE_NAME, NODE_IMPORTANCE, RANK]].rename(
+            df_global_target_feature_value_explainability = self.__global_nodes_info[
+                [TARGET, NODE_NAME, NODE_IMPORTANCE, RANK]].rename(
                 columns={NODE_NAME: FEATURE_VALUE, NODE_IMPORTANCE: IMPORTANCE})
+            df_global_target_feature_value_explainability[IMPORTANCE] = df_global_target_feature_value_explainability[
+                IMPORTANCE].astype(np.float32)
+            df_global_target_feature_value_explainability[RANK] = self.__to_unsigned(
+                df_global_target_feature_value_explainability[RANK])
+            return df_global_target_feature_value_explainability
         else:
             return None
 
+    @staticmethod
+    def __to_unsigned(values: pd.Series) -> pd.Series:
+        """
+        This function casts non negative integer values (ranks, counts...) to the smallest unsigned integer type able to
+        hold them
+
+        :param values:  Pandas Series, containing non negative integer values (floats are truncated)
+        :return:        Pandas Series, containing the same values with the smallest unsigned integer type
+        """
+        return values.astype(np.min_scalar_type(int(values.max())))
+
     def __export_edges(self, df_stats: pd.DataFrame, filename: str):
         """
         This function calculates each edge weight in pixels and persists the information. This function handles local
@@ -213,7 +223,7 @@ class Exporter(object):
         :param filename:        String, representing the name of the file used to persist the information
         :return:                Pandas Dataframe, containing the features importance values
         """
-        df_importance[FEATURE_WEIGHT] = pd.cut(df_importance[FEATURE_IMPORTANCE].astype('float'),
+        df_importance[FEATURE_WEIGHT] = pd.cut(df_importance[FEATURE_IMPORTANCE],
                                                bins=N_BINS_FEATURE_WEIGHT,
                                                labels=list(range(
                                                    MIN_FEATURE_WEIGHT,
@@ -224,7 +234,8 @@ class Exporter(object):
         return df_importance
 
     def __export_global_nodes_heatmap_info(self, df_stats: pd.DataFrame, df_importance: pd.DataFrame,
-                                           feature_columns: List[str], filename: str = EXPLAINER_GLOBAL_HEATMAP_FILE):
+                                           feature_columns: List[str], encoding: Optional[FeatureEncoding] = None,
+                                           filename: str = EXPLAINER_GLOBAL_HEATMAP_FILE):
         """
         This function combines the global node information resulting from statistic calculation and from importance
         calculation. From here it picks up the necessary columns and splits feature from value for each node
@@ -232,6 +243,9 @@ class Exporter(object):
         :param df_stats:         Pandas DataFrame containing previously calculated nodes global statistics
         :param df_importance:    Pandas DataFrame containing previously calculated nodes global importance
         :param feature_columns:  List of str containing the feature column name of the dataset being processed
+        :param encoding:         NamedTuple containing the features encoded for the whole dataset, which already knows
+                                 the feature and the value of each node (default: None, they're parsed from the node
+                                 names)
         :param filename:         String representing the name of the file used to persist the information
         """
         # Target values are count and divided by the number of features. This result will be used as the divisor to
@@ -241,11 +255,17 @@ class Exporter(object):
                                                                                        NODE_IMPORTANCE]]
         global_node_info.rename(columns={NODE_NAME_RATIO: FREQUENCY, NODE_IMPORTANCE: IMPORTANCE}, inplace=True)
 
-        # Feature name and feature value are extracted from each node name
-        for f in feature_columns:
-            global_node_info.loc[global_node_info[NODE_NAME].str.startswith(f), FEATURE_NAME] = f
-        global_node_info[FEATURE_VALUE] = global_node_info.apply(lambda x: x[NODE_NAME][len(x[FEATURE_NAME]) + 1:],
-                                                                 axis=1)
+        # Feature name and feature value are looked up by node code or, lacking the encoding, extracted from each node
+        # name
+        if encoding is not None:
+            node_codes = np.searchsorted(encoding.node_names, global_node_info[NODE_NAME].to_numpy(dtype=str))
+            global_node_info[FEATURE_NAME] = encoding.node_features[node_codes]
+            global_node_info[FEATURE_VALUE] = encoding.node_values[node_codes]
+        else:
+            for f in feature_columns:
+                global_node_info.loc[global_node_info[NODE_NAME].str.startswith(f), FEATURE_NAME] = f
+            global_node_info[FEATURE_VALUE] = global_node_info.apply(
+                lambda x: x[NODE_NAME][len(x[FEATURE_NAME]) + 1:], axis=1)
 
         global_node_info[[TARGET, FEATURE_NAME, FEATURE_VALUE, IMPORTANCE, FREQUENCY]].sort_values(
             by=[TARGET, FEATURE_NAME, FEATURE_VALUE], ascending=False).to_json(
@@ -366,29 +386,16 @@ class Exporter(object):
                                     DataFrame
         :param filename:            String representing the name of the file used to persist the information
         """
-        # First, a dictionary with as many elements as target values so that each mask value consists of a list of
-        # boolean values set to True for those importance features associated to that target and False for the rest, is
-        # built
-        adapted_importance_mask = {}
-        for target_col in target_info.target_columns:
-            target_mask = []
-            for importance_col in features_info.importance_columns:
-                if not importance_col.startswith(target_col):
-                    target_mask.append(False)
-                else:
-                    target_mask.append(True)
-            adapted_importance_mask[target_col] = target_mask
-
-        # For each row, its corresponding adated_importance_mask is retrieved. It will depend on the top1 target
+        # Importance columns are sorted by feature and then by target, so that the importance of each feature for the
+        # top1 target of each row is gathered at once from the reshaped importance matrix
         top1_targets = target_info.top1_targets[sample_ids_mask]
-        adapted_importance_by_target = []
-        for target_value in top1_targets:
-            adapted_importance_by_target.append(adapted_importance_mask[target_value])
+        importance_values = self.__df_explanation_sample[features_info.importance_columns].values.reshape(
+            len(self.__df_explanation_sample), len(features_info.feature_columns), len(target_info.target_columns))
+        top1_importance_values = importance_values[np.arange(len(importance_values)), :,
+                                                   target_info.top1_argmax[sample_ids_mask]]
 
         pd.DataFrame(np.concatenate((self.__df_explanation_sample[ID].values.reshape(-1, 1),
-                                     self.__df_explanation_sample[features_info.importance_columns].values[
-                                         np.array(adapted_importance_by_target)].reshape(
-                                         len(self.__df_explanation_sample), -1),
+                                     top1_importance_values,
                                      top1_targets.reshape(-1, 1)), axis=1),
                      columns=[ID] + features_info.feature_columns + [TARGET]).to_json(
             path_or_buf=os.path.join(self.__destination_path, filename), orient='records')
@@ -425,7 +432,7 @@ class Exporter(object):
     def export(self, features_info: FeaturesInfo, target_info: TargetInfo, sample_ids_mask: np.ndarray,
                global_target_explainability: pd.DataFrame, global_explainability: pd.DataFrame,
                global_nodes_importance: pd.DataFrame, nodes_info: StatsResults, edges_info: StatsResults,
-               target_distribution: pd.DataFrame):
+               target_distribution: pd.DataFrame, encoding: Optional[FeatureEncoding] = None):
         self.__global_target_explainability = global_target_explainability
         xgprint(self.__verbose, 'INFO:     Exporting data to {}'.format(self.__destination_path))
         if not os.path.exists(self.__destination_path):
@@ -441,7 +448,7 @@ class Exporter(object):
 
         self.__export_global_nodes_heatmap_info(df_stats=nodes_info.global_stats,
                                                 df_importance=global_nodes_importance,
-                                                feature_columns=features_info.feature_columns)
+                                                feature_columns=features_info.feature_columns, encoding=encoding)
 
         self.__export_edges(df_stats=edges_info.local_stats, filename=EXPLAINER_LOCAL_GRAPH_EDGES_FILE)
 
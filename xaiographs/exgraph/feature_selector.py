@@ -16,14 +16,14 @@ You should have received a copy of the Affero GNU General Public License along w
 see https://www.gnu.org/licenses/."""
 
 
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 from scipy.special import rel_entr
 
 from xaiographs.common.constants import FEATURE, RANK, TARGET
-from xaiographs.common.utils import TargetInfo, xgprint
+from xaiographs.common.utils import FeatureEncoding, TargetInfo, get_encoded_features, xgprint
 
 # CONSTANTS
 DISTANCE = 'distance'
@@ -38,7 +38,7 @@ class FeatureSelector(object):
     """
 
     def __init__(self, df: pd.DataFrame, feature_cols: List[str], target_info: TargetInfo, number_of_features: int,
-                 verbose: int = 0):
+                 verbose: int = 0, encoding: Optional[FeatureEncoding] = None):
         """
         Constructor method for FeatureSelector class.
         - Property `top_features_by_target` has been included so that the FeatureSelector object can be
@@ -54,8 +54,13 @@ class FeatureSelector(object):
                                     numpy array showing the top1 targets indexes
         :param number_of_features:  Integer, representing the number of features to be selected
         :param verbose:             Verbosity level, where any value greater than 0 means the message is printed
+        :param encoding:            NamedTuple, containing the features encoded for the whole dataset, whose codes are
+                                    used instead of encoding the features again (default: None)
         """
         self.__df = df[feature_cols].copy()
+        self.__encoded_features = None
+        if encoding is not None:
+            self.__encoded_features = get_encoded_features(encoding=encoding, df=df, feature_cols=feature_cols)
         self.__df[TARGET] = target_info.top1_targets
         self.__feature_cols = feature_cols
         self.__k = number_of_features
@@ -117,7 +122,8 @@ class FeatureSelector(object):
                           one. With this option, the result will broadcast correctly against the input array.
                           (default False)
 
-        :return:          Float or np.ndarray, (depending on the input shape) containing the calculated statistics
+        :return:          Numpy array, containing the calculated statistics (median, mean, max and sum) along the last
+                          axis, for each distribution along any other axis
         """
         dist1 = dist1 if isinstance(dist1, np.ndarray) else np.asarray(dist1)
         dist2 = dist2 if isinstance(dist2, np.ndarray) else np.asarray(dist2)
@@ -128,31 +134,41 @@ class FeatureSelector(object):
         right = rel_entr(dist2, m)
         js_msa = (left + right) / 2.0
 
-        return np.array([np.sqrt(np.median(js_msa)),
-                         np.sqrt(np.mean(js_msa)),
-                         np.sqrt(np.max(js_msa)),
-                         np.sqrt(np.sum(js_msa))])
+        return np.stack([np.sqrt(np.median(js_msa, axis=axis)),
+                         np.sqrt(np.mean(js_msa, axis=axis)),
+                         np.sqrt(np.max(js_msa, axis=axis)),
+                         np.sqrt(np.sum(js_msa, axis=axis))], axis=-1)
 
     @staticmethod
-    def __compute_probabilities(feature_by_target: pd.Series, unique_values: np.ndarray) -> np.ndarray:
+    def __compute_probabilities(value_codes: np.ndarray, target_codes: np.ndarray, num_values: int,
+                                num_targets: int) -> Tuple[np.ndarray, np.ndarray]:
         """
-        This function computes the probability distribution for a given feature unique values and a given target
-
-        :param feature_by_target: Pandas series, resulting from filtering by target the pandas DataFrame and selecting
-                                  a feature
-        :param unique_values:     Numpy array, containing the unique values for the selected feature
-        :return:                  Numpy array, with a probability for each feature unique value
+        This function computes, for every target value at once, the probability distribution of a feature unique values
+        among the rows whose top1 target is that target value and among the rest of the rows. Both come from a single
+        contingency table (target values x feature unique values)
+
+        :param value_codes:     Numpy array, containing the index of each row feature value among its unique values
+        :param target_codes:    Numpy array, containing the index of each row top1 target among the target values
+        :param num_values:      Integer, representing the number of unique values of the feature
+        :param num_targets:     Integer, representing the number of target values
+        :return:                Tuple of numpy matrices, containing a probability for each feature unique value when
+                                filtering by each target value and when filtering by any other target value (both
+                                n_target_values x n_unique_values)
         """
-        return np.array([np.sum(feature_by_target.values == value) for value in unique_values]) / len(feature_by_target)
+        counts = np.bincount(target_codes * num_values + value_codes,
+                             minlength=num_targets * num_values).reshape(num_targets, num_values)
+        no_target_counts = counts.sum(axis=0) - counts
+        return (counts / counts.sum(axis=1, keepdims=True),
+                no_target_counts / no_target_counts.sum(axis=1, keepdims=True))
 
-    def __get_feature_unique_values(self) -> Dict[str, np.ndarray]:
+    def __get_feature_value_codes(self) -> Dict[str, Tuple[np.ndarray, int]]:
         """
-        This function retrieves for each feature col, its unique values
+        This function retrieves for each feature col, the index of each row value among its unique values
 
-        :return: Dictionary containing a numpy array of unique values for each feature column
+        :return: Dictionary containing, for each feature column, a numpy array with the index of each row value among
+                 the unique values and the number of unique values
         :raises: ValueError if any feature column contains NaN values
         """
-        unique_values_dict = {}
         for feature_col in self.__feature_cols:
             # Check for NaN values in the column
             if self.__df[feature_col].isnull().any():
@@ -161,8 +177,18 @@ class FeatureSelector(object):
                     "Null values are not allowed in feature columns. "
                     "Please remove or impute null values before processing the data.".format(feature_col)
                 )
-            unique_values_dict[feature_col] = np.unique(self.__df[feature_col].values)
-        return unique_values_dict
+
+        # Codes of the features encoded for the whole dataset are sorted by value, just like unique values are
+        if self.__encoded_features is not None:
+            codes, cardinalities = self.__encoded_features
+            return {feature_col: (codes[:, i], int(cardinalities[i])) for i, feature_col in
+                    enumerate(self.__feature_cols)}
+
+        value_codes_dict = {}
+        for feature_col in self.__feature_cols:
+            unique_values, value_codes = np.unique(self.__df[feature_col].values, return_inverse=True)
+            value_codes_dict[feature_col] = (value_codes, len(unique_values))
+        return value_codes_dict
 
     def select_topk(self):
         """
@@ -183,49 +209,41 @@ class FeatureSelector(object):
         feature_ranks = []
         distance_rank_info = {}
 
-        # For each feature, its unique values are retrieved
-        unique_values = self.__get_feature_unique_values()
-        for target_value in self.__target_values:
-            unorm_stats_by_feature = []
+        # For a binary problem, there'll be only two values for the target, so that their distances are symmetrical
+        # there's no need to compute distances for the two values, one is enough
+        target_values = self.__target_values[:1] if len(self.__target_values) == 2 else self.__target_values
+        target_codes = pd.Categorical(self.__df[TARGET], categories=self.__target_values).codes.astype(np.int64)
 
-            # For each feature, unique values are retrieved to compute probabilities
-            for feature_col in self.__feature_cols:
-                # Probability distribution is computed for feature feature_col when TARGET equals target_value
-                probs_feature_target = FeatureSelector.__compute_probabilities(
-                    self.__df.loc[self.__df[TARGET] == target_value][feature_col], unique_values[feature_col])
+        # For each feature, the probability distributions of its unique values when filtering by each target value and
+        # when filtering by any other target value are computed at once, and so is the modified Jensen-Shannon distance
+        # between them
+        unorm_stats_by_feature = []
+        for feature_col, (value_codes, num_values) in self.__get_feature_value_codes().items():
+            probs_feature_target, probs_feature_no_target = FeatureSelector.__compute_probabilities(
+                value_codes, target_codes, num_values, len(self.__target_values))
+            unorm_stats_by_feature.append(FeatureSelector.__compute_jensen_shannon(
+                probs_feature_target[:len(target_values)], probs_feature_no_target[:len(target_values)], axis=1))
 
-                # Probability distribution is computed for feature feature_col when TARGET doesn't equal target_value
-                probs_feature_no_target = FeatureSelector.__compute_probabilities(
-                    self.__df.loc[self.__df[TARGET] != target_value][feature_col], unique_values[feature_col])
+        # Statistics (mean, median, max and sum) are computed by target value and feature
+        unorm_stats_by_feature = np.stack(unorm_stats_by_feature, axis=1)
 
-                # Modified Jensen-Shannon distance is computed between the two distributions
-                unorm_stats_by_feature.append(FeatureSelector.__compute_jensen_shannon(probs_feature_target,
-                                                                                       probs_feature_no_target))
+        # Statistics for each feature are normalized
+        norm_stats_by_feature = unorm_stats_by_feature / unorm_stats_by_feature.sum(axis=1, keepdims=True)
 
-            # Statistics (mean, median, max and sum) are computed by feature
-            unorm_stats_by_feature = np.stack(unorm_stats_by_feature)
+        # Normalized statistics are added for each feature
+        unorm_distance_by_feature = np.sum(norm_stats_by_feature, axis=2)
 
-            # Statistics for each feature are normalized
-            norm_stats_by_feature = unorm_stats_by_feature/unorm_stats_by_feature.sum(axis=0)
-
-            # Normalized statistics are added for each feature
-            unorm_distance_by_feature = np.sum(norm_stats_by_feature, axis=1)
-
-            # The addition results are normalized
-            norm_distance_by_feature = unorm_distance_by_feature/np.sum(unorm_distance_by_feature)
+        # The addition results are normalized
+        norm_distance_by_feature = unorm_distance_by_feature / np.sum(unorm_distance_by_feature, axis=1, keepdims=True)
 
+        for target_value, distances in zip(target_values, norm_distance_by_feature):
             # A dictionary (feature: distance) is built
-            distance_by_feature = dict(zip(self.__feature_cols, norm_distance_by_feature))
+            distance_by_feature = dict(zip(self.__feature_cols, distances))
 
             # Once distance has been computed for all the features related to a given target value, features are
             # ranked so that the larger the distance, the higher the rank (1 is greater than 2 in rank terms)
             distance_rank_info[target_value] = sorted(distance_by_feature.items(), key=lambda d: d[1], reverse=True)
             feature_ranks.extend([info[0] for info in distance_rank_info[target_value]])
-
-            # For a binary problem, there'll be only two values for the target, so that their distances are symmetrical
-            # there's no need to compute distances for the two values, one is enough
-            if len(self.__target_values) == 2:
-                break
         self.__top_features_by_target = distance_rank_info
 
         # Finally, all obtained ranks for the different target values are aggregated for each feature. The largest rank
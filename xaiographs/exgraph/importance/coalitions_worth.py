@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from xaiographs.common.utils import SharedArray, attach_shared_array, create_shared_array, get_n_jobs
+
+# CONSTANTS
+# Coalition keys are aggregated by means of np.bincount whenever the number of possible keys is not larger than this
+# factor times the number of rows, otherwise keys are sorted (np.unique)
+DENSE_KEYS_FACTOR = 2
+
+# When coalitions worth is computed in parallel, the coalitions lattice is split into (at least) this number of parts
+# per process, so that processes finishing early can take over the remaining parts
+TASKS_PER_JOB = 4
+
+# Keys of the arrays shared with the processes computing coalitions worth in parallel
+COALITIONS_WORTH = 'coalitions_worth'
+CODES = 'codes'
+QUERY_CODES = 'query_codes'
+ROW_COUNTS = 'row_counts'
+TARGETS = 'targets'
+
+
+def _aggregate(feature: int, codes: np.ndarray, targets: np.ndarray, row_counts: Optional[np.ndarray],
+               cardinalities: np.ndarray, query_codes: np.ndarray, parent_groups: np.ndarray,
+               parent_query_groups: np.ndarray, parent_num_groups: int, group: bool, min_support: int = 1,
+               parent_query_worth: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    This function computes the worth of the coalition resulting from adding a feature to a parent coalition, given the
+    group index of each row (and query row) within the parent coalition. When a minimum support is given, query rows
+    whose group holds fewer samples back off to the parent coalition worth
+
+    :param feature:             Integer, representing the feature added to the parent coalition
+    :param codes:               Numpy matrix of integers, containing the encoded features of the rows
+    :param targets:             Numpy matrix, containing the targets (or their sum) for each row
+    :param row_counts:          Numpy array, containing the number of samples represented by each row (None means one)
+    :param cardinalities:       Numpy array of integers, containing the number of different codes for each feature
+    :param query_codes:         Numpy matrix of integers, containing the encoded features of the query rows
+    :param parent_groups:       Numpy array of integers, containing the parent group index of each row
+    :param parent_query_groups: Numpy array of integers, containing the parent group index of each query row (-1 when
+                                the query row doesn't belong to any parent group)
+    :param parent_num_groups:   Integer, representing the number of parent groups
+    :param group:               Boolean, stating whether the group index of each row (and query row) must be returned
+    :param min_support:         Integer, representing the minimum number of samples of a group for its worth to be
+                                used (default: 1, no back-off)
+    :param parent_query_worth:  Numpy matrix, containing the parent coalition worth for each query row (only required
+                                if `min_support` is greater than 1)
+    :return:                    Tuple containing the coalition worth for each query row, the group index for each row
+                                and for each query row (they may be None if `group` is False) and the number of groups
+    """
+    keys = parent_groups * cardinalities[feature] + codes[:, feature]
+    num_keys = parent_num_groups * cardinalities[feature]
+    query_keys = parent_query_groups * cardinalities[feature] + query_codes[:, feature]
+    if num_keys <= DENSE_KEYS_FACTOR * len(keys):
+        query_worth, query_counts, groups, query_groups, num_groups = _aggregate_dense(
+            keys, num_keys, targets, row_counts, query_keys, parent_query_groups >= 0, group)
+    else:
+        query_worth, query_counts, groups, query_groups, num_groups = _aggregate_sparse(
+            keys, targets, row_counts, query_keys, parent_query_groups >= 0)
+
+    # Groups below the minimum support (including those which are not present) take the parent worth, which in turn
+    # may have been backed off. Group indexes are kept, since children groups are never bigger
+    if min_support > 1:
+        query_worth = np.where((query_counts < min_support).reshape(-1, 1), parent_query_worth, query_worth)
+    return query_worth, groups, query_groups, num_groups
+
+
+def _aggregate_dense(keys: np.ndarray, num_keys: int, targets: np.ndarray, row_counts: Optional[np.ndarray],
+                     query_keys: np.ndarray, query_valid: np.ndarray,
+                     group: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    This function aggregates the targets by key when the number of possible keys is small enough to use np.bincount.
+    Group indexes follow the order of the sorted unique keys
+
+    :param keys:        Numpy array of integers, containing a key for each row
+    :param num_keys:    Integer, representing the number of possible keys (all keys are lower than this number)
+    :param targets:     Numpy matrix, containing the targets (or their sum) for each row (n_rows x n_targets)
+    :param row_counts:  Numpy array, containing the number of samples represented by each row (None means one)
+    :param query_keys:  Numpy array of integers, containing a key for each query row
+    :param query_valid: Numpy array of booleans, stating which query keys must be looked up
+    :param group:       Boolean, stating whether the group index of each row (and query row) must be returned
+    :return:            Tuple containing the mean of the targets and the number of samples for each query row, the
+                        group index for each row and for each query row (None if `group` is False) and the number of
+                        groups
+    """
+    counts = np.bincount(keys, weights=row_counts, minlength=num_keys)
+    sums = np.stack([np.bincount(keys, weights=targets[:, t], minlength=num_keys) for t in range(targets.shape[1])],
+                    axis=1)
+    query_keys = np.where(query_valid, query_keys, 0)
+    query_counts = np.where(query_valid, counts[query_keys], 0)
+    query_valid = query_valid & (query_counts > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        query_worth = np.where(query_valid.reshape(-1, 1), sums[query_keys] / counts[query_keys].reshape(-1, 1), np.nan)
+
+    groups, query_groups, num_groups = None, None, 0
+    if group:
+        present = counts > 0
+        group_index = np.cumsum(present) - 1
+        groups = group_index[keys]
+        query_groups = np.where(query_valid, group_index[query_keys], -1)
+        num_groups = group_index[-1] + 1
+    return query_worth, query_counts, groups, query_groups, num_groups
+
+
+def _aggregate_sparse(keys: np.ndarray, targets: np.ndarray, row_counts: Optional[np.ndarray], query_keys: np.ndarray,
+                      query_valid: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    This function aggregates the targets by key by sorting the keys. Group indexes follow the order of the sorted
+    unique keys
+
+    :param keys:        Numpy array of integers, containing a key for each row
+    :param targets:     Numpy matrix, containing the targets (or their sum) for each row (n_rows x n_targets)
+    :param row_counts:  Numpy array, containing the number of samples represented by each row (None means one)
+    :param query_keys:  Numpy array of integers, containing a key for each query row
+    :param query_valid: Numpy array of booleans, stating which query keys must be looked up
+    :return:            Tuple containing the mean of the targets and the number of samples for each query row, the
+                        group index for each row and for each query row and the number of groups
+    """
+    table_keys, groups = np.unique(keys, return_inverse=True)
+    counts = np.bincount(groups, weights=row_counts, minlength=len(table_keys))
+    sums = np.stack([np.bincount(groups, weights=targets[:, t], minlength=len(table_keys))
+                     for t in range(targets.shape[1])], axis=1)
+
+    # Query keys are looked up within the sorted unique keys
+    positions = np.minimum(np.searchsorted(table_keys, query_keys), len(table_keys) - 1)
+    query_groups = np.where(query_valid & (table_keys[positions] == query_keys), positions, -1)
+
+    # An additional row of NaN is appended so that query rows not belonging to any group (-1) pick it up
+    means = np.concatenate((sums / counts.reshape(-1, 1), np.full((1, sums.shape[1]), np.nan)), axis=0)
+    query_counts = np.where(query_groups >= 0, counts[query_groups], 0)
+    return means[query_groups], query_counts, groups, query_groups, len(table_keys)
+
+
+def _coalitions_worth_task(shared_arrays: Dict[str, SharedArray], cardinalities: np.ndarray, prefix: int,
+                           prefix_features: int, min_support: int = 1) -> int:
+    """
+    This function computes the coalitions worth for one of the parts in which the coalitions lattice is split (see
+    `iter_coalitions_worth`). It's run by the processes of the pool: input arrays are read from shared memory and the
+    coalitions worth is written to the shared output array, so that only their descriptions are sent to the processes
+
+    :param shared_arrays:   Dictionary, containing the description of the shared arrays: codes, targets, query codes,
+                            row counts (optional) and coalitions worth (output)
+    :param cardinalities:   Numpy array of integers, containing the number of different codes for each feature
+    :param prefix:          Integer, representing the coalition of the lowest features shared by this part
+    :param prefix_features: Integer, representing the number of lowest features fixed by the prefix
+    :param min_support:     Integer, representing the minimum number of samples of a group for its worth to be used
+                            (default: 1, no back-off)
+    :return:                Integer, representing the number of coalitions whose worth has been computed
+    """
+    shared = {key: attach_shared_array(shared_array) for key, shared_array in shared_arrays.items()}
+    num_coalitions = 0
+    try:
+        arrays = {key: array for key, (_, array) in shared.items()}
+        for coalition, worth in iter_coalitions_worth(codes=arrays[CODES], targets=arrays[TARGETS],
+                                                      cardinalities=cardinalities, query_codes=arrays[QUERY_CODES],
+                                                      row_counts=arrays.get(ROW_COUNTS), prefix=prefix,
+                                                      prefix_features=prefix_features, min_support=min_support):
+            arrays[COALITIONS_WORTH][:, coalition, :] = worth
+            num_coalitions += 1
+
+        # Views on the shared memory blocks must be released before closing them
+        del arrays
+    finally:
+        for shared_memory, _ in shared.values():
+            shared_memory.close()
+
+    return num_coalitions
+
+
+def aggregate_rows(codes: np.ndarray, targets: np.ndarray,
+                   cardinalities: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    This function builds the full features table: rows sharing the same values for all the features are aggregated
+    into a single row, containing the sum of their targets and the number of aggregated rows. Every coalition worth can
+    be derived by marginalizing this table, so that the original rows don't need to be scanned again
+
+    :param codes:           Numpy matrix of integers, containing the encoded features of the rows (n_rows x n_features)
+    :param targets:         Numpy matrix, containing the targets for those rows (n_rows x n_targets)
+    :param cardinalities:   Numpy array of integers, containing the number of different codes for each feature
+    :return:                Tuple containing a numpy matrix with the encoded features of each distinct combination of
+                            features values (n_groups x n_features), a numpy matrix with the sum of the targets for each
+                            of them (n_groups x n_targets) and a numpy array with the number of rows for each of them
+    """
+    # Rows are grouped by adding one feature at a time, so that keys are bounded by the number of rows times the
+    # feature cardinality
+    groups = np.zeros(len(codes), dtype=np.int64)
+    num_groups = 1
+    for feature in range(codes.shape[1]):
+        keys = groups * cardinalities[feature] + codes[:, feature]
+        num_keys = num_groups * cardinalities[feature]
+        if num_keys <= DENSE_KEYS_FACTOR * len(keys):
+            present = np.bincount(keys, minlength=num_keys) > 0
+            group_index = np.cumsum(present) - 1
+            groups, num_groups = group_index[keys], group_index[-1] + 1
+        else:
+            table_keys, groups = np.unique(keys, return_inverse=True)
+            num_groups = len(table_keys)
+
+    # The first row of each group is taken to represent its features values
+    group_rows = np.full(num_groups, len(codes), dtype=np.int64)
+    np.minimum.at(group_rows, groups, np.arange(len(codes)))
+    group_sums = np.stack([np.bincount(groups, weights=targets[:, t], minlength=num_groups)
+                           for t in range(targets.shape[1])], axis=1)
+
+    return codes[group_rows], group_sums, np.bincount(groups, minlength=num_groups).astype(np.float64)
+
+
+def compute_coalitions_worth(codes: np.ndarray, targets: np.ndarray, cardinalities: np.ndarray,
+                             query_codes: np.ndarray, row_counts: Optional[np.ndarray] = None, n_jobs: int = 1,
+                             dtype: np.dtype = np.float64, min_support: int = 1, verbose: int = 0) -> np.ndarray:
+    """
+    This function computes the worth of every coalition for each of the query rows (see `iter_coalitions_worth`). When
+    more than one job is requested, the coalitions lattice is split into disjoint parts of the same size, which are
+    processed by a pool of processes. Input arrays are placed in shared memory only once and each process writes the
+    worth of its coalitions directly to a shared output array, so the result doesn't depend on the number of jobs
+
+    :param codes:           Numpy matrix of integers, containing the encoded features of the rows from which targets
+                            are aggregated (n_rows x n_features)
+    :param targets:         Numpy matrix, containing the targets for those rows (n_rows x n_targets). If `row_counts`
+                            is given, it must contain the sum of the targets of the samples represented by each row
+    :param cardinalities:   Numpy array of integers, containing the number of different codes for each feature
+    :param query_codes:     Numpy matrix of integers, containing the encoded features of the rows for which coalitions
+                            worth is computed (n_query_rows x n_features)
+    :param row_counts:      Numpy array, containing the number of samples represented by each row (default: None, each
+                            row represents a single sample)
+    :param n_jobs:          Integer, representing the number of processes to be used. Negative values are relative to
+                            the number of CPUs (default: 1, coalitions worth is computed in the current process)
+    :param dtype:           Numpy dtype of the coalitions worth. Targets are always aggregated in double precision, only
+                            the resulting worth is stored with this dtype (default: np.float64)
+    :param min_support:     Integer, representing the minimum number of samples of a group for its worth to be used
+                            (default: 1, no back-off, see `iter_coalitions_worth`)
+    :param verbose:         Verbosity level, where any value greater than 0 means the message is printed
+    :return:                Numpy matrix, containing the coalitions worth for each query row
+                            (n_query_rows x n_coalitions x n_targets)
+    """
+    num_features = codes.shape[1]
+    shape = (len(query_codes), 2 ** num_features, targets.shape[1])
+    n_jobs = get_n_jobs(n_jobs)
+    pbar = tqdm(total=shape[1], disable=not verbose)
+    pbar.set_description('INFO:     Coalition features')
+
+    if n_jobs == 1:
+        coalitions_worth = np.empty(shape, dtype=dtype)
+        for coalition, worth in iter_coalitions_worth(codes=codes, targets=targets, cardinalities=cardinalities,
+                                                      query_codes=query_codes, row_counts=row_counts,
+                                                      min_support=min_support):
+            coalitions_worth[:, coalition, :] = worth
+            pbar.update()
+        pbar.close()
+        return coalitions_worth
+
+    # Lowest features are fixed so that there are at least TASKS_PER_JOB parts per process
+    prefix_features = min(num_features, int(np.ceil(np.log2(TASKS_PER_JOB * n_jobs))))
+
+    # Input arrays are shared in column-major order, as they're accessed column by column
+    arrays = {CODES: codes, TARGETS: targets.astype(np.float64, copy=False), QUERY_CODES: query_codes}
+    if row_counts is not None:
+        arrays[ROW_COUNTS] = row_counts
+    shared, shared_arrays = {}, {}
+    try:
+        for key, array in arrays.items():
+            shared[key], shared_arrays[key] = create_shared_array(array.shape, array.dtype, array, order='F')
+        shared[COALITIONS_WORTH], shared_arrays[COALITIONS_WORTH] = create_shared_array(shape, dtype)
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(_coalitions_worth_task, shared_arrays, cardinalities, prefix, prefix_features,
+                                       min_support)
+                       for prefix in range(2 ** prefix_features)]
+            for future in as_completed(futures):
+                pbar.update(future.result())
+        pbar.close()
+
+        return np.ndarray(shape, dtype=dtype, buffer=shared[COALITIONS_WORTH].buf).copy()
+    finally:
+        for shared_memory in shared.values():
+            shared_memory.close()
+            shared_memory.unlink()
+
+
+def encode_features(dfs: List[pd.DataFrame], feature_cols: List[str]) -> Tuple[List[np.ndarray], np.ndarray]:
+    """
+    This function encodes each feature as integer codes (from 0 to the feature cardinality - 1). Codes are computed
+    jointly for all the given DataFrames, so that the same value gets the same code in all of them
+
+    :param dfs:             List of pandas DataFrames, containing the feature columns to be encoded
+    :param feature_cols:    List of strings, containing the column names for the features
+    :return:                Tuple containing a list with a numpy matrix of codes (n_rows x n_features) per DataFrame and
+                            a numpy array with the cardinality of each feature
+    """
+    lengths = np.cumsum([0] + [len(df) for df in dfs])
+    codes = np.empty((lengths[-1], len(feature_cols)), dtype=np.int64)
+    cardinalities = np.empty(len(feature_cols), dtype=np.int64)
+    for i, feature_col in enumerate(feature_cols):
+        feature_codes, feature_values = pd.factorize(pd.concat([df[feature_col] for df in dfs], ignore_index=True))
+        codes[:, i] = feature_codes
+        cardinalities[i] = len(feature_values)
+
+    return [codes[start:end] for start, end in zip(lengths[:-1], lengths[1:])], cardinalities
+
+
+def iter_chain_worth(codes: np.ndarray, targets: np.ndarray, cardinalities: np.ndarray, query_codes: np.ndarray,
+                     features: Sequence[int], row_counts: Optional[np.ndarray] = None,
+                     min_support: int = 1) -> Iterator[np.ndarray]:
+    """
+    This function computes the worth of a chain of coalitions for each of the query rows: starting with the empty
+    coalition, the given features are added one at a time, so that each coalition is grouped from the previous one (see
+    `iter_coalitions_worth`). A permutation of all the features yields a chain from the empty coalition to the one
+    containing all the features
+
+    :param codes:           Numpy matrix of integers, containing the encoded features of the rows from which targets
+                            are aggregated (n_rows x n_features). It should be stored in column-major order
+    :param targets:         Numpy matrix, containing the targets for those rows (n_rows x n_targets). If `row_counts`
+                            is given, it must contain the sum of the targets of the samples represented by each row
+    :param cardinalities:   Numpy array of integers, containing the number of different codes for each feature
+    :param query_codes:     Numpy matrix of integers, containing the encoded features of the rows for which coalitions
+                            worth is computed (n_query_rows x n_features). It should be stored in column-major order
+    :param features:        Sequence of integers, containing the features to be added, in order
+    :param row_counts:      Numpy array, containing the number of samples represented by each row, as returned by
+                            `aggregate_rows` (default: None, each row represents a single sample)
+    :param min_support:     Integer, representing the minimum number of samples of a group for its worth to be used.
+                            Query rows whose group holds fewer samples take the worth of the previous coalition of the
+                            chain (default: 1, no back-off)
+    :return:                Iterator of numpy matrices, containing the worth of each coalition of the chain for each
+                            query row (n_query_rows x n_targets), starting with the empty coalition
+    """
+    if row_counts is None:
+        worth = targets.mean(axis=0, keepdims=True)
+    else:
+        worth = targets.sum(axis=0, keepdims=True) / row_counts.sum()
+    worth = np.repeat(worth, len(query_codes), axis=0)
+    yield worth
+
+    groups = np.zeros(len(codes), dtype=np.int64)
+    query_groups = np.zeros(len(query_codes), dtype=np.int64)
+    num_groups = 1
+    for i, feature in enumerate(features):
+        worth, groups, query_groups, num_groups = _aggregate(feature, codes, targets, row_counts, cardinalities,
+                                                             query_codes, groups, query_groups, num_groups,
+                                                             i < len(features) - 1, min_support, worth)
+        yield worth
+
+
+def iter_coalitions_worth(codes: np.ndarray, targets: np.ndarray, cardinalities: np.ndarray,
+                          query_codes: np.ndarray, row_counts: Optional[np.ndarray] = None, prefix: int = 0,
+                          prefix_features: int = 0, min_support: int = 1) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    This function computes the worth of every coalition (the mean of the targets conditioned to the values of the
+    coalition features) for each of the query rows. Coalitions are integer bitmasks (bit `f` is set when the feature `f`
+    belongs to the coalition).
+
+    Features are grouped only once per coalition by means of integer keys. The coalitions lattice is traversed depth
+    first, so that the key of a row for a given coalition is computed from its group index within the coalition without
+    its highest feature (its parent) and the code of that highest feature. This way keys never grow beyond the number
+    of rows times the feature cardinality, regardless of the number of features, and only one key computation is needed
+    per coalition.
+    The traversal can be restricted to those coalitions whose lowest `prefix_features` features are exactly the ones in
+    `prefix`, so that the lattice can be split into 2^prefix_features disjoint parts of the same size.
+    Worth estimated from a handful of samples is noisy, so a minimum support can be required: query rows whose group
+    holds fewer samples than `min_support` back off to the worth of the parent coalition (the coalition without its
+    highest feature), which in turn may have been backed off
+
+    :param codes:           Numpy matrix of integers, containing the encoded features of the rows from which targets
+                            are aggregated (n_rows x n_features)
+    :param targets:         Numpy matrix, containing the targets for those rows (n_rows x n_targets). If `row_counts`
+                            is given, it must contain the sum of the targets of the samples represented by each row
+    :param cardinalities:   Numpy array of integers, containing the number of different codes for each feature
+    :param query_codes:     Numpy matrix of integers, containing the encoded features of the rows for which coalitions
+                            worth is computed (n_query_rows x n_features)
+    :param row_counts:      Numpy array, containing the number of samples represented by each row, as returned by
+                            `aggregate_rows` (default: None, each row represents a single sample)
+    :param prefix:          Integer, representing the coalition (bitmask) of the lowest `prefix_features` features
+                            shared by all the traversed coalitions (default: 0)
+    :param prefix_features: Integer, representing the number of lowest features fixed by `prefix` (default: 0, all the
+                            coalitions are traversed)
+    :param min_support:     Integer, representing the minimum number of samples of a group for its worth to be used
+                            (default: 1, no back-off)
+    :return:                Iterator of tuples, containing the coalition id and a numpy matrix with the coalition worth
+                            for each query row (n_query_rows x n_targets). Unless backed off, worth is NaN for those
+                            query rows whose coalition features values are not present in the aggregated rows
+    """
+    num_features = codes.shape[1]
+
+    # Features codes and targets are accessed column by column, so they're stored in column-major order
+    codes = np.asfortranarray(codes)
+    query_codes = np.asfortranarray(query_codes)
+    targets = np.asfortranarray(targets, dtype=np.float64)
+
+    # The empty coalition consists of a single group containing all the rows
+    groups = np.zeros(len(codes), dtype=np.int64)
+    query_groups = np.zeros(len(query_codes), dtype=np.int64)
+    num_groups = 1
+    if row_counts is None:
+        worth = targets.mean(axis=0, keepdims=True)
+    else:
+        worth = targets.sum(axis=0, keepdims=True) / row_counts.sum()
+    worth = np.repeat(worth, len(query_codes), axis=0)
+
+    # The prefix groups are computed by adding its features one at a time
+    for feature in [f for f in range(prefix_features) if prefix >> f & 1]:
+        worth, groups, query_groups, num_groups = _aggregate(feature, codes, targets, row_counts, cardinalities,
+                                                             query_codes, groups, query_groups, num_groups, True,
+                                                             min_support, worth)
+    yield prefix, worth
+
+    # Each stack element represents a coalition still to be processed: its parent coalition, the feature added to the
+    # parent, the parent groups (for the rows and for the query rows), the parent number of groups and the parent
+    # worth (only required to back off)
+    stack = [(prefix, f, groups, query_groups, num_groups, worth)
+             for f in reversed(range(prefix_features, num_features))]
+    while stack:
+        parent, feature, parent_groups, parent_query_groups, parent_num_groups, parent_worth = stack.pop()
+        coalition = parent | (1 << feature)
+
+        # Coalitions whose highest feature is the last one have no children, so their groups aren't required
+        worth, groups, query_groups, num_groups = _aggregate(feature, codes, targets, row_counts, cardinalities,
+                                                             query_codes, parent_groups, parent_query_groups,
+                                                             parent_num_groups, feature < num_features - 1,
+                                                             min_support, parent_worth)
+        yield coalition, worth
+
+        # Children are those coalitions adding a feature higher than the highest feature of this coalition
+        for child_feature in reversed(range(feature + 1, num_features)):
+            stack.append((coalition, child_feature, groups, query_groups, num_groups,
+                          worth if min_support > 1 else None))
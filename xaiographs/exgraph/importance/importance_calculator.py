@@ -17,17 +17,32 @@ see https://www.gnu.org/licenses/."""
 
 
 from abc import ABCMeta, abstractmethod
-from typing import Dict, List, Tuple, Union
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 
 from xaiographs.common.constants import FEATURE_IMPORTANCE, FEATURE_NAME, ID, NODE_IMPORTANCE, NODE_IMPORTANCE_ABS,\
     NODE_NAME, RANK, TARGET
-from xaiographs.common.utils import FeaturesInfo, TargetInfo, filter_by_ids, xgprint
+from xaiographs.common.utils import FeatureEncoding, FeaturesInfo, TargetInfo, filter_by_ids, get_node_codes, \
+    get_sample_indices_by_target, xgprint
 
 # CONSTANTS
 EPS_ERROR = 0.000001
+SANITY_CHECK_FULL = 'full'
+SANITY_CHECK_OFF = 'off'
+SANITY_CHECK_SAMPLED = 'sampled'
+SANITY_CHECK_SAMPLES = 1000
+
+
+class SanityCheck(NamedTuple):
+    """SanityCheck provides the structure to store the outcome of a local accuracy sanity check: the number of checked
+    samples and, for each target (sorted like the target columns), the number of discrepancies and the maximum absolute
+    error between the ground truth and the importance based prediction
+    """
+    num_checked: int
+    num_discrepancies: np.ndarray
+    max_abs_error: np.ndarray
 
 
 class ImportanceCalculator(metaclass=ABCMeta):
@@ -38,9 +53,12 @@ class ImportanceCalculator(metaclass=ABCMeta):
     """
     _DF_EXPLANATION_IC = 'df_explanation'
     _IMPORTANCE_VALUES_IC = 'importance_values'
+    _SANITY_CHECK_POLICIES = (SANITY_CHECK_FULL, SANITY_CHECK_OFF, SANITY_CHECK_SAMPLED)
+    _SANITY_CHECK_SEED = 42
 
     def __init__(self, feature_cols: List[str], target_info: TargetInfo, train_size: float, train_stratify: bool,
-                 verbose: int = 0):
+                 verbose: int = 0, dtype: np.dtype = np.float64, sanity_check: str = SANITY_CHECK_FULL,
+                 sanity_check_samples: int = SANITY_CHECK_SAMPLES, encoding: Optional[FeatureEncoding] = None):
         """
         Constructor method for ImportanceCalculator
 
@@ -54,9 +72,25 @@ class ImportanceCalculator(metaclass=ABCMeta):
         :param train_stratify:              Boolean, indicating whether target columns proportions will be taken into
                                             account when splitting the data (if train_size > 0.0)
         :param verbose:                     Verbosity level, where any value greater than 0 means the message is printed
+        :param dtype:                       Numpy dtype, used to compute and store the importance (default: np.float64)
+        :param sanity_check:                String, representing the local accuracy sanity check policy: 'full' checks
+                                            every explained sample, 'sampled' checks a random sample of them and 'off'
+                                            skips the check (default: 'full')
+        :param sanity_check_samples:        Integer, representing the number of samples checked when the policy is
+                                            'sampled' (default: 1000)
+        :param encoding:                    NamedTuple, containing the features encoded for the whole dataset, whose
+                                            codes are used instead of encoding the features again (default: None)
 
         """
+        if sanity_check not in ImportanceCalculator._SANITY_CHECK_POLICIES:
+            raise ValueError('sanity_check must be one of {}, got {!r}'.format(
+                ImportanceCalculator._SANITY_CHECK_POLICIES, sanity_check))
         self._importance_values = None
+        self._sanity_check_policy = sanity_check
+        self._sanity_check_samples = sanity_check_samples
+        self._sanity_checks = {}
+        self._dtype = np.dtype(dtype)
+        self._encoding = encoding
         self._feature_cols = feature_cols
         self._target_info = target_info
         self._train_size = train_size
@@ -75,6 +109,18 @@ class ImportanceCalculator(metaclass=ABCMeta):
         """
         return self._importance_values
 
+    @property
+    def sanity_checks(self):
+        """
+        Property that returns a dictionary containing, for each sanity check scope (aggregated/original), a SanityCheck
+        NamedTuple with the number of checked samples and the number of discrepancies and maximum absolute error per
+        target. It's empty if the sanity check policy is 'off'. Prior to invoking this property, the `local_explain()`
+        method from an `ImportanceCalculator` child class must have been invoked
+
+        :return: Dictionary, with the sanity check results by scope
+        """
+        return self._sanity_checks
+
     @abstractmethod
     def local_explain(self, batch_size: int, **params) -> Dict[str, Union[pd.DataFrame, np.ndarray]]:
         raise NotImplementedError
@@ -95,16 +141,15 @@ class ImportanceCalculator(metaclass=ABCMeta):
         :return:                             Pandas DataFrame, containing the mean of each feature importance throughout
                                              all the targets
         """
-        return pd.DataFrame(np.concatenate((np.array(feature_cols).reshape(-1, 1),
-                                            global_target_explainability.drop(TARGET, axis=1).values.mean(
-                                                axis=0).reshape(-1, 1)), axis=1),
-                            columns=[FEATURE_NAME, FEATURE_IMPORTANCE]).sort_values(by=[FEATURE_IMPORTANCE],
-                                                                                    ascending=False)
+        return pd.DataFrame({FEATURE_NAME: feature_cols,
+                             FEATURE_IMPORTANCE: global_target_explainability[feature_cols].values.mean(axis=0)}
+                            ).sort_values(by=[FEATURE_IMPORTANCE], ascending=False)
 
     @staticmethod
     def __compute_global_graph_nodes_importance(df_explained: pd.DataFrame, feature_cols: List[str],
                                                 float_features: List[str], target_cols: List[str],
-                                                importance_cols: List[str]) -> pd.DataFrame:
+                                                importance_cols: List[str],
+                                                encoding: Optional[FeatureEncoding] = None) -> pd.DataFrame:
         """
         This function computes the global graph nodes information related to the calculation of the features importance
 
@@ -114,39 +159,35 @@ class ImportanceCalculator(metaclass=ABCMeta):
         :param target_cols:     List of strings, containing the column names for the target/s
         :param importance_cols: List of strings, containing the columna names for the columns containing the calculated
                                 importance
+        :param encoding:        NamedTuple, containing the features encoded for the whole dataset (default: None, the
+                                explained DataFrame features are encoded)
         :return:                Pandas DataFrame, containing the graph nodes global information, related to the
                                 importance calculation
         """
-        all_columns = list(df_explained.columns)
-        df_explanation_values = df_explained.values
-        graph_nodes_values = []
-
-        # Each feature_value pair is computed (NODE_NAME)
-        for i, row in enumerate(df_explanation_values):
-            for feature_col in feature_cols:
-                feature_value_raw = row[all_columns.index(feature_col)]
-                if feature_col in float_features:
-                    feature_value = '_'.join([feature_col, "{:.02f}".format(feature_value_raw)])
-                else:
-                    feature_value = '_'.join([feature_col, str(feature_value_raw)])
-                graph_nodes_values.append([row[0], feature_value])
-
-        # For each feature value pair an row per target is generated, each row will contain the importance associated
-        # to that feature value pair and the corresponding target. That target will be included within each row
-        graph_nodes = pd.DataFrame(np.concatenate((np.repeat(graph_nodes_values, len(target_cols), axis=0),
-                                                   df_explained[importance_cols].values.reshape(-1, 1),
-                                                   np.tile(target_cols, len(graph_nodes_values)).reshape(-1, 1)),
-                                                  axis=1),
-                                   columns=[ID, NODE_NAME, NODE_IMPORTANCE, TARGET])
-        graph_nodes[NODE_IMPORTANCE] = pd.to_numeric(graph_nodes[NODE_IMPORTANCE])
-
-        # Node importance will be averaged through for each node and each target
-        global_graph_nodes = graph_nodes.groupby([TARGET, NODE_NAME])[NODE_IMPORTANCE].mean().reset_index()
+        # Node names are only formatted for the distinct feature values, so that each sample and feature is encoded
+        # into the code of its node
+        node_codes, node_names = get_node_codes(df=df_explained, feature_cols=feature_cols,
+                                                float_feature_cols=float_features, encoding=encoding)
+        node_codes = node_codes.ravel()
+
+        # Importance columns are sorted by feature and then by target, so the importance of each (sample, feature)
+        # pair for all the targets is found in a row of the reshaped matrix. Node importance is averaged for each node
+        # and each target
+        importance = df_explained[importance_cols].values.astype(np.float64).reshape(len(node_codes), len(target_cols))
+        node_counts = np.bincount(node_codes, minlength=len(node_names))
+        target_order = np.argsort(np.array(target_cols, dtype=str), kind='stable')
+        node_importance = np.stack([np.bincount(node_codes, weights=importance[:, t], minlength=len(node_names))
+                                    for t in target_order]) / node_counts
+        global_graph_nodes = pd.DataFrame({TARGET: np.repeat(np.array(target_cols)[target_order], len(node_names)),
+                                           NODE_NAME: np.tile(node_names, len(target_cols)),
+                                           NODE_IMPORTANCE: node_importance.ravel()})
         global_graph_nodes[NODE_IMPORTANCE_ABS] = global_graph_nodes[NODE_IMPORTANCE].abs()
 
-        # Rank is calculated based on the node importance absolute value and grouping by TARGET
+        # Rank is calculated based on the node importance absolute value and grouping by TARGET. Values are rounded
+        # before ranking so that nodes whose importance only differs by floating point summation order share a rank
         global_graph_nodes[RANK] = (
-            global_graph_nodes.groupby([TARGET])[NODE_IMPORTANCE_ABS].rank(method='dense', ascending=False).astype(int))
+            global_graph_nodes[NODE_IMPORTANCE_ABS].round(decimals=10).groupby(global_graph_nodes[TARGET]).rank(
+                method='dense', ascending=False).astype(int))
 
         return global_graph_nodes
 
@@ -160,39 +201,16 @@ class ImportanceCalculator(metaclass=ABCMeta):
                                         associated to each target value
         :param feature_cols:            List of strings, containing the column names for the features
         :param target_cols:             List of strings, containing the column names for the target/s
-        :return:                        Pandas DataFrame, containing the mean of each feature importance for each target
+        :return:                        Pandas DataFrame, containing the mean of each feature importance for each
+                                        target. Target names are stored as a categorical column, whose categories are
+                                        sorted just like grouping by target would do
         """
         # For all samples from the global sampling the mean of the importance for each of their features are computed
         # by target
-        importance_values = np.abs(importance_values)
-        importances_mean_by_target = []
-        for idx, target_col in enumerate(target_cols):
-            importances_mean_by_target.append(np.mean(importance_values[:, :, idx], axis=0))
-
-        # Pandas DataFrame is built from the matrix and an additional column with the target names is prepended
-        df = pd.DataFrame(np.concatenate((np.array(target_cols).reshape(-1, 1),
-                                         np.stack(importances_mean_by_target, axis=0)), axis=1),
-                         columns=[TARGET] + feature_cols)
-        df[feature_cols] = df[feature_cols].apply(pd.to_numeric)
+        df = pd.DataFrame(np.abs(importance_values).mean(axis=0).T, columns=feature_cols)
+        df.insert(0, TARGET, pd.Categorical(target_cols, categories=sorted(target_cols)))
         return df
 
-    @staticmethod
-    def _sanity_check(ground_truth: np.ndarray, prediction: np.ndarray, target_cols: List[str], scope: str):
-        """
-        This function checks the consistency between each row ground truth and the prediction based on importance
-        calculation
-
-        :param ground_truth:    Numpy array, containing the ground truth for each row
-        :param prediction:      Numpy array, containing the importance based prediction for each row
-        :param target_cols:     List of strings, with all column names identified as target
-        :param scope:           String representing, the sanity check scope (original/aggregated), only used to format
-                                the output message
-        """
-        error = np.abs(ground_truth - prediction) > EPS_ERROR
-        for i, target_col in enumerate(target_cols):
-            print('INFO:     ImportanceCalculator: Number of detected discrepancies (original model prediction != LIDE '
-                  'prediction) for target {} in the {} dataset: {}'.format(target_col, scope, sum(error[:, i])))
-
     @staticmethod
     def sample_explanation(df_explanation: pd.DataFrame, sample_ids_mask_2_explain: np.ndarray) -> pd.DataFrame:
         """
@@ -221,7 +239,8 @@ class ImportanceCalculator(metaclass=ABCMeta):
         :param target_probs:    Numpy array, containing the probability for each target. It's used to calculate the
                                 ratio for each target
         :param target_cols:     List of strings, containing the possible targets
-        :param target_col:      String, representing the target col name (default: 'target')
+        :param target_col:      String, representing the target col name, no longer used since rows are grouped by
+                                target without adding a column to the DataFrame (default: 'target')
         :return:                Pandas DataFrame, containing the requested number of samples
         """
         # If the number of samples to be globally explained is greater or equal than the dataset size, there's no need
@@ -240,19 +259,11 @@ class ImportanceCalculator(metaclass=ABCMeta):
                   'Requested number of samples can be setup by means of the `num_samples_global_expl` parameter when '
                   'invoking the `explain()` method from the `Explainer` class'.format(num_samples))
 
-            # A target column is included in the given pandas DataFrame, this column will contain the top1 target
-            # for each row
-            df[target_col] = top1_targets
-
-            # For each possible target, rows are filtered by that target and the number of rows per target to retrieve
-            # is computed by using the target probability and the number of requested samples
-            df_agg_per_target = []
-            for target_prob, target_col_value in zip(target_probs, target_cols):
-                n_samples_by_target = int(num_samples * target_prob)
-                df_agg_per_target.append(df[df[target_col] == target_col_value].sample(
-                    n=n_samples_by_target, random_state=42))
-
-            return pd.concat(df_agg_per_target).drop(target_col, axis=1).sort_values(by=[ID])
+            # For each possible target, the number of rows per target to retrieve is computed by using the target
+            # probability and the number of requested samples
+            sample_indices = get_sample_indices_by_target(top1_targets=top1_targets, num_samples=num_samples,
+                                                          target_probs=target_probs, target_cols=target_cols)
+            return df.iloc[sample_indices].sort_values(by=[ID])
 
     def __global_explain(self, float_features: List[str], target_cols: List[str], importance_cols: List[str],
                          **params) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
@@ -285,10 +296,44 @@ class ImportanceCalculator(metaclass=ABCMeta):
             feature_cols=self._feature_cols,
             float_features=float_features,
             target_cols=target_cols,
-            importance_cols=importance_cols)
+            importance_cols=importance_cols,
+            encoding=self._encoding)
 
         return top1_importance_features, global_explainability, global_graph_nodes
 
+    def _sanity_check(self, ground_truth: np.ndarray, phi0: np.ndarray, importance: np.ndarray, scope: str,
+                      eps_error: float = EPS_ERROR):
+        """
+        This function checks the consistency between each row ground truth and the prediction based on importance
+        calculation, that is, phi0 plus the importance of every feature. Depending on the sanity check policy, every
+        row, a random sample of them (the same rows for every scope) or none of them are checked, so that the
+        prediction is only computed for the checked rows. Results are stored by scope (see `sanity_checks`)
+
+        :param ground_truth:    Numpy matrix, containing the ground truth for each row (n_samples x n_target_cols)
+        :param phi0:            Numpy matrix, containing phi0 for each row (n_samples x n_target_cols)
+        :param importance:      Numpy matrix, containing the importance for each row (n_samples x n_features x
+                                n_target_cols)
+        :param scope:           String representing, the sanity check scope (original/aggregated)
+        :param eps_error:       Float, representing the maximum difference not considered a discrepancy (default:
+                                EPS_ERROR)
+        """
+        if self._sanity_check_policy == SANITY_CHECK_OFF:
+            return
+        rows = slice(None)
+        if self._sanity_check_policy == SANITY_CHECK_SAMPLED and self._sanity_check_samples < len(ground_truth):
+            rng = np.random.default_rng(ImportanceCalculator._SANITY_CHECK_SEED)
+            rows = np.sort(rng.choice(len(ground_truth), size=self._sanity_check_samples, replace=False))
+        # The prediction is added up in float64, so that the error of the check itself is negligible whatever the dtype
+        error = np.abs(ground_truth[rows] - (phi0[rows] + importance[rows].sum(axis=1, dtype=np.float64)))
+        sanity_check = SanityCheck(num_checked=len(error),
+                                   num_discrepancies=np.count_nonzero(error > eps_error, axis=0),
+                                   max_abs_error=error.max(axis=0, initial=0.0))
+        self._sanity_checks[scope] = sanity_check
+        xgprint(self._verbose, 'INFO:     ImportanceCalculator: {} discrepancies (original model prediction != LIDE '
+                               'prediction) in {} checked samples of the {} dataset, max absolute error: {:.2e}'.format(
+                                   sanity_check.num_discrepancies.sum(), sanity_check.num_checked, scope,
+                                   sanity_check.max_abs_error.max(initial=0.0)))
+
     def calculate_importance(self, df: pd.DataFrame, features_info: FeaturesInfo, num_samples: int,
                              batch_size: int) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
         """
@@ -18,10 +18,14 @@ see https://www.gnu.org/licenses/."""
 
 from xaiographs.common.utils import xgprint
 from xaiographs.exgraph.importance.lide import LIDE
+from xaiographs.exgraph.importance.lide_adaptive import LIDEAdaptive
+from xaiographs.exgraph.importance.lide_sampled import LIDESampled
 
 
 class ImportanceCalculatorFactory(object):
     LIDE = 'LIDE'
+    LIDE_ADAPTIVE = 'LIDE_ADAPTIVE'
+    LIDE_SAMPLED = 'LIDE_SAMPLED'
 
     def __init__(self):
         """Importance Calculator factory class
@@ -43,6 +47,14 @@ class ImportanceCalculatorFactory(object):
             xgprint(importance_calculator_params['verbose'],
                     'INFO: {} importance calculator will be instantiated'.format(name))
             return LIDE(**importance_calculator_params)
+        elif name == self.LIDE_ADAPTIVE:
+            xgprint(importance_calculator_params['verbose'],
+                    'INFO: {} importance calculator will be instantiated'.format(name))
+            return LIDEAdaptive(**importance_calculator_params)
+        elif name == self.LIDE_SAMPLED:
+            xgprint(importance_calculator_params['verbose'],
+                    'INFO: {} importance calculator will be instantiated'.format(name))
+            return LIDESampled(**importance_calculator_params)
         else:
             print('ERROR:{} is not a valid importance calculator!!'.format(name))
             return None
@@ -16,8 +16,8 @@ You should have received a copy of the Affero GNU General Public License along w
 see https://www.gnu.org/licenses/."""
 
 
-from itertools import combinations
-from typing import Dict, List, Tuple, Union
+import os
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
@@ -25,9 +25,12 @@ import scipy
 from sklearn.model_selection import train_test_split
 from tqdm import tqdm
 
-from xaiographs.common.constants import ID, IMPORTANCE_SUFFIX, RELIABILITY
-from xaiographs.common.utils import TargetInfo, xgprint
-from xaiographs.exgraph.importance.importance_calculator import ImportanceCalculator
+from xaiographs.common.constants import ID
+from xaiographs.common.utils import FeatureEncoding, TargetInfo, get_encoded_features, get_importance_columns, \
+    get_reliability_columns, xgprint
+from xaiographs.exgraph.importance.coalitions_worth import aggregate_rows, compute_coalitions_worth, encode_features
+from xaiographs.exgraph.importance.importance_calculator import EPS_ERROR, SANITY_CHECK_FULL, SANITY_CHECK_SAMPLES, \
+    ImportanceCalculator
 
 
 class LIDE(ImportanceCalculator):
@@ -35,23 +38,54 @@ class LIDE(ImportanceCalculator):
     This class implements ImportanceCalculator based on the mathematical Shapley values formula
     """
     _COALITIONS = 'coalitions'
-    _COALITION_NAME_SEP = '_'
+    _COALITIONS_DATA = 'coalitions_data'
     _COALITIONS_WEIGHTS = 'coalitions_weights'
     _COALITIONS_WORTH = 'coalitions_worth'
     _DF_TO_EXPLAIN = 'df_to_explain'
-    _E = 'E'
     _EDGES = 'edges'
+    _LATTICE_AGGREGATION = 'lattice_aggregation'
+    _MIN_SUPPORT = 'min_support'
     _MODEL = 'model'
     _RES_DICT = 'res_dict'
+    _SANITY_CHECK = 'sanity_check'
+    _SANITY_CHECK_SAMPLES = 'sanity_check_samples'
+    _STREAMING = 'streaming'
+    _TEMPLATE_CACHE_PATH = 'template_cache_path'
+    _TEMPLATE_FILE = 'lide_template_v{}_{}.npz'
+    _TEMPLATE_VERSION = 1
+    _TEMPLATES = {}
     _WEIGHTS = 'weights'
 
     def __init__(self, explainer_params: Dict, feature_cols: List[str], target_info: TargetInfo,
-                 train_size: float = 0.0, train_stratify: bool = False, verbose: int = 0):
+                 train_size: float = 0.0, train_stratify: bool = False, verbose: int = 0, n_jobs: int = 1,
+                 dtype: np.dtype = np.float64, encoding: Optional[FeatureEncoding] = None):
         """
         Constructor method for LIDE ImportanceCalculator
 
         :param explainer_params:            Dictionary, containing potentially useful information for this importance
-                                            calculator
+                                            calculator. These are the supported keys:
+                                            - lattice_aggregation: Boolean, stating whether the train rows are first
+                                            aggregated into the full features table (one row per distinct combination
+                                            of features values), so that every coalition worth is derived from that
+                                            table instead of from the train rows. It pays off when the number of
+                                            distinct combinations is much lower than the number of rows (default:
+                                            False)
+                                            - min_support: Integer, representing the minimum number of train samples
+                                            of a coalition group for its worth to be used. Samples whose group is
+                                            smaller back off to the worth of the parent coalition, that is, the
+                                            coalition without its highest feature (default: 1, no back-off)
+                                            - sanity_check: String, representing the local accuracy sanity check
+                                            policy: 'full', 'sampled' or 'off' (default: 'full')
+                                            - sanity_check_samples: Integer, representing the number of samples
+                                            checked when sanity_check is 'sampled' (default: 1000)
+                                            - streaming: Boolean, stating whether coalitions worth is computed batch
+                                            by batch along with the importance, so that the whole coalitions worth
+                                            tensor (n_samples x n_coalitions x n_target_cols) is never kept in memory.
+                                            Results are the same, but train rows are aggregated once per batch
+                                            (default: False)
+                                            - template_cache_path: String, representing a directory where the
+                                            computational graphs will be persisted so that they can be reused by
+                                            other processes (default: None, they're only cached in memory)
         :param feature_cols:                List of strings, containing the column names for the features
         :param target_info:                 NamedTuple, containing a numpy array listing the top1 target for each
                                             DataFrame row, another numpy array listing a probability for each possible
@@ -61,230 +95,197 @@ class LIDE(ImportanceCalculator):
         :param train_stratify:              Boolean, indicating whether target columns proportions will be taken into
                                             account when splitting the data (if train_size > 0.0)
         :param verbose:                     Verbosity level, where any value greater than 0 means the message is printed
+        :param n_jobs:                      Integer, representing the number of processes used to compute the
+                                            coalitions worth. Negative values are relative to the number of CPUs (-1
+                                            means all of them)
+        :param dtype:                       Numpy dtype, used to store the coalitions worth and to compute the
+                                            importance (default: np.float64)
+        :param encoding:                    NamedTuple, containing the features encoded for the whole dataset, whose
+                                            codes are used instead of encoding the features again (default: None)
         """
         super(LIDE, self).__init__(feature_cols=feature_cols, target_info=target_info, train_size=train_size,
-                                   train_stratify=train_stratify, verbose=verbose)
+                                   train_stratify=train_stratify, verbose=verbose, dtype=dtype, encoding=encoding,
+                                   sanity_check=explainer_params.get(LIDE._SANITY_CHECK, SANITY_CHECK_FULL),
+                                   sanity_check_samples=explainer_params.get(LIDE._SANITY_CHECK_SAMPLES,
+                                                                             SANITY_CHECK_SAMPLES))
         self.explainer_params: Dict = explainer_params
+        self._n_jobs = n_jobs
 
     @staticmethod
-    def __build_coalitions_graph(num_features: int, verbose: int) -> Tuple[List[str], List[int], List[List[int]]]:
+    def __build_computational_graph(num_features: int, verbose: int = 0) -> Tuple[np.ndarray, np.ndarray]:
         """
-        This method is intended to build the so-called coalitions template which consists of: a list containing the
-        coalitions names, another list containing the coalitions identifiers (an integer which univocally identifies
-        each coalition) and a third structure which is a list of lists so that all the coalitions ids contained in each
-        sublist, belong to coalitions of the same length
-
-        :param num_features: Integer, representing the number of features for which coalitions will be built
-        :param verbose:      Verbosity level, where any value greater than 0 means the message is printed
-        :return:             Three structures:
-                             - List of strings, containing the coalitions names
-                             - List of integers, containing the coalitions ids
-                             - List of lists, so that all the coalitions ids contained in each sublist, belong to
-                             coalitions of the same length
-        """
-        # A list containing an integer to identify each coalition, they'll be sequentially generated
-        coalition_ids = []
-
-        # A list of lists. Each sublist contains all the ids of those coalitions of a given length. The first sublist
-        # the ids of those coalitions with length 0 (the empty coalition), the second the ids of those coalitions with
-        # length 1 and so forth
-        coalition_lengths = []
-
-        # A list containing the coalition names in terms of: 'E': empty coalition, '0': feature 0, '1': feature 1 ...
-        coalition_names = []
-        coalition_id = 0
-
-        # Features are listed by their position: from 0 to feature_num - 1
-        feature_list = [j for j in range(num_features)]
-
-        pbar = tqdm(range(num_features + 1), disable=not verbose)
-        pbar.set_description('INFO:     Coalitions template')
-        for i in pbar:
-            coalition_ids_by_length = []
-
-            # For all possible combinations of i features (from 0 to num_features)
-            for combination in list(combinations(feature_list, i)):
-                coalition_name = [LIDE._E]
-                for el in combination:
-                    coalition_name.append(str(el))
-                coalition_names.append(LIDE._COALITION_NAME_SEP.join(coalition_name))
-                coalition_ids_by_length.append(coalition_id)
-                coalition_ids.append(coalition_id)
-                coalition_id += 1
-            coalition_lengths.append(coalition_ids_by_length)
-
-        return coalition_names, coalition_ids, coalition_lengths
-
-    @staticmethod
-    def __build_computational_graph(features_num: int,
-                                    coalition_names: List[str],
-                                    coalition_lengths: List[List[int]],
-                                    verbose: int = 0) -> Tuple[np.ndarray, np.ndarray]:
-        """
-        This method builds the computational graph for each feature. It requires the list of coalition names and the
-        lists of coalitions ids grouped by their length in order to calculate the graph edges.
+        This method builds the computational graph for each feature. For a given feature `f`, every coalition `i` not
+        containing `f` (output node) is linked to the coalition `i ^ (1 << f)` (input node), which is the same coalition
+        plus the feature `f`. Each input node is reached from exactly one output node, so its degree is always 1 and the
+        edge weight is just the Shapley weight of the input coalition
 
-        :param features_num:        Integer, representing the number of features
-        :param coalition_names:     List of strings, containing the coalitions names
-        :param coalition_lengths:   List of lists of integers, containing for each possible coalition length, the
-                                    coalitions ids for those coalitions with the given length
+        :param num_features:        Integer, representing the number of features
         :param verbose:             Verbosity level, where any value greater than 0 means the message is printed
         :return:                    Tuple of numpy arrays in returned:
                                     - Numpy array, containing the edges for each feature. Edges are represented by a
-                                    list of output nodes and a list of input nodes (both per feature)
-                                    - Numpy array, containing the result of dividing the weights for each coalition by
-                                    the computed degree for the input coalitions
+                                    list of output nodes and a list of input nodes (both per feature), its shape is
+                                    (n_features x 2 x 2^(n_features - 1))
+                                    - Numpy array, containing the weights for the input coalitions of each edge, its
+                                    shape is (n_features x 2^(n_features - 1))
         """
-        # A weight is computed for each coalition
-        weights = np.expand_dims(np.expand_dims([1 if j == 0
-                                                 else 1 / (scipy.special.comb(features_num - 1,
-                                                                              len(name.split(
-                                                                                  LIDE._COALITION_NAME_SEP)) - 2) * (
-                                                               features_num)) for j, name in
-                                                 enumerate(coalition_names)], axis=0), axis=2)
-        edges_list = []
-        weights_list = []
-        pbar = tqdm(range(features_num), disable=not verbose)
+        coalition_ids = np.arange(2 ** num_features, dtype=np.int64)
+
+        # Coalition sizes (number of bits set) are required to compute the weights. The bit reversed coalition ids
+        # are used to sort coalitions of the same size according to the lexicographic order of their features
+        coalition_sizes = np.zeros(len(coalition_ids), dtype=np.int64)
+        reversed_ids = np.zeros(len(coalition_ids), dtype=np.int64)
+        for f in range(num_features):
+            coalition_sizes += (coalition_ids >> f) & 1
+            reversed_ids |= ((coalition_ids >> f) & 1) << (num_features - 1 - f)
+
+        # Edges are sorted by the size of their output node, so that importance is always accumulated in the same order
+        sorted_ids = coalition_ids[np.lexsort((-reversed_ids, coalition_sizes))]
+
+        edges = np.empty((num_features, 2, len(coalition_ids) // 2), dtype=np.int64)
+        pbar = tqdm(range(num_features), disable=not verbose)
         pbar.set_description('INFO:     Computational graph')
-        for pi in pbar:
-            f = str(pi)
-            edges = [[], []]
-            for i in range(1, len(coalition_lengths)):
-
-                # A list of the output (origin) nodes and another list with their corresponding input (destination)
-                # nodes are obtained for all the coalitions of the given length `i` and involving the given feature `f`
-                # For every output/input coalition pair, the output coalition won't contain the given feature `f` but
-                # the input coalition will
-                input_nodes, output_nodes = LIDE.__compute_edges(coalition_lengths=coalition_lengths,
-                                                                    coalition_names=coalition_names,
-                                                                    coalition_length=i, feature=f)
-                if len(input_nodes):
-                    edges[1].extend(input_nodes)
-                if len(output_nodes):
-                    edges[0].extend(output_nodes)
-            edges_list.append(edges)
-
-            # Weights are stored for the input nodes
-            weights_list.append(weights.squeeze()[edges[1]].tolist())
-        edges = np.array(edges_list)
-
-        degrees = []
-
-        # Degrees are computed for the input nodes
-        for i in range(edges.shape[0]):
-            degrees.append(LIDE.__get_degree(edges[i, 1, :]))
-        degrees = np.stack(degrees, axis=0)
-        filtered_degrees = []
-        for i in range(edges.shape[0]):
-            filtered_degrees.append(degrees[i, edges[i, 1, :]])
-        filtered_degrees = np.stack(filtered_degrees, axis=0)
-        return edges, np.array(weights_list)/filtered_degrees
+        for f in pbar:
+            # Output nodes are those coalitions not containing the feature `f`, their input nodes are obtained by
+            # flipping the feature bit
+            output_nodes = sorted_ids[((sorted_ids >> f) & 1) == 0]
+            edges[f, 0, :] = output_nodes
+            edges[f, 1, :] = output_nodes ^ (1 << f)
+
+        # A weight is computed for each input node, depending on the number of features of the coalition
+        weights = 1 / (scipy.special.comb(num_features - 1, coalition_sizes[edges[:, 1, :]] - 1) * num_features)
+
+        return edges, weights
 
     @staticmethod
-    def __build_features_graph(df_2_explain: pd.DataFrame, df_train: pd.DataFrame,
-                               target_cols: List[str], coalition_names: List[str], verbose: int = 0) -> np.ndarray:
+    def __build_features_graph(coalitions_data: Dict[str, np.ndarray], n_jobs: int = 1,
+                               dtype: np.dtype = np.float64, verbose: int = 0) -> np.ndarray:
         """
         This method computes for each coalitions features a target aggregation (averaging) by previously grouping by
         those features in the train DataFrame. The result is propagated to those samples to be explained whose features
-         values match the grouped features. This way the coalitions worth are computed
-
-        :param df_2_explain:    Pandas DataFrame, containing the samples to be explained
-        :param df_train:        Pandas DataFrame, containing the training dataset
-        :param target_cols:     List of strings, containing the possible targets
-        :param coalition_names: List of strings, containing the coalitions names
+         values match the grouped features. This way the coalitions worth are computed.
+        Features are encoded as integer codes only once, so that each coalition grouping is done by means of integer
+        keys instead of grouping and merging pandas DataFrames
+
+        :param coalitions_data: Dictionary, containing the encoded train and explain data (see
+                                `__encode_coalitions_data`)
+        :param n_jobs:          Integer, representing the number of processes used to compute the coalitions worth
+        :param dtype:           Numpy dtype of the coalitions worth
         :param verbose:         Verbosity level, where any value greater than 0 means the message is printed
-        :return:                Numpy matrix, containing the coalitions worth. For each sample to be explained a worth is
-                                calculated per coalition and per target (n_samples x n_coalitions x n_target_cols)
+        :return:                Numpy matrix, containing the coalitions worth. For each sample to be explained a worth
+                                is calculated per coalition and per target (n_samples x n_coalitions x n_target_cols)
         """
-        coalitions_worth = []
-        pbar = tqdm(range(len(coalition_names)), disable=not verbose)
-        pbar.set_description('INFO:     Coalition features')
-
-        # For each coalition its name will be processed
-        for i in pbar:
-            coalition_name = coalition_names[i]
-            coalition_features = coalition_name.split(LIDE._COALITION_NAME_SEP)
-
-            # Features list for that coalition are obtained
-            coalition_features.remove(LIDE._E)
-            if len(coalition_features) > 0:
-
-                # Aggregated targets are computed by grouping and averaging the coalition features on the
-                # train DataFrame. Then the DataFrame to be explained is joined on those features so that aggregated
-                # target is spread out to the samples to be explained
-                # coalition worths consists only of those aggregated targets
-                coalitions_worth.append(pd.merge(df_2_explain[[ID] + coalition_features],
-                                                 df_train.groupby(coalition_features)[target_cols].mean().reset_index(),
-                                                 on=coalition_features,
-                                                 how='inner').sort_values(by=[ID])[target_cols].values)
-            else:
+        # For each coalition, aggregated targets are computed by grouping and averaging the coalition features on the
+        # train DataFrame and then spread out to the samples to be explained. Coalition worths consist only of those
+        # aggregated targets
+        return compute_coalitions_worth(**coalitions_data, n_jobs=n_jobs, dtype=dtype, verbose=verbose)
+
+    @staticmethod
+    def __build_weight_matrix(graph_edges: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """
+        This method turns the computational graph into a matrix, so that importance can be computed as the product of
+        the coalitions worth and this matrix. For each feature, the input node of each edge adds its weight and the
+        output node subtracts it. Every coalition is either an input or an output node for each feature, so the matrix
+        is dense
 
-                # If the coalition being processed is the empty coalition (phi0), the target is aggregated throughout
-                # the whole train DataFrame
-                tmp = df_train[target_cols].mean().values
-                coalitions_worth.append(np.stack([tmp for _ in range(len(df_2_explain))], axis=0))
-        coalitions_worth = np.stack(coalitions_worth, axis=0).transpose(1, 0, 2)
+        :param graph_edges: Numpy array, containing the edges for each feature. Edges are represented by a list of
+                            output nodes and a list of input nodes (both per feature)
+        :param weights:     Numpy array, containing the weights for the input coalitions of each edge
+        :return:            Numpy matrix, containing the weight of each coalition for each feature (n_coalitions x
+                            n_features)
+        """
+        num_features = weights.shape[0]
+        weight_matrix = np.empty((2 * weights.shape[1], num_features))
+        for f in range(num_features):
+            weight_matrix[graph_edges[f, 1, :], f] = weights[f, :]
+            weight_matrix[graph_edges[f, 0, :], f] = -weights[f, :]
 
-        return coalitions_worth
+        return weight_matrix
 
     @staticmethod
-    def __compute_edges(coalition_lengths: List[List[int]], coalition_names: List[str], coalition_length: int,
-                        feature: str) -> Tuple[List[int], List[int]]:
+    def __encode_coalitions_data(df_2_explain: pd.DataFrame, df_train: pd.DataFrame, feature_cols: List[str],
+                                 target_cols: List[str], lattice_aggregation: bool = False, min_support: int = 1,
+                                 verbose: int = 0, feature_codes: Optional[Tuple[List[np.ndarray], np.ndarray]] = None
+                                 ) -> Dict[str, np.ndarray]:
         """
-        This method computes all possible edges for a given feature and a given coalition length. The rule to be
-        observed is that for the given feature, the output node for a valid edge can't contain the feature and the
-        input (destination) node, must contain it. Furthermore, the features conforming the output node coalition name
-         must be a subset of the features conforming the input node coalition name.
-         For example, for feature 0, these are valid edges (output_node -> input_node): E -> E_0, E_1 -> E_1_0,
-          E_2 -> E_2_0, E_1_2 -> E_0_1_2 ...
-
-        :param coalition_lengths:   List of lists of integers, containing for each possible coalition length, the
-                                    coalitions ids for those coalitions with the given length
-        :param coalition_names:     List of strings, containing the coalitions names
-        :param coalition_length:    Integer, representing the coalition length being processed
-        :param feature:             String, representing the feature being processed
-        :return:                    Tuple of two lists, representing edges:
-                                    - List of integers, containing the ids of the coalitions being a valid output node
-                                     for an edge.
-                                    - List of integers, containing the ids of the coalitions being a valid input node for
-                                    an edge
+        This method encodes the features of the train DataFrame and of the samples to be explained as integer codes,
+        which is all that's needed to compute the coalitions worth. If the features have already been encoded, the
+        given codes are used instead
+
+        :param df_2_explain:        Pandas DataFrame, containing the samples to be explained
+        :param df_train:            Pandas DataFrame, containing the training dataset
+        :param feature_cols:        List of strings, containing the column names for the features
+        :param target_cols:         List of strings, containing the possible targets
+        :param lattice_aggregation: Boolean, stating whether the train rows are aggregated into the full features table
+                                    (target sums and counts per distinct combination of features values)
+        :param min_support:         Integer, representing the minimum number of train samples of a group for its worth
+                                    to be used, otherwise the parent coalition worth is used
+        :param verbose:             Verbosity level, where any value greater than 0 means the message is printed
+        :param feature_codes:       Tuple containing a list with the codes of the train and explain DataFrames and the
+                                    features cardinalities, as returned by `encode_features` (default: None, the
+                                    features are encoded)
+        :return:                    Dictionary, containing the train codes and targets (or target sums), the row counts
+                                    (None unless `lattice_aggregation` is True), the features cardinalities, the codes
+                                    of the samples to be explained (query codes) and the minimum support
         """
-        input_nodes = []
-        output_nodes = []
-        for output_node in coalition_lengths[coalition_length - 1]:
-
-            # For an output node to be valid to be part of an edge, the processed feature can't be contained on its name
-            if feature in coalition_names[output_node].split(LIDE._COALITION_NAME_SEP):
-                continue
-            for input_node in coalition_lengths[coalition_length]:
-
-                # For an input node to be valid to be part of an edge, the processed feature must be contained on its
-                # name
-                if feature not in coalition_names[input_node].split(LIDE._COALITION_NAME_SEP):
-                    continue
-                if set(coalition_names[output_node].split(LIDE._COALITION_NAME_SEP)).issubset(
-                        set(coalition_names[input_node].split(LIDE._COALITION_NAME_SEP))):
-                    input_nodes.append(input_node)
-                    output_nodes.append(output_node)
-
-        return input_nodes, output_nodes
+        if feature_codes is None:
+            feature_codes = encode_features([df_train, df_2_explain], feature_cols)
+        (train_codes, explain_codes), cardinalities = feature_codes
+        train_targets, train_counts = df_train[target_cols].values, None
+        if lattice_aggregation:
+            # Train rows are scanned only once to build the full features table, every coalition is then derived from it
+            train_codes, train_targets, train_counts = aggregate_rows(train_codes, train_targets, cardinalities)
+            xgprint(verbose, 'INFO:     {} train rows aggregated into {} distinct features combinations'.format(
+                len(df_train), len(train_codes)))
+
+        return {'codes': train_codes, 'targets': train_targets, 'cardinalities': cardinalities,
+                'query_codes': explain_codes, 'row_counts': train_counts, 'min_support': min_support}
 
     @staticmethod
-    def __get_degree(a: np.ndarray) -> np.ndarray:
+    def __get_computational_graph(num_features: int, cache_path: str = None,
+                                  verbose: int = 0) -> Tuple[np.ndarray, np.ndarray]:
         """
-        This method computes the degrees for each element of the given numpy array of integers. The degree is actually
-        a count of each element appearances, absent elements will have a degree of 0. For instance, given the numpy
-        array [4, 2, 2, 2, 1] the degrees array will be [0, 1, 3, 0, 1]. Those numbers not present and less than the
-        maximum (4) are taken into account to compute the degrees (their degree is 0)
-
-        :param a:   Numpy array of integers, for which degrees will be computed
-        :return:    Numpy array of integers, containing the computed degrees for each of the integers of the given
-                    array, but also for those absent whose value is less than the maximum of the present elements
+        This method retrieves the computational graph for the given number of features. Since it only depends on the
+        number of features, once built it's cached in memory and, if a cache path is given, persisted on disk as well,
+        so that other processes can load it instead of building it. Cached graphs are keyed by the number of features
+        and the template format version, so that stale files are never loaded after a format change
+
+        :param num_features:    Integer, representing the number of features
+        :param cache_path:      String, representing the directory where computational graphs are persisted (None
+                                means computational graphs are only cached in memory)
+        :param verbose:         Verbosity level, where any value greater than 0 means the message is printed
+        :return:                Tuple of numpy arrays, containing the edges and the weights for each feature (see
+                                `__build_computational_graph` for details)
         """
-        values, counts = np.unique(a, return_counts=True)
-        degrees = np.zeros(np.max(a) + 1)
-        np.put(degrees, values, counts)
-        return degrees
+        template_key = (LIDE._TEMPLATE_VERSION, num_features)
+        if template_key in LIDE._TEMPLATES:
+            xgprint(verbose, 'INFO:     Computational graph retrieved from memory')
+            return LIDE._TEMPLATES[template_key]
+
+        template_file = None
+        if cache_path is not None:
+            template_file = os.path.join(cache_path, LIDE._TEMPLATE_FILE.format(*template_key))
+
+        if template_file is not None and os.path.exists(template_file):
+            xgprint(verbose, 'INFO:     Computational graph loaded from {}'.format(template_file))
+            with np.load(template_file) as template:
+                edges, weights = template[LIDE._EDGES], template[LIDE._WEIGHTS]
+        else:
+            edges, weights = LIDE.__build_computational_graph(num_features, verbose)
+            if template_file is not None:
+                # File is written under a temporary name and then renamed, so that concurrent processes never load a
+                # partially written template
+                os.makedirs(cache_path, exist_ok=True)
+                tmp_file = '{}.{}.tmp.npz'.format(template_file, os.getpid())
+                np.savez(tmp_file, **{LIDE._EDGES: edges, LIDE._WEIGHTS: weights})
+                os.replace(tmp_file, template_file)
+                xgprint(verbose, 'INFO:     Computational graph persisted to {}'.format(template_file))
+
+        # Cached arrays are shared among all the fits, so they're made read only
+        edges.flags.writeable = False
+        weights.flags.writeable = False
+        LIDE._TEMPLATES[template_key] = (edges, weights)
+
+        return edges, weights
 
     @staticmethod
     def __graph_importance(features: np.ndarray,
@@ -293,7 +294,8 @@ class LIDE(ImportanceCalculator):
                            batch_size: int,
                            verbose: int) -> np.ndarray:
         """
-        This method takes care of computing the importance. It uses a graph neural network for this purpose
+        This method takes care of computing the importance. It uses a graph neural network for this purpose, whose
+        single linear layer is applied to each batch as one matrix product
 
         :param features:    Numpy matrix, containing the coalitions worth. For each sample to be explained a worth is
                             calculated per coalition and per target
@@ -307,6 +309,10 @@ class LIDE(ImportanceCalculator):
         """
         tot_shap_values = []
 
+        # Importance is linear on the coalitions worth, so the computational graph is turned into a matrix with the
+        # weight of each coalition for each feature (number of coalitions x number of features)
+        weight_matrix = LIDE.__build_weight_matrix(graph_edges=graph_edges, weights=weights).astype(features.dtype)
+
         # Number of batches is calculated
         batch_num = features.shape[0] // batch_size
         if features.shape[0] % batch_size > 0:
@@ -314,23 +320,54 @@ class LIDE(ImportanceCalculator):
         pbar = tqdm(range(batch_num), disable=not verbose)
         pbar.set_description('Explanation')
         for n_batch in pbar:
-            shap_values = []
-            for f in range(weights.shape[0]):
-                # Batch shape is (batch_size x number of coalitions x number of target values)
-                batch = features[batch_size * n_batch:batch_size * (n_batch + 1), :, :]
-
-                # Shap value shape is (batch_size x number of target values)
-                shap_value = ((batch[:, graph_edges[f, 1, :], :] - batch[:, graph_edges[f, 0, :], :])
-                              * np.expand_dims(np.expand_dims(weights[f, :], axis=0), axis=2)).sum(axis=1)
-                shap_values.append(shap_value)
+            # Batch shape is (batch_size x number of coalitions x number of target values)
+            batch = features[batch_size * n_batch:batch_size * (n_batch + 1), :, :]
 
             # Shap values shape is (batch_size x number of features to explain x number of target values)
-            shap_values = np.stack(shap_values, axis=0).transpose(1, 0, 2)
+            shap_values = np.tensordot(batch, weight_matrix, axes=([1], [0])).transpose(0, 2, 1)
             tot_shap_values.append(shap_values)
 
         # Tot shap values shape is (num_samples_global_expl x number of features to explain x number of target values)
         return np.concatenate(tot_shap_values, axis=0)
 
+    @staticmethod
+    def __stream_importance(coalitions_data: Dict[str, np.ndarray], graph_edges: np.ndarray, weights: np.ndarray,
+                            batch_size: int, n_jobs: int, dtype: np.dtype,
+                            verbose: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        This method computes the importance batch by batch: the coalitions worth of each batch of samples to be
+        explained is computed and turned into importance right away, so that memory is bounded by the batch size instead
+        of the number of samples to be explained. Since the worth of a sample doesn't depend on the rest of samples, the
+        result is the same as computing the whole coalitions worth first
+
+        :param coalitions_data: Dictionary, containing the encoded train and explain data (see
+                                `__encode_coalitions_data`)
+        :param graph_edges:     Numpy array, containing the edges for each feature. Edges are represented by a list of
+                                output nodes and a list of input nodes (both per feature)
+        :param weights:         Numpy array, containing the weights for each coalition
+        :param batch_size:      Integer, representing the batch size to be used during importance calculation
+        :param n_jobs:          Integer, representing the number of processes used to compute the coalitions worth
+        :param dtype:           Numpy dtype, used to store the coalitions worth and to compute the importance
+        :param verbose:         Verbosity level, where any value greater than 0 means the message is printed
+        :return:                Tuple of numpy matrices, containing the calculated importance (n_samples x n_features x
+                                n_target_cols) and the worth of the empty and the full coalitions (n_samples x
+                                n_target_cols)
+        """
+        query_codes = coalitions_data['query_codes']
+        importance, empty_worth, full_worth = [], [], []
+        pbar = tqdm(range(0, len(query_codes), batch_size), disable=not verbose)
+        pbar.set_description('Explanation')
+        for start in pbar:
+            batch_data = dict(coalitions_data, query_codes=query_codes[start:start + batch_size])
+            coalitions_worth = LIDE.__build_features_graph(batch_data, n_jobs=n_jobs, dtype=dtype)
+            importance.append(LIDE.__graph_importance(features=coalitions_worth, graph_edges=graph_edges,
+                                                      weights=weights, batch_size=batch_size, verbose=0))
+            empty_worth.append(coalitions_worth[:, 0, :])
+            full_worth.append(coalitions_worth[:, -1, :])
+
+        return (np.concatenate(importance, axis=0), np.concatenate(empty_worth, axis=0),
+                np.concatenate(full_worth, axis=0))
+
     def local_explain(self, batch_size: int, **params) -> Dict[str, Union[pd.DataFrame, np.ndarray]]:
         """
         This method takes care of computing importance for the dataset to be explained (sampled during the train
@@ -348,6 +385,9 @@ class LIDE(ImportanceCalculator):
                             - coalitions_worth: Numpy matrix, containing the coalitions worth. For each sample to be
                                                 explained a worth is calculated per coalition and per target
                                                 (n_samples x n_coalitions x n_target_cols)
+                            - coalitions_data:  Dictionary, containing the encoded train and explain data. It replaces
+                                                coalitions_worth in streaming mode, so that coalitions worth is computed
+                                                batch by batch
                             - edges:            Numpy array, containing the edges for each feature. Edges are
                                                 represented by a list of output nodes and a list of input nodes (both
                                                  per feature)
@@ -361,82 +401,132 @@ class LIDE(ImportanceCalculator):
         """
         # Fifth step (continuing from train method), in this step importance is calculated. The result does have the
         # following shape (rows to explain x features x targets)
-        calculated_importance = self.__graph_importance(features=params[LIDE._COALITIONS_WORTH],
-                                                        graph_edges=params[LIDE._EDGES],
-                                                        weights=params[LIDE._WEIGHTS],
-                                                        batch_size=batch_size,
-                                                        verbose=self._verbose)
-
-        # In this sixth step, a consistency check is performed on local accuracy
-        #    a) coalitions_worth[:, 0, :] --> phi0 = E(targets | empty coalition)
-        phi0 = params[LIDE._COALITIONS_WORTH][:, 0, :]
-
-        #    b) coalitions_worth[:, -1, :] --> ground truth = E(targets | coalition to be justified)
-        y_hat: np.ndarray = phi0 + calculated_importance.sum(axis=1)
-        ImportanceCalculator._sanity_check(ground_truth=params[LIDE._COALITIONS_WORTH][:, -1, :],
-                                           prediction=y_hat,
-                                           target_cols=self._target_info.target_columns,
-                                           scope='aggregated')
+        calculated_importance, phi0, ground_truth = self._local_importance(batch_size=batch_size, params=params)
+
+        # In this sixth step, a consistency check is performed on local accuracy. The tolerance depends on the dtype
+        # used to compute the importance
+        eps_error = self._get_eps_error(num_features=len(self._feature_cols), dtype=self._dtype)
+        self._sanity_checks = {}
+        self._sanity_check(ground_truth=ground_truth, phi0=phi0, importance=calculated_importance, scope='aggregated',
+                           eps_error=eps_error)
+        y_hat: np.ndarray = phi0 + calculated_importance.sum(axis=1, dtype=np.float64)
 
         # Ground truth is retrieved
-        y: np.ndarray = params[LIDE._DF_TO_EXPLAIN][self._target_info.target_columns].values
+        y: np.ndarray = params[LIDE._DF_TO_EXPLAIN][self._target_info.target_columns].values.astype(self._dtype)
 
         # Difference between ground truth and predictions
-        reliability: np.ndarray = (y - y_hat)
+        reliability: np.ndarray = (y - y_hat).astype(self._dtype)
 
         # Adapted importance results from adding the calculated importance plus the reliability divided by the
         # number of features
         adapted_importance: np.ndarray = calculated_importance + np.expand_dims(reliability /
                                                                                 calculated_importance.shape[1], axis=1)
-        reshaped_adapted_importance = adapted_importance.reshape(adapted_importance.shape[0], -1)
 
-        df_explanation = params[LIDE._DF_TO_EXPLAIN].rename(columns={str(k): v for k, v in
-                                                                        enumerate(self._feature_cols)})
-        del params[LIDE._DF_TO_EXPLAIN]
-
-        importance_columns = []
-        for c in self._feature_cols:
-            for target_col in self._target_info.target_columns:
-                importance_columns.append('{}_{}{}'.format(target_col, c, IMPORTANCE_SUFFIX))
+        df_explanation = params.pop(LIDE._DF_TO_EXPLAIN).rename(
+            columns={str(k): v for k, v in enumerate(self._feature_cols)})
 
+        # Importance columns are sorted by feature and then by target, just like the importance tensor once it's
+        # reshaped, so that the importance and reliability columns are appended as a single block
         # TODO: Chequear para el target top1 que PHI0 + adapted shapley es mayor que 0 para cada ID
-        for i, c in enumerate(importance_columns):
-            df_explanation[c] = reshaped_adapted_importance[:, i]
-
-        for j, target_col in enumerate(self._target_info.target_columns):
-            reliability_column = '{}_{}'.format(target_col, RELIABILITY)
-            df_explanation[reliability_column] = reliability[:, j]
-
-        # Data is formatted for the sanity check
-        y_hat_reduced = phi0 + np.sum(df_explanation[importance_columns].values.reshape(-1, adapted_importance.shape[1],
-                                                                                        adapted_importance.shape[2]),
-                                      axis=1)
-        ImportanceCalculator._sanity_check(ground_truth=y, prediction=y_hat_reduced,
-                                           target_cols=self._target_info.target_columns, scope='original')
+        explanation_columns = (get_importance_columns(feature_cols=self._feature_cols,
+                                                      target_cols=self._target_info.target_columns) +
+                               get_reliability_columns(target_cols=self._target_info.target_columns))
+        explanation_values = np.concatenate((adapted_importance.reshape(len(adapted_importance), -1), reliability),
+                                            axis=1)
+        df_explanation = pd.concat([df_explanation, pd.DataFrame(explanation_values, columns=explanation_columns,
+                                                                 index=df_explanation.index)], axis=1)
+
+        # The sanity check is performed on the adapted importance
+        self._sanity_check(ground_truth=y, phi0=phi0, importance=adapted_importance, scope='original',
+                           eps_error=eps_error)
         return {
            ImportanceCalculator._DF_EXPLANATION_IC: df_explanation,
            ImportanceCalculator._IMPORTANCE_VALUES_IC: adapted_importance
         }
 
-    def train(self, df: pd.DataFrame,
-              num_samples_to_explain: int) -> Dict[str, Union[pd.DataFrame, np.ndarray]]:
+    @staticmethod
+    def _get_eps_error(num_features: int, dtype: np.dtype) -> float:
         """
-        This method takes care of the train part which ends up in the coalitions worth being calculated. Before this,
-        the coalitions template and the computational graph are built.
+        This method computes the tolerance of the local accuracy sanity checks for the given dtype. Targets are one-hot
+        encoded, so every coalition worth lies in [0, 1]. For each feature, the absolute weights of the coalitions add
+        up to 2, so storing the coalitions worth with unit roundoff u adds an error of at most 2u per feature, and
+        accumulating the 2^n weighted worths adds at most 2 * 2^n * u (first order bound of a dot product). Adding up
+        the n importance values and phi0 adds at most (n + 1) * (2n + 1) * u and the ground truth itself is stored with
+        an error of at most u. Hence the additivity error (versus exact arithmetic and thus versus float64) is bounded
+        by:
+            (2n * (2^n + 1) + (n + 1) * (2n + 1) + 1) * u
+        which is about 2.5e-4 for 8 features in float32 (u = 2^-24) and negligible in float64. The tolerance is never
+        lower than EPS_ERROR
+
+        :param num_features:    Integer, representing the number of features
+        :param dtype:           Numpy dtype, used to compute the importance
+        :return:                Float, representing the tolerance of the sanity checks
+        """
+        unit_roundoff = np.finfo(dtype).eps / 2
+        error_bound = (2 * num_features * (2 ** num_features + 1) + (num_features + 1) * (2 * num_features + 1) + 1) \
+            * unit_roundoff
+        return max(EPS_ERROR, float(error_bound))
+
+    @staticmethod
+    def _get_weight_matrix(num_features: int, cache_path: str = None, verbose: int = 0) -> np.ndarray:
+        """
+        This method retrieves the weight matrix for the given number of features, which turns the coalitions worth
+        into importance with a single matrix product (see `__build_weight_matrix`)
+
+        :param num_features:    Integer, representing the number of features
+        :param cache_path:      String, representing the directory where computational graphs are persisted (None
+                                means computational graphs are only cached in memory)
+        :param verbose:         Verbosity level, where any value greater than 0 means the message is printed
+        :return:                Numpy matrix, containing the weight of each coalition for each feature (n_coalitions x
+                                n_features)
+        """
+        graph_edges, weights = LIDE.__get_computational_graph(num_features=num_features, cache_path=cache_path,
+                                                              verbose=verbose)
+        return LIDE.__build_weight_matrix(graph_edges=graph_edges, weights=weights)
+
+    def _local_importance(self, batch_size: int,
+                          params: Dict[str, Union[pd.DataFrame, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray,
+                                                                                       np.ndarray]:
+        """
+        This method computes the importance of each feature for the samples to be explained, along with the worth of
+        the empty coalition (phi0) and the worth of the coalition containing all the features (ground truth) for those
+        samples, which are used to check the local accuracy
+
+        :param batch_size:  Integer, representing the size of the batches (chunks) on which importance will be
+                            calculated
+        :param params:      Dictionary, containing the output of the train method
+        :return:            Tuple of numpy matrices, containing the calculated importance (n_samples x n_features x
+                            n_target_cols), phi0 and the ground truth (both n_samples x n_target_cols)
+        """
+        if LIDE._COALITIONS_DATA in params:
+            calculated_importance, phi0, ground_truth = self.__stream_importance(
+                coalitions_data=params[LIDE._COALITIONS_DATA], graph_edges=params[LIDE._EDGES],
+                weights=params[LIDE._WEIGHTS], batch_size=batch_size, n_jobs=self._n_jobs, dtype=self._dtype,
+                verbose=self._verbose)
+        else:
+            calculated_importance = self.__graph_importance(features=params[LIDE._COALITIONS_WORTH],
+                                                            graph_edges=params[LIDE._EDGES],
+                                                            weights=params[LIDE._WEIGHTS],
+                                                            batch_size=batch_size,
+                                                            verbose=self._verbose)
+
+            #    a) coalitions_worth[:, 0, :] --> phi0 = E(targets | empty coalition)
+            #    b) coalitions_worth[:, -1, :] --> ground truth = E(targets | coalition to be justified)
+            phi0 = params[LIDE._COALITIONS_WORTH][:, 0, :]
+            ground_truth = params[LIDE._COALITIONS_WORTH][:, -1, :]
+
+        return calculated_importance, phi0, ground_truth
+
+    def _prepare_coalitions_data(self, df: pd.DataFrame,
+                                 num_samples_to_explain: int) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
+        """
+        This method splits the train DataFrame, samples the DataFrame to be explained and encodes both of them so that
+        coalitions worth can be computed. Feature columns are renamed after their position
 
         :param df:                      Pandas DataFrame, containing the loaded dataset with the selected features
         :param num_samples_to_explain:  Integer, representing the number of samples to be (globally) explained
-
-        :return:                        Dictionary containing four elements:
-                                        - df_to_explain:    Pandas DataFrame, consisting of a sample of the train pandas
-                                                            DataFrame
-                                        - coalitions_worth: Numpy matrix, containing the coalitions worth. For each
-                                                            sample to be explained a worth is calculated per coalition
-                                                             and per target (n_samples x n_coalitions x n_target_cols)
-                                        - edges:            Numpy array, containing the edges for each feature. Edges
-                                                            are represented by a list of output nodes and a list of
-                                                            input nodes (both per feature)
-                                        - weights:          Numpy array, containing the weights for each coalition
+        :return:                        Tuple containing the pandas DataFrame to be explained and a dictionary with the
+                                        encoded train and explain data (see `__encode_coalitions_data`)
         """
         if self._train_size > 0.0:
             xgprint(self._verbose, 'INFO:          train_size: {}'.format(self._train_size))
@@ -450,9 +540,12 @@ class LIDE(ImportanceCalculator):
         else:
             xgprint(self._verbose, 'INFO:          the whole dataset will be used to train')
             df_train = df.copy()
+        train_codes = None
+        if self._encoding is not None:
+            train_codes = get_encoded_features(encoding=self._encoding, df=df_train, feature_cols=self._feature_cols)
         df_train.drop(ID, axis=1, inplace=True)
 
-        # First step consists of retrieving the number of samples to be globally explained
+        # The samples to be globally explained are retrieved
         xgprint(self._verbose, 'INFO:          sampling the dataset to be globally explained: {} samples will be '
                                'used ...'.
                 format(num_samples_to_explain))
@@ -460,28 +553,76 @@ class LIDE(ImportanceCalculator):
                                                           num_samples=num_samples_to_explain,
                                                           target_probs=self._target_info.target_probs,
                                                           target_cols=self._target_info.target_columns)
-        del df
 
-        # Second step is to build the coalitions template and setup an order
-        num_features = len(self._feature_cols)
-        coalition_names, coalition_ids, coalition_lengths = self.__build_coalitions_graph(num_features, self._verbose)
+        feature_codes = None
+        if train_codes is not None:
+            explain_codes, cardinalities = get_encoded_features(encoding=self._encoding, df=df_2_explain,
+                                                                feature_cols=self._feature_cols)
+            feature_codes = ([train_codes[0], explain_codes], cardinalities)
 
-        # Third step is to build computational graphs, there'll be one per feature
-        # node_names = E, E_0, E_1, E_2, E_0_1, E_0_2, E_1_2, E_0_1_2
-        # shapley var = 0 --> [[E, E_1, E_2, E_1_2], [E_0, E_0_1, E_0_2, E_0_1_2]]
-        # shapley var = 1 --> [[E, E_0, E_2, E_0_2], [E_1, E_0_1, E_1_2, E_0_1_2]]
-        # shapley var = 2 --> [[E, E_0, E_1, E_1_2], [E_2, E_0_2, E_1_2, E_0_1_2]]
-        # edges = [ [[E, E_1, E_2, E_1_2], [E_0, E_0_1, E_0_2, E_0_1_2]],
-        #           [[E, E_0, E_2, E_0_2], [E_1, E_0_1, E_1_2, E_0_1_2]],
-        #           [[E, E_0, E_1, E_1_2], [E_2, E_0_2, E_1_2, E_0_1_2]]]
-        edges, weights = self.__build_computational_graph(num_features, coalition_names, coalition_lengths,
-                                                          self._verbose)
-
-        # Fourth step consists of computing the coalitions worth
+        num_features = len(self._feature_cols)
         df_train = df_train.rename(columns={v: str(k) for k, v in enumerate(self._feature_cols)})
         df_2_explain = df_2_explain.rename(columns={v: str(k) for k, v in enumerate(self._feature_cols)})
-        coalitions_worth = self.__build_features_graph(df_2_explain, df_train, self._target_info.target_columns,
-                                                       coalition_names, self._verbose)
+        coalitions_data = self.__encode_coalitions_data(df_2_explain, df_train, [str(k) for k in range(num_features)],
+                                                        self._target_info.target_columns,
+                                                        self.explainer_params.get(LIDE._LATTICE_AGGREGATION, False),
+                                                        self.explainer_params.get(LIDE._MIN_SUPPORT, 1), self._verbose,
+                                                        feature_codes)
+
+        return df_2_explain, coalitions_data
+
+    def train(self, df: pd.DataFrame,
+              num_samples_to_explain: int) -> Dict[str, Union[pd.DataFrame, np.ndarray]]:
+        """
+        This method takes care of the train part which ends up in the coalitions worth being calculated. Before this,
+        the coalitions template and the computational graph are built.
+
+        :param df:                      Pandas DataFrame, containing the loaded dataset with the selected features
+        :param num_samples_to_explain:  Integer, representing the number of samples to be (globally) explained
+
+        :return:                        Dictionary containing four elements:
+                                        - df_to_explain:    Pandas DataFrame, consisting of a sample of the train pandas
+                                                            DataFrame
+                                        - coalitions_worth: Numpy matrix, containing the coalitions worth. For each
+                                                            sample to be explained a worth is calculated per coalition
+                                                             and per target (n_samples x n_coalitions x n_target_cols)
+                                        - edges:            Numpy array, containing the edges for each feature. Edges
+                                                            are represented by a list of output nodes and a list of
+                                                            input nodes (both per feature)
+                                        - weights:          Numpy array, containing the weights for each coalition
+        """
+        # First step consists of retrieving the number of samples to be globally explained and encoding them along with
+        # the train DataFrame
+        df_2_explain, coalitions_data = self._prepare_coalitions_data(df=df,
+                                                                      num_samples_to_explain=num_samples_to_explain)
+
+        # Second step is to setup the coalitions order. Coalitions are represented as integer bitmasks, so that the
+        # coalition `i` contains the feature `f` if and only if the bit `f` of `i` is set. This way the empty coalition
+        # is always the first one and the coalition containing all the features is always the last one
+        # coalition_ids = 0 (E), 1 (E_0), 2 (E_1), 3 (E_0_1), 4 (E_2), 5 (E_0_2), 6 (E_1_2), 7 (E_0_1_2)
+        num_features = len(self._feature_cols)
+
+        # Third step is to build computational graphs, there'll be one per feature
+        # shapley var = 0 --> [[0, 2, 4, 6], [1, 3, 5, 7]]
+        # shapley var = 1 --> [[0, 1, 4, 5], [2, 3, 6, 7]]
+        # shapley var = 2 --> [[0, 1, 2, 3], [4, 5, 6, 7]]
+        # edges = [ [[0, 2, 4, 6], [1, 3, 5, 7]],
+        #           [[0, 1, 4, 5], [2, 3, 6, 7]],
+        #           [[0, 1, 2, 3], [4, 5, 6, 7]]]
+        edges, weights = self.__get_computational_graph(num_features,
+                                                        self.explainer_params.get(LIDE._TEMPLATE_CACHE_PATH),
+                                                        self._verbose)
+
+        # Fourth step consists of computing the coalitions worth. In streaming mode, only the encoded data is kept so
+        # that coalitions worth is computed batch by batch during the local explanation
+        if self.explainer_params.get(LIDE._STREAMING, False):
+            return {
+                LIDE._DF_TO_EXPLAIN: df_2_explain,
+                LIDE._COALITIONS_DATA: coalitions_data,
+                LIDE._EDGES: edges,
+                LIDE._WEIGHTS: weights
+            }
+        coalitions_worth = self.__build_features_graph(coalitions_data, self._n_jobs, self._dtype, self._verbose)
 
         return {
             LIDE._DF_TO_EXPLAIN: df_2_explain,
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from xaiographs.common.utils import FeatureEncoding, TargetInfo, xgprint
+from xaiographs.exgraph.importance.lide import LIDE
+from xaiographs.exgraph.importance.lide_sampled import LIDESampled
+
+
+class LIDEAdaptive(LIDESampled):
+    """
+    This class implements ImportanceCalculator by estimating the same Shapley values as LIDE from features permutations
+    which are sampled until the standard error of every importance value falls below a given tolerance or a time budget
+    is exhausted. Permutations are sampled in stratified and antithetic blocks in order to reduce the variance of the
+    estimation, and samples whose importance has already converged are no longer refined
+    """
+    _DEFAULT_TIME_BUDGET = 60.0
+    _DEFAULT_TOLERANCE = 0.01
+    _MIN_BLOCKS = 4
+    _TIME_BUDGET = 'time_budget'
+    _TOLERANCE = 'tolerance'
+
+    def __init__(self, explainer_params: Dict, feature_cols: List[str], target_info: TargetInfo,
+                 train_size: float = 0.0, train_stratify: bool = False, verbose: int = 0, n_jobs: int = 1,
+                 dtype: np.dtype = np.float64, encoding: Optional[FeatureEncoding] = None):
+        """
+        Constructor method for LIDEAdaptive ImportanceCalculator
+
+        :param explainer_params:            Dictionary, containing potentially useful information for this importance
+                                            calculator. These are the supported keys:
+                                            - lattice_aggregation: Boolean, stating whether the train rows are first
+                                            aggregated into the full features table (default: False)
+                                            - min_support: Integer, representing the minimum number of train samples
+                                            of a coalition group for its worth to be used. Samples whose group is
+                                            smaller back off to the worth of the previous coalition of the
+                                            permutation (default: 1, no back-off)
+                                            - sanity_check: String, representing the local accuracy sanity check
+                                            policy: 'full', 'sampled' or 'off' (default: 'full')
+                                            - sanity_check_samples: Integer, representing the number of samples
+                                            checked when sanity_check is 'sampled' (default: 1000)
+                                            - seed: Integer, representing the seed used to sample the permutations
+                                            (default: 42)
+                                            - time_budget: Float, representing the maximum number of seconds spent
+                                            sampling permutations, checked after each of them (default: 60.0)
+                                            - tolerance: Float, representing the standard error below which an
+                                            importance value is considered to have converged (default: 0.01)
+        :param feature_cols:                List of strings, containing the column names for the features
+        :param target_info:                 NamedTuple, containing a numpy array listing the top1 target for each
+                                            DataFrame row, another numpy array listing a probability for each possible
+                                            target value and a third numpy array showing the top1 targets indexes
+        :param train_size:                  Float, indicating the percentage of the pandas DataFrame that will be used
+                                            to train the calculator
+        :param train_stratify:              Boolean, indicating whether target columns proportions will be taken into
+                                            account when splitting the data (if train_size > 0.0)
+        :param verbose:                     Verbosity level, where any value greater than 0 means the message is printed
+        :param n_jobs:                      Integer, not used by this importance calculator
+        :param dtype:                       Numpy dtype, used to store the importance (default: np.float64)
+        :param encoding:                    NamedTuple, containing the features encoded for the whole dataset, whose
+                                            codes are used instead of encoding the features again (default: None)
+        """
+        super(LIDEAdaptive, self).__init__(explainer_params=explainer_params, feature_cols=feature_cols,
+                                           target_info=target_info, train_size=train_size,
+                                           train_stratify=train_stratify, verbose=verbose, n_jobs=n_jobs, dtype=dtype,
+                                           encoding=encoding)
+        self._num_permutations = None
+
+    @property
+    def num_permutations(self):
+        """
+        Property that returns a Numpy array containing the number of permutations sampled for each sample to be
+        explained. Prior to invoking this property, the `local_explain()` method must have been invoked
+
+        :return: np.ndarray, with the number of permutations sampled for each sample
+        """
+        return self._num_permutations
+
+    @staticmethod
+    def __sample_block(rng: np.random.Generator, num_features: int) -> np.ndarray:
+        """
+        This method samples a block of permutations. The block is made of the cyclic shifts of a random permutation,
+        so that each feature is found exactly once at each position and hence its marginal contribution is computed
+        once for every coalition size (stratification), along with the reverse of each of them, which places the
+        features preceding each feature after it (antithetic permutations)
+
+        :param rng:             Numpy random Generator, used to sample the permutation
+        :param num_features:    Integer, representing the number of features
+        :return:                Numpy matrix of integers, containing a permutation of the features per row
+                                (2 * n_features x n_features)
+        """
+        permutation = rng.permutation(num_features)
+        shifts = (np.arange(num_features).reshape(-1, 1) + np.arange(num_features).reshape(1, -1)) % num_features
+        block = permutation[shifts]
+        return np.concatenate([block, block[:, ::-1]])
+
+    def _local_importance(self, batch_size: int,
+                          params: Dict[str, Union[pd.DataFrame, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray,
+                                                                                       np.ndarray]:
+        """
+        This method estimates the importance of each feature for the samples to be explained. Blocks of permutations
+        are sampled (see `__sample_block`) and the mean of the marginal contributions throughout each block is taken as
+        a single observation, so that the standard error is estimated across blocks. After each block, the samples for
+        which the standard error of every importance value is below the tolerance are no longer refined. Sampling stops
+        once every sample has converged or the time budget is exhausted. The clock is checked after each permutation, so
+        the budget is exceeded by a single chain at most, and the unfinished block is dropped unless it's the first one
+
+        :param batch_size:  Integer, not used since the memory needed doesn't depend on the number of coalitions
+        :param params:      Dictionary, containing the output of the train method
+        :return:            Tuple of numpy matrices, containing the estimated importance (n_samples x n_features x
+                            n_target_cols), phi0 and the ground truth (both n_samples x n_target_cols)
+        """
+        start = time.monotonic()
+        coalitions_data = params[LIDE._COALITIONS_DATA]
+        all_query_codes = coalitions_data['query_codes']
+        codes = np.asfortranarray(coalitions_data['codes'])
+        targets = np.asfortranarray(coalitions_data['targets'], dtype=np.float64)
+        num_samples, num_features = all_query_codes.shape
+        tolerance = self.explainer_params.get(LIDEAdaptive._TOLERANCE, LIDEAdaptive._DEFAULT_TOLERANCE)
+        time_budget = self.explainer_params.get(LIDEAdaptive._TIME_BUDGET, LIDEAdaptive._DEFAULT_TIME_BUDGET)
+        rng = np.random.default_rng(self.explainer_params.get(LIDESampled._SEED, LIDESampled._DEFAULT_SEED))
+
+        # Mean and sum of squared deviations of the block means are updated with each block (Welford)
+        shape = (num_samples, num_features, targets.shape[1])
+        mean, squared_deviations = np.zeros(shape), np.zeros(shape)
+        std_errors = np.full(shape, np.nan)
+        num_blocks = np.zeros(num_samples, dtype=np.int64)
+        num_permutations = np.zeros(num_samples, dtype=np.int64)
+        active = np.arange(num_samples)
+        phi0 = ground_truth = None
+        budget_exhausted = False
+        pbar = tqdm(total=num_samples, disable=not self._verbose)
+        pbar.set_description('Explanation')
+        while len(active) > 0 and not budget_exhausted:
+            query_codes = np.asfortranarray(all_query_codes[active])
+            contributions = np.empty((len(active),) + shape[1:])
+            block_mean = np.zeros((len(active),) + shape[1:])
+            block = self.__sample_block(rng=rng, num_features=num_features)
+            num_chains = 0
+            for permutation in block:
+                chain_phi0, chain_ground_truth = self._chain_contributions(coalitions_data=coalitions_data,
+                                                                           codes=codes, targets=targets,
+                                                                           query_codes=query_codes,
+                                                                           permutation=permutation,
+                                                                           contributions=contributions)
+                block_mean += contributions
+                num_chains += 1
+                if time.monotonic() - start > time_budget:
+                    budget_exhausted = True
+                    break
+
+            # An unfinished block is dropped, unless it's the first one: every chain is a uniformly sampled
+            # permutation, so the mean of the chains computed so far is still an estimate of the importance
+            if num_chains < len(block) and phi0 is not None:
+                break
+            block_mean /= num_chains
+
+            # All the samples are active while the first block is sampled
+            if phi0 is None:
+                phi0, ground_truth = chain_phi0, chain_ground_truth
+            num_blocks[active] += 1
+            num_permutations[active] += num_chains
+            k = num_blocks[active].reshape(-1, 1, 1)
+            delta = block_mean - mean[active]
+            mean[active] += delta / k
+            squared_deviations[active] += delta * (block_mean - mean[active])
+
+            if k[0, 0, 0] >= LIDEAdaptive._MIN_BLOCKS:
+                std_errors[active] = np.sqrt(squared_deviations[active] / (k - 1) / k)
+                converged = np.max(std_errors[active], axis=(1, 2)) < tolerance
+                pbar.update(np.count_nonzero(converged))
+                active = active[~converged]
+        pbar.close()
+
+        self._importance_std_errors = std_errors.astype(self._dtype)
+        self._num_permutations = num_permutations
+        xgprint(self._verbose, 'INFO:     Importance estimated from {} to {} permutations per sample in {:.1f} '
+                               'seconds, {} out of {} samples converged'.format(
+                                   self._num_permutations.min(), self._num_permutations.max(),
+                                   time.monotonic() - start, num_samples - len(active), num_samples))
+        if len(active) > 0:
+            xgprint(self._verbose, 'WARN:     Time budget exhausted before reaching the tolerance for {} samples, '
+                                   'increase `time_budget` to refine them'.format(len(active)))
+
+        return mean.astype(self._dtype), phi0.astype(self._dtype), ground_truth.astype(self._dtype)
@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+import os
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from xaiographs.common.utils import xgprint
+from xaiographs.exgraph.importance.coalitions_worth import aggregate_rows
+from xaiographs.exgraph.importance.lide import LIDE
+
+
+class LIDEModel(object):
+    """
+    This class holds the coalition lookup tables fitted by LIDE: for each coalition, the sum of the targets and the
+    number of train rows for each combination of values of its features. Once fitted, the model can be persisted and
+    reloaded in another process, and new rows are explained by looking up their coalitions worth, so that the train
+    dataset is never scanned again
+    """
+    _CATEGORIES = 'categories'
+    _CATEGORY_OFFSETS = 'category_offsets'
+    _COUNTS = 'counts'
+    _EPS_COUNT = 1e-9
+    _FEATURE_COLS = 'feature_cols'
+    _KEYS = 'keys'
+    _MIN_SUPPORT = 'min_support'
+    _MODEL_VERSION = 2
+    _SUMS = 'sums'
+    _TABLE_OFFSETS = 'table_offsets'
+    _TARGET_COLS = 'target_cols'
+    _SUPPORTED_VERSIONS = (1, 2)
+    _VERSION = 'version'
+
+    def __init__(self, feature_cols: List[str], target_cols: List[str], categories: List[np.ndarray],
+                 table_offsets: np.ndarray, keys: np.ndarray, sums: np.ndarray, counts: np.ndarray,
+                 min_support: int = 1):
+        """
+        Constructor method for LIDEModel. Models are meant to be built by means of the `fit()` and `load()` methods
+
+        :param feature_cols:    List of strings, containing the column names for the features
+        :param target_cols:     List of strings, containing the column names for the targets
+        :param categories:      List of numpy arrays of strings, containing the values of each feature, so that the
+                                code of a value is its position
+        :param table_offsets:   Numpy array of integers, containing the position of the first entry of each coalition
+                                table, plus the total number of entries (n_coalitions + 1)
+        :param keys:            Numpy array of integers, containing the key of the features values of each entry, sorted
+                                within each coalition table (n_entries)
+        :param sums:            Numpy matrix, containing the sum of the targets of each entry (n_entries x n_targets)
+        :param counts:          Numpy array, containing the number of train rows of each entry (n_entries)
+        :param min_support:     Integer, representing the minimum number of train rows of the entries kept in the
+                                tables (default: 1, every entry is kept)
+        """
+        self.__feature_cols = list(feature_cols)
+        self.__target_cols = list(target_cols)
+        self.__categories = categories
+        self.__table_offsets = table_offsets
+        self.__keys = keys
+        self.__sums = sums
+        self.__counts = counts
+        self.__min_support = min_support
+        self.__strides = LIDEModel.__get_strides(np.array([len(c) for c in categories], dtype=np.int64))
+
+    @property
+    def categories(self):
+        """
+        Property that returns the values of each feature, so that the code of a value is its position
+
+        :return: List of numpy arrays of strings, containing the values of each feature
+        """
+        return self.__categories
+
+    @property
+    def feature_cols(self):
+        """
+        Property that returns the column names of the features, in the order in which they are encoded
+
+        :return: List of strings, containing the column names for the features
+        """
+        return self.__feature_cols
+
+    @property
+    def min_support(self):
+        """
+        Property that returns the minimum number of train rows of the entries kept in the tables. Rows whose coalition
+        entry is missing back off to the worth of its parent coalition when it's greater than 1
+
+        :return: Integer, representing the minimum support
+        """
+        return self.__min_support
+
+    @property
+    def phi0(self):
+        """
+        Property that returns the worth of the empty coalition, that is, the mean of each target in the train dataset
+
+        :return: np.ndarray, containing the mean of each target (n_targets)
+        """
+        return self.__sums[0] / self.__counts[0]
+
+    @property
+    def target_cols(self):
+        """
+        Property that returns the column names of the targets
+
+        :return: List of strings, containing the column names for the targets
+        """
+        return self.__target_cols
+
+    @staticmethod
+    def __build_tables(codes: np.ndarray, targets: np.ndarray, cardinalities: np.ndarray, strides: np.ndarray,
+                       verbose: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        This method builds the coalition lookup tables of the given rows. Rows are first aggregated into the full
+        features table, and every coalition table is then derived from it
+
+        :param codes:           Numpy matrix of integers, containing the encoded features of the rows (n_rows x
+                                n_features)
+        :param targets:         Numpy matrix, containing the targets for those rows (n_rows x n_targets)
+        :param cardinalities:   Numpy array of integers, containing the number of different values of each feature
+        :param strides:         Numpy array of integers, containing the stride of each feature (see `__get_strides`)
+        :param verbose:         Verbosity level, where any value greater than 0 means the message is printed
+        :return:                Tuple of numpy arrays, containing the table offsets, keys, sums and counts (see the
+                                constructor)
+        """
+        num_features = codes.shape[1]
+        group_codes, group_sums, group_counts = aggregate_rows(codes, targets, cardinalities)
+        xgprint(verbose, 'INFO:     {} rows aggregated into {} distinct features combinations'.format(
+            len(codes), len(group_codes)))
+
+        table_keys, table_sums, table_counts = [], [], []
+        pbar = tqdm(range(2 ** num_features), disable=not verbose)
+        pbar.set_description('Coalition tables')
+        for coalition in pbar:
+            features = [f for f in range(num_features) if coalition >> f & 1]
+            keys, groups = np.unique(group_codes[:, features] @ strides[features], return_inverse=True)
+            table_keys.append(keys)
+            table_sums.append(np.stack([np.bincount(groups, weights=group_sums[:, t], minlength=len(keys))
+                                        for t in range(targets.shape[1])], axis=1))
+            table_counts.append(np.bincount(groups, weights=group_counts, minlength=len(keys)))
+
+        return (np.cumsum([0] + [len(keys) for keys in table_keys]), np.concatenate(table_keys),
+                np.concatenate(table_sums), np.concatenate(table_counts))
+
+    @staticmethod
+    def __get_strides(cardinalities: np.ndarray) -> np.ndarray:
+        """
+        This method computes the stride of each feature, so that the features values of any coalition are mapped to a
+        unique integer key by adding up the codes times the strides of its features
+
+        :param cardinalities:   Numpy array of integers, containing the number of different values of each feature
+        :return:                Numpy array of integers, containing the stride of each feature
+        """
+        if np.prod(cardinalities.astype(float)) >= np.iinfo(np.int64).max:
+            raise ValueError('The number of features values combinations ({}) is too big to be encoded'.format(
+                np.prod(cardinalities.astype(float))))
+        return np.concatenate([[1], np.cumprod(cardinalities[:-1])]).astype(np.int64)
+
+    @staticmethod
+    def __merge_tables(table_offsets: np.ndarray, keys: np.ndarray, sums: np.ndarray, counts: np.ndarray,
+                       delta_offsets: np.ndarray, delta_keys: np.ndarray, delta_sums: np.ndarray,
+                       delta_counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        This method merges delta coalition tables into the current ones. Each delta key is binary searched in its
+        current table: the sums and counts of the keys found are added up, and the rest are inserted at the position
+        found, so that tables stay sorted. Only the delta entries are searched and the current tables are copied once,
+        so the cost doesn't depend on sorting or grouping the current tables again. Entries left without rows are
+        dropped
+
+        :param table_offsets:   Numpy array of integers, containing the current table offsets (see the constructor)
+        :param keys:            Numpy array of integers, containing the current keys
+        :param sums:            Numpy matrix, containing the current sums
+        :param counts:          Numpy array, containing the current counts
+        :param delta_offsets:   Numpy array of integers, containing the delta table offsets
+        :param delta_keys:      Numpy array of integers, containing the delta keys, encoded with the same strides
+        :param delta_sums:      Numpy matrix, containing the delta sums, which are negative for removed rows
+        :param delta_counts:    Numpy array, containing the delta counts, which are negative for removed rows
+        :return:                Tuple of numpy arrays, containing the merged table offsets, keys, sums and counts
+        """
+        num_coalitions = len(table_offsets) - 1
+        shared_entries, shared_deltas, insert_positions, new_deltas = [], [], [], []
+        num_new = np.zeros(num_coalitions, dtype=np.int64)
+        for coalition in range(num_coalitions):
+            start, end = table_offsets[coalition], table_offsets[coalition + 1]
+            deltas = np.arange(delta_offsets[coalition], delta_offsets[coalition + 1])
+            table_keys = keys[start:end]
+            positions = np.searchsorted(table_keys, delta_keys[deltas])
+            shared = positions < len(table_keys)
+            shared[shared] = table_keys[positions[shared]] == delta_keys[deltas[shared]]
+            shared_entries.append(start + positions[shared])
+            shared_deltas.append(deltas[shared])
+            insert_positions.append(start + positions[~shared])
+            new_deltas.append(deltas[~shared])
+            num_new[coalition] = np.count_nonzero(~shared)
+        shared_entries, shared_deltas = np.concatenate(shared_entries), np.concatenate(shared_deltas)
+        insert_positions, new_deltas = np.concatenate(insert_positions), np.concatenate(new_deltas)
+
+        sums, counts = sums.copy(), counts.copy()
+        sums[shared_entries] += delta_sums[shared_deltas]
+        counts[shared_entries] += delta_counts[shared_deltas]
+        if np.any(counts[shared_entries] < -LIDEModel._EPS_COUNT) or np.any(delta_counts[new_deltas] < 0):
+            raise ValueError('Rows to be removed were never added to the model')
+        keys = np.insert(keys, insert_positions, delta_keys[new_deltas])
+        sums = np.insert(sums, insert_positions, delta_sums[new_deltas], axis=0)
+        counts = np.insert(counts, insert_positions, delta_counts[new_deltas])
+        table_offsets = table_offsets + np.concatenate([[0], np.cumsum(num_new)])
+
+        kept = counts > LIDEModel._EPS_COUNT
+        if not np.all(kept):
+            table_offsets = np.concatenate([[0], np.cumsum(kept)])[table_offsets]
+            keys, sums, counts = keys[kept], sums[kept], counts[kept]
+        return table_offsets, keys, sums, counts
+
+    def __add_rows(self, df: pd.DataFrame, weight: float, decay: float = 1.0, verbose: int = 0):
+        """
+        This method adds the given rows, with the given weight, to the coalition lookup tables. Since the tables only
+        hold sums and counts, the lookup tables of the rows are built and then merged into the current ones (see
+        `__merge_tables`), so that the rows the model was fitted with are not needed. Building them depends on the
+        number of rows, while merging them searches each of their entries and copies the current tables once. Feature
+        values which were never seen are appended to the categories of their feature, which re-encodes every key.
+        Negative weights remove rows which were previously added. The new state of the model is only assigned once
+        every check has passed, so that the model is left unchanged when the rows are rejected
+
+        :param df:      Pandas DataFrame, containing the rows
+        :param weight:  Float, representing the weight of each row
+        :param decay:   Float, representing the factor which the weight of the current rows is multiplied by before
+                        adding the given ones (default: 1.0, no decay)
+        :param verbose: Verbosity level, where any value greater than 0 means the message is printed
+        """
+        if self.__min_support > 1:
+            raise ValueError('Models fitted with a minimum support greater than 1 can\'t be updated, since the entries '
+                             'below it were discarded')
+        codes = np.empty((len(df), len(self.__feature_cols)), dtype=np.int64)
+        categories = []
+        for i, feature_col in enumerate(self.__feature_cols):
+            values = df[feature_col].astype(str)
+            new_values = np.sort(values[~values.isin(self.__categories[i])].unique().astype(str))
+            if weight < 0 and len(new_values) > 0:
+                raise ValueError('Rows to be removed contain values of {} which were never added: {}'.format(
+                    feature_col, new_values.tolist()))
+            categories.append(np.concatenate([self.__categories[i], new_values]) if len(new_values) > 0
+                              else self.__categories[i])
+            codes[:, i] = pd.Categorical(values, categories=categories[i]).codes
+        cardinalities = np.array([len(c) for c in categories], dtype=np.int64)
+
+        # New values only extend the radix of their features, so keys are re-encoded digit by digit and their order,
+        # which is lexicographic on the digits, is kept
+        strides = LIDEModel.__get_strides(cardinalities)
+        keys = self.__keys
+        if not np.array_equal(strides, self.__strides):
+            old_cardinalities = np.array([len(c) for c in self.__categories], dtype=np.int64)
+            keys = sum((keys // self.__strides[f] % old_cardinalities[f]) * strides[f]
+                       for f in range(len(self.__feature_cols)))
+            xgprint(verbose, 'INFO:     New feature values found, lookup tables keys re-encoded')
+
+        delta_offsets, delta_keys, delta_sums, delta_counts = LIDEModel.__build_tables(
+            codes=codes, targets=df[self.__target_cols].values.astype(np.float64), cardinalities=cardinalities,
+            strides=strides, verbose=verbose)
+        table_offsets, keys, sums, counts = LIDEModel.__merge_tables(
+            table_offsets=self.__table_offsets, keys=keys, sums=decay * self.__sums, counts=decay * self.__counts,
+            delta_offsets=delta_offsets, delta_keys=delta_keys, delta_sums=weight * delta_sums,
+            delta_counts=weight * delta_counts)
+
+        self.__categories, self.__strides = categories, strides
+        self.__table_offsets, self.__keys, self.__sums, self.__counts = table_offsets, keys, sums, counts
+        xgprint(verbose, 'INFO:     Lookup tables updated with {} rows, {} entries'.format(len(df), len(self.__keys)))
+
+    def __coalitions_worth(self, codes: np.ndarray) -> np.ndarray:
+        """
+        This method looks up the worth of every coalition for the given rows. Coalitions whose features values are not
+        in the tables (including values unknown to the model) get NaN worth, unless a minimum support was required when
+        fitting, in which case they back off to the worth of the parent coalition (the coalition without its highest
+        feature)
+
+        :param codes:   Numpy matrix of integers, containing the encoded features of the rows, where -1 stands for
+                        unknown values (n_rows x n_features)
+        :return:        Numpy matrix, containing the worth of each coalition for each row (n_rows x n_coalitions x
+                        n_targets)
+        """
+        # Keys of all the coalitions are computed at once: coalitions containing the feature `f` are those of the
+        # coalitions without it plus the contribution of `f`
+        num_rows, num_features = codes.shape
+        keys = np.zeros((num_rows, 2 ** num_features), dtype=np.int64)
+        valid = np.ones((num_rows, 2 ** num_features), dtype=bool)
+        for feature in range(num_features):
+            size = 2 ** feature
+            keys[:, size:2 * size] = keys[:, :size] + (codes[:, feature] * self.__strides[feature]).reshape(-1, 1)
+            valid[:, size:2 * size] = valid[:, :size] & (codes[:, feature] >= 0).reshape(-1, 1)
+
+        # Tables emptied by the minimum support are skipped, so that their rows back off to the parent coalition
+        worth = np.full((num_rows, 2 ** num_features, len(self.__target_cols)), np.nan)
+        for coalition in range(2 ** num_features):
+            start, end = self.__table_offsets[coalition], self.__table_offsets[coalition + 1]
+            if start == end:
+                continue
+            table_keys = self.__keys[start:end]
+            positions = np.minimum(np.searchsorted(table_keys, keys[:, coalition]), len(table_keys) - 1)
+            found = valid[:, coalition] & (table_keys[positions] == keys[:, coalition])
+            entries = start + positions[found]
+            worth[found, coalition, :] = self.__sums[entries] / self.__counts[entries].reshape(-1, 1)
+
+        # Parents of the coalitions whose highest feature is `f` are lower than 2^f, so they're already backed off
+        if self.__min_support > 1:
+            for feature in range(num_features):
+                size = 2 ** feature
+                missing = np.isnan(worth[:, size:2 * size, :])
+                worth[:, size:2 * size, :][missing] = worth[:, :size, :][missing]
+
+        return worth
+
+    def __encode(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        This method encodes the features of the given DataFrame with the codes learnt during the fit
+
+        :param df:  Pandas DataFrame, containing the feature columns
+        :return:    Numpy matrix of integers, containing the code of each feature value, where -1 stands for values
+                    which were not seen in the train dataset (n_rows x n_features)
+        """
+        codes = np.empty((len(df), len(self.__feature_cols)), dtype=np.int64)
+        for i, feature_col in enumerate(self.__feature_cols):
+            codes[:, i] = pd.Categorical(df[feature_col].astype(str), categories=self.__categories[i]).codes
+        return codes
+
+    def explain(self, df: pd.DataFrame, batch_size: int = 1000, dtype: np.dtype = np.float64,
+                verbose: int = 0) -> np.ndarray:
+        """
+        This method computes the importance of each feature for each row of the given DataFrame. The coalitions worth
+        is looked up in the fitted tables and turned into importance by the LIDE weight matrix. If the DataFrame
+        contains the target columns, the difference between the targets and the predicted worth (reliability) is
+        distributed among the features, just like LIDE does
+
+        :param df:          Pandas DataFrame, containing the rows to be explained
+        :param batch_size:  Integer, representing the number of rows whose coalitions worth is looked up at once
+        :param dtype:       Numpy dtype, used to compute the importance (default: np.float64)
+        :param verbose:     Verbosity level, where any value greater than 0 means the message is printed
+        :return:            Numpy matrix, containing the importance of each feature for each target (n_rows x n_features
+                            x n_targets). Rows whose features values were never seen in the train dataset get NaN
+                            importance
+        """
+        codes = self.__encode(df)
+        weight_matrix = LIDE._get_weight_matrix(num_features=len(self.__feature_cols)).astype(dtype)
+        importance = np.empty((len(df), len(self.__feature_cols), len(self.__target_cols)), dtype=dtype)
+        pbar = tqdm(range(0, len(df), batch_size), disable=not verbose)
+        pbar.set_description('Explanation')
+        for start in pbar:
+            worth = self.__coalitions_worth(codes[start:start + batch_size]).astype(dtype)
+            importance[start:start + batch_size] = np.tensordot(worth, weight_matrix,
+                                                                axes=([1], [0])).transpose(0, 2, 1)
+
+        if all(target_col in df.columns for target_col in self.__target_cols):
+            y_hat = self.phi0.astype(dtype) + importance.sum(axis=1)
+            reliability = df[self.__target_cols].values.astype(dtype) - y_hat
+            importance += np.expand_dims(reliability / importance.shape[1], axis=1)
+
+        return importance
+
+    @staticmethod
+    def fit(df: pd.DataFrame, feature_cols: List[str], target_cols: List[str], min_support: int = 1,
+            verbose: int = 0) -> 'LIDEModel':
+        """
+        This method fits the coalition lookup tables. Train rows are first aggregated into the full features table, and
+        every coalition table is then derived from it. With high cardinality features most entries of the biggest
+        coalitions hold a single row, so a minimum support can be required: entries with fewer rows are discarded, which
+        shrinks the tables, and rows looking them up back off to the parent coalition worth
+
+        :param df:              Pandas DataFrame, containing the train dataset
+        :param feature_cols:    List of strings, containing the column names for the features
+        :param target_cols:     List of strings, containing the column names for the targets
+        :param min_support:     Integer, representing the minimum number of train rows of an entry for it to be kept
+                                (default: 1, every entry is kept). Models fitted with a minimum support greater than 1
+                                can't be updated
+        :param verbose:         Verbosity level, where any value greater than 0 means the message is printed
+        :return:                LIDEModel, containing the fitted coalition lookup tables
+        """
+        num_features = len(feature_cols)
+        codes = np.empty((len(df), num_features), dtype=np.int64)
+        categories = []
+        for i, feature_col in enumerate(feature_cols):
+            codes[:, i], feature_categories = pd.factorize(df[feature_col].astype(str), sort=True)
+            categories.append(np.asarray(feature_categories, dtype=str))
+        cardinalities = np.array([len(c) for c in categories], dtype=np.int64)
+        table_offsets, keys, sums, counts = LIDEModel.__build_tables(
+            codes=codes, targets=df[target_cols].values.astype(np.float64), cardinalities=cardinalities,
+            strides=LIDEModel.__get_strides(cardinalities), verbose=verbose)
+
+        # The empty coalition entry is always kept, so that there's always a worth to back off to
+        if min_support > 1:
+            kept = counts >= min_support
+            kept[0] = True
+            table_offsets = np.concatenate([[0], np.cumsum(kept)])[table_offsets]
+            keys, sums, counts = keys[kept], sums[kept], counts[kept]
+            xgprint(verbose, 'INFO:     {} out of {} entries kept with a minimum support of {}'.format(
+                len(keys), len(kept), min_support))
+
+        return LIDEModel(feature_cols=feature_cols, target_cols=target_cols, categories=categories,
+                         table_offsets=table_offsets, keys=keys, sums=sums, counts=counts, min_support=min_support)
+
+    def get_coalition_table(self, coalition: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        This method retrieves the lookup table of a coalition, that is, the worth of each combination of values of its
+        features which was seen in the train dataset
+
+        :param coalition:   Integer, representing the coalition as a bitmask, so that it contains the feature `f` if and
+                            only if its bit `f` is set
+        :return:            Tuple containing a numpy matrix with the codes of the features values of each entry, where
+                            features out of the coalition are coded as -1 (n_entries x n_features), and a numpy matrix
+                            with the worth of each entry (n_entries x n_targets)
+        """
+        start, end = self.__table_offsets[coalition], self.__table_offsets[coalition + 1]
+        keys = self.__keys[start:end]
+        codes = np.full((len(keys), len(self.__feature_cols)), -1, dtype=np.int64)
+        for feature, category in enumerate(self.__categories):
+            if coalition >> feature & 1:
+                codes[:, feature] = keys // self.__strides[feature] % len(category)
+        return codes, self.__sums[start:end] / self.__counts[start:end].reshape(-1, 1)
+
+    @staticmethod
+    def load(path: str) -> 'LIDEModel':
+        """
+        This method loads a model persisted by means of the `save()` method
+
+        :param path:    String, representing the path of the file containing the model
+        :return:        LIDEModel, containing the loaded coalition lookup tables
+        """
+        with np.load(path, allow_pickle=False) as model:
+            version = int(model[LIDEModel._VERSION])
+            if version not in LIDEModel._SUPPORTED_VERSIONS:
+                raise ValueError('LIDE model version {} is not supported, supported versions are {}'.format(
+                    version, LIDEModel._SUPPORTED_VERSIONS))
+            category_offsets = model[LIDEModel._CATEGORY_OFFSETS]
+            categories = [model[LIDEModel._CATEGORIES][start:end]
+                          for start, end in zip(category_offsets[:-1], category_offsets[1:])]
+            return LIDEModel(feature_cols=model[LIDEModel._FEATURE_COLS].tolist(),
+                             target_cols=model[LIDEModel._TARGET_COLS].tolist(), categories=categories,
+                             table_offsets=model[LIDEModel._TABLE_OFFSETS], keys=model[LIDEModel._KEYS],
+                             sums=model[LIDEModel._SUMS], counts=model[LIDEModel._COUNTS],
+                             min_support=int(model[LIDEModel._MIN_SUPPORT]) if version > 1 else 1)
+
+    def remove(self, df: pd.DataFrame, verbose: int = 0):
+        """
+        This method removes train rows which were previously added to the model, either when fitting or updating it, so
+        that the model can be kept on a sliding window: each time a batch of rows enters the window, the batch leaving
+        it is removed, and only those two batches are scanned. Entries left without rows are dropped
+
+        :param df:      Pandas DataFrame, containing the train rows to be removed
+        :param verbose: Verbosity level, where any value greater than 0 means the message is printed
+        """
+        self.__add_rows(df=df, weight=-1.0, verbose=verbose)
+
+    def save(self, path: str):
+        """
+        This method persists the model as a compressed numpy file, along with its format version. The file is written
+        under a temporary name and then renamed, so that concurrent processes never load a partially written model
+
+        :param path:    String, representing the path of the file where the model is persisted. The `.npz` extension
+                        is appended unless already present
+        """
+        if not path.endswith('.npz'):
+            path = '{}.npz'.format(path)
+        tmp_path = '{}.{}.tmp.npz'.format(path, os.getpid())
+        np.savez_compressed(tmp_path, **{
+            LIDEModel._VERSION: np.array(LIDEModel._MODEL_VERSION),
+            LIDEModel._FEATURE_COLS: np.array(self.__feature_cols, dtype=str),
+            LIDEModel._TARGET_COLS: np.array(self.__target_cols, dtype=str),
+            LIDEModel._CATEGORIES: np.concatenate(self.__categories),
+            LIDEModel._CATEGORY_OFFSETS: np.cumsum([0] + [len(c) for c in self.__categories]),
+            LIDEModel._TABLE_OFFSETS: self.__table_offsets,
+            LIDEModel._KEYS: self.__keys,
+            LIDEModel._SUMS: self.__sums,
+            LIDEModel._COUNTS: self.__counts,
+            LIDEModel._MIN_SUPPORT: np.array(self.__min_support)
+        })
+        os.replace(tmp_path, path)
+
+    def update(self, df: pd.DataFrame, decay: float = 1.0, verbose: int = 0):
+        """
+        This method updates the coalition lookup tables with new train rows, as if they had been appended to the train
+        dataset the model was fitted with. The previous train rows are not needed (see `__add_rows`). If a decay factor
+        is given, the weight of the rows the model already holds is multiplied by it before adding the new ones, so
+        that updating the model with a batch of rows per period yields exponentially decayed coalitions worth. Entries
+        whose weight becomes negligible are dropped
+
+        :param df:      Pandas DataFrame, containing the new train rows
+        :param decay:   Float, in (0, 1], representing the factor which the weight of the current rows is multiplied by
+                        (default: 1.0, no decay)
+        :param verbose: Verbosity level, where any value greater than 0 means the message is printed
+        """
+        if not 0.0 < decay <= 1.0:
+            raise ValueError('Decay must be in (0, 1], got {}'.format(decay))
+        self.__add_rows(df=df, weight=1.0, decay=decay, verbose=verbose)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+from typing import Any, Mapping, Optional, Sequence, Union
+
+import numpy as np
+
+from xaiographs.exgraph.importance.lide import LIDE
+from xaiographs.exgraph.importance.lide_model import LIDEModel
+
+Row = Union[Mapping[str, Any], Sequence[Any]]
+
+
+class LIDEOnlineExplainer(object):
+    """
+    This class explains single rows (or small batches of them) with low latency, on top of a fitted LIDE model. Every
+    coalition worth is kept in a hash table, keyed by the codes of the features of the coalition, and importance is
+    obtained from the coalitions worth with a single product by the LIDE weight matrix. Rows are given as plain Python
+    sequences or mappings, so that pandas is never used while explaining
+    """
+
+    def __init__(self, model: LIDEModel, dtype: np.dtype = np.float64):
+        """
+        Constructor method for LIDEOnlineExplainer, which builds the hash tables from the model lookup tables
+
+        :param model:   LIDEModel, containing the fitted coalition lookup tables
+        :param dtype:   Numpy dtype, used to compute the importance (default: np.float64)
+        """
+        self.__feature_cols = model.feature_cols
+        self.__target_cols = model.target_cols
+        self.__value_codes = [{value: code for code, value in enumerate(category)} for category in model.categories]
+        self.__min_support = model.min_support
+        num_features = len(self.__feature_cols)
+
+        # Codes are shifted by one in the keys, so that features out of the coalition (digit 0) are told apart from
+        # the first value of each feature and keys are unique across all the coalitions
+        radixes = np.array([len(category) + 1 for category in model.categories], dtype=np.int64)
+        if np.prod(radixes.astype(float)) >= np.iinfo(np.int64).max:
+            raise ValueError('The number of features values combinations ({}) is too big to be encoded'.format(
+                np.prod(radixes.astype(float))))
+        self.__strides = np.concatenate([[1], np.cumprod(radixes[:-1])]).astype(np.int64)
+
+        # The last worth row is NaN and it's returned for every key which is not found
+        self.__table = {}
+        worth = []
+        for coalition in range(2 ** num_features):
+            codes, coalition_worth = model.get_coalition_table(coalition)
+            keys = (codes + 1) @ self.__strides
+            self.__table.update(zip(keys.tolist(), range(len(worth), len(worth) + len(keys))))
+            worth.extend(coalition_worth)
+        self.__worth = np.vstack(worth + [np.full(len(self.__target_cols), np.nan)]).astype(dtype)
+        self.__weight_matrix = LIDE._get_weight_matrix(num_features=num_features).astype(dtype)
+        self.__phi0 = model.phi0.astype(dtype)
+
+    @property
+    def feature_cols(self):
+        """
+        Property that returns the feature names, in the order in which row values are expected
+
+        :return: List of strings, containing the column names for the features
+        """
+        return self.__feature_cols
+
+    @property
+    def target_cols(self):
+        """
+        Property that returns the target names, in the order in which importance is returned
+
+        :return: List of strings, containing the column names for the targets
+        """
+        return self.__target_cols
+
+    def __coalitions_worth(self, rows: Sequence[Row]) -> np.ndarray:
+        """
+        This method looks up the worth of every coalition for the given rows. Coalitions containing values which are
+        not in the tables get NaN worth, unless the model was fitted with a minimum support, in which case they back off
+        to the worth of the parent coalition (the coalition without its highest feature)
+
+        :param rows:    Sequence of rows, each of them being either a mapping from feature names to values or a
+                        sequence of values in the order given by `feature_cols`
+        :return:        Numpy matrix, containing the worth of each coalition for each row (n_rows x n_coalitions x
+                        n_targets)
+        """
+        num_features = len(self.__feature_cols)
+        digits = np.empty((len(rows), num_features), dtype=np.int64)
+        for i, row in enumerate(rows):
+            values = [row[feature_col] for feature_col in self.__feature_cols] if isinstance(row, Mapping) else row
+            digits[i] = [value_codes.get(str(value), -1) + 1 for value_codes, value in zip(self.__value_codes, values)]
+
+        # Keys of all the coalitions are computed at once: coalitions containing the feature `f` are those of the
+        # coalitions without it plus the contribution of `f`. Coalitions with unknown values get a key which is never
+        # found
+        keys = np.zeros((len(rows), 2 ** num_features), dtype=np.int64)
+        valid = np.ones((len(rows), 2 ** num_features), dtype=bool)
+        for feature in range(num_features):
+            size = 2 ** feature
+            keys[:, size:2 * size] = keys[:, :size] + (digits[:, feature] * self.__strides[feature]).reshape(-1, 1)
+            valid[:, size:2 * size] = valid[:, :size] & (digits[:, feature] > 0).reshape(-1, 1)
+        keys[~valid] = -1
+
+        entries = np.array([self.__table.get(key, -1) for key in keys.ravel().tolist()],
+                           dtype=np.int64).reshape(len(rows), -1)
+        if self.__min_support > 1:
+            for feature in range(num_features):
+                size = 2 ** feature
+                block = entries[:, size:2 * size]
+                entries[:, size:2 * size] = np.where(block < 0, entries[:, :size], block)
+        return self.__worth[entries]
+
+    def explain_batch(self, rows: Sequence[Row], targets: Optional[Sequence[Sequence[float]]] = None) -> np.ndarray:
+        """
+        This method computes the importance of each feature for each of the given rows. If the targets of the rows are
+        given, the difference between them and the predicted worth (reliability) is distributed among the features,
+        just like LIDE does
+
+        :param rows:    Sequence of rows, each of them being either a mapping from feature names to values or a
+                        sequence of values in the order given by `feature_cols`
+        :param targets: Sequence of targets, containing a value per target column for each row (default: None)
+        :return:        Numpy matrix, containing the importance of each feature for each target (n_rows x n_features x
+                        n_targets). Rows whose features values were never seen in the train dataset get NaN importance
+        """
+        importance = np.tensordot(self.__coalitions_worth(rows), self.__weight_matrix,
+                                  axes=([1], [0])).transpose(0, 2, 1)
+        if targets is not None:
+            reliability = np.asarray(targets, dtype=importance.dtype) - self.__phi0 - importance.sum(axis=1)
+            importance += np.expand_dims(reliability / importance.shape[1], axis=1)
+
+        return importance
+
+    def explain_one(self, row: Row, target: Optional[Sequence[float]] = None) -> np.ndarray:
+        """
+        This method computes the importance of each feature for a single row (see `explain_batch`)
+
+        :param row:     Row, being either a mapping from feature names to values or a sequence of values in the order
+                        given by `feature_cols`
+        :param target:  Sequence of floats, containing a value per target column (default: None)
+        :return:        Numpy matrix, containing the importance of each feature for each target (n_features x
+                        n_targets)
+        """
+        return self.explain_batch([row], None if target is None else [target])[0]
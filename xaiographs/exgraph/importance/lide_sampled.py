@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+u"""
+© 2023 Telefónica Digital España S.L.
+This file is part of XAIoGraphs.
+
+XAIoGraphs is free software: you can redistribute it and/or modify it under the terms of the Affero GNU General Public
+License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+later version.
+
+XAIoGraphs is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License
+for more details.
+
+You should have received a copy of the Affero GNU General Public License along with XAIoGraphs. If not,
+see https://www.gnu.org/licenses/."""
+
+
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from xaiographs.common.utils import FeatureEncoding, TargetInfo, xgprint
+from xaiographs.exgraph.importance.coalitions_worth import iter_chain_worth
+from xaiographs.exgraph.importance.importance_calculator import EPS_ERROR
+from xaiographs.exgraph.importance.lide import LIDE
+
+
+class LIDESampled(LIDE):
+    """
+    This class implements ImportanceCalculator by estimating the same Shapley values as LIDE from a sample of features
+    permutations. Each permutation only requires the worth of the coalitions obtained by adding its features one at a
+    time, so the cost grows linearly with the number of features instead of exponentially
+    """
+    _DEFAULT_NUM_PERMUTATIONS = 100
+    _DEFAULT_SEED = 42
+    _NUM_PERMUTATIONS = 'num_permutations'
+    _SEED = 'seed'
+
+    def __init__(self, explainer_params: Dict, feature_cols: List[str], target_info: TargetInfo,
+                 train_size: float = 0.0, train_stratify: bool = False, verbose: int = 0, n_jobs: int = 1,
+                 dtype: np.dtype = np.float64, encoding: Optional[FeatureEncoding] = None):
+        """
+        Constructor method for LIDESampled ImportanceCalculator
+
+        :param explainer_params:            Dictionary, containing potentially useful information for this importance
+                                            calculator. These are the supported keys:
+                                            - lattice_aggregation: Boolean, stating whether the train rows are first
+                                            aggregated into the full features table (default: False)
+                                            - min_support: Integer, representing the minimum number of train samples
+                                            of a coalition group for its worth to be used. Samples whose group is
+                                            smaller back off to the worth of the previous coalition of the
+                                            permutation (default: 1, no back-off)
+                                            - sanity_check: String, representing the local accuracy sanity check
+                                            policy: 'full', 'sampled' or 'off' (default: 'full')
+                                            - sanity_check_samples: Integer, representing the number of samples
+                                            checked when sanity_check is 'sampled' (default: 1000)
+                                            - num_permutations: Integer, representing the number of sampled features
+                                            permutations, that is, the sampling budget (default: 100)
+                                            - seed: Integer, representing the seed used to sample the permutations
+                                            (default: 42)
+        :param feature_cols:                List of strings, containing the column names for the features
+        :param target_info:                 NamedTuple, containing a numpy array listing the top1 target for each
+                                            DataFrame row, another numpy array listing a probability for each possible
+                                            target value and a third numpy array showing the top1 targets indexes
+        :param train_size:                  Float, indicating the percentage of the pandas DataFrame that will be used
+                                            to train the calculator
+        :param train_stratify:              Boolean, indicating whether target columns proportions will be taken into
+                                            account when splitting the data (if train_size > 0.0)
+        :param verbose:                     Verbosity level, where any value greater than 0 means the message is printed
+        :param n_jobs:                      Integer, not used by this importance calculator
+        :param dtype:                       Numpy dtype, used to store the importance (default: np.float64)
+        :param encoding:                    NamedTuple, containing the features encoded for the whole dataset, whose
+                                            codes are used instead of encoding the features again (default: None)
+        """
+        super(LIDESampled, self).__init__(explainer_params=explainer_params, feature_cols=feature_cols,
+                                          target_info=target_info, train_size=train_size,
+                                          train_stratify=train_stratify, verbose=verbose, n_jobs=n_jobs, dtype=dtype,
+                                          encoding=encoding)
+        self._importance_std_errors = None
+
+    @property
+    def importance_std_errors(self):
+        """
+        Property that returns a three dimensional Numpy matrix (n_samples X n_features X n_target_values), containing
+        the standard error of each estimated importance value. Prior to invoking this property, the `local_explain()`
+        method must have been invoked
+
+        :return: np.ndarray, with the standard errors of the estimated importance values
+        """
+        return self._importance_std_errors
+
+    @staticmethod
+    def __sample_permutations(num_features: int, num_permutations: int, seed: int) -> np.ndarray:
+        """
+        This method samples features permutations uniformly at random
+
+        :param num_features:        Integer, representing the number of features
+        :param num_permutations:    Integer, representing the number of permutations to be sampled
+        :param seed:                Integer, representing the seed of the random generator
+        :return:                    Numpy matrix of integers, containing a permutation of the features per row
+                                    (n_permutations x n_features)
+        """
+        rng = np.random.default_rng(seed)
+        return rng.permuted(np.tile(np.arange(num_features), (num_permutations, 1)), axis=1)
+
+    @staticmethod
+    def _chain_contributions(coalitions_data: Dict[str, np.ndarray], codes: np.ndarray, targets: np.ndarray,
+                             query_codes: np.ndarray, permutation: np.ndarray,
+                             contributions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        This method computes the marginal contribution of each feature along the chain of coalitions given by a
+        permutation: the worth of the coalition made of the features preceding it plus the feature itself minus the
+        worth of the coalition without it. The last coalition of every chain contains all the features, so marginal
+        contributions always add up to its worth minus phi0
+
+        :param coalitions_data: Dictionary, containing the encoded train and explain data
+        :param codes:           Numpy matrix of integers, containing the encoded train features in column-major order
+        :param targets:         Numpy matrix, containing the train targets in column-major order
+        :param query_codes:     Numpy matrix of integers, containing the encoded features of the samples to be
+                                explained in column-major order
+        :param permutation:     Numpy array of integers, containing a permutation of the features
+        :param contributions:   Numpy matrix, where the marginal contributions are written (n_samples x n_features x
+                                n_target_cols)
+        :return:                Tuple of numpy matrices, containing the worth of the empty coalition (phi0) and the
+                                worth of the coalition with all the features (both n_samples x n_target_cols)
+        """
+        chain_worth = iter_chain_worth(codes=codes, targets=targets, cardinalities=coalitions_data['cardinalities'],
+                                       query_codes=query_codes, features=permutation,
+                                       row_counts=coalitions_data['row_counts'],
+                                       min_support=coalitions_data['min_support'])
+        previous_worth = phi0 = next(chain_worth)
+        for feature, worth in zip(permutation, chain_worth):
+            contributions[:, feature, :] = worth - previous_worth
+            previous_worth = worth
+        return phi0, previous_worth
+
+    @staticmethod
+    def _get_eps_error(num_features: int, dtype: np.dtype) -> float:
+        """
+        This method computes the tolerance of the local accuracy sanity checks for the given dtype. Unlike LIDE, no
+        coalitions worth is weighted: the marginal contributions of a chain are differences of consecutive worths, all
+        of them in [0, 1], and they're computed and averaged in float64, so that they add up to the worth of the full
+        coalition minus phi0 up to a negligible error. Each importance value lies in [-1, 1], so storing the n of them
+        with unit roundoff u adds at most n * u, and storing phi0 and the ground truth adds at most u each (the
+        prediction is added up in float64). Hence the additivity error grows linearly with the number of features:
+            (2n + 2) * u
+        where n * u is left as a margin for the float64 arithmetic. It's about 4.9e-6 for 40 features in float32 (u =
+        2^-24). The tolerance is never lower than EPS_ERROR
+
+        :param num_features:    Integer, representing the number of features
+        :param dtype:           Numpy dtype, used to store the importance
+        :return:                Float, representing the tolerance of the sanity checks
+        """
+        return max(EPS_ERROR, float((2 * num_features + 2) * np.finfo(dtype).eps / 2))
+
+    def _local_importance(self, batch_size: int,
+                          params: Dict[str, Union[pd.DataFrame, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray,
+                                                                                       np.ndarray]:
+        """
+        This method estimates the importance of each feature for the samples to be explained. For each sampled
+        permutation, the marginal contribution of each feature is computed along its chain of coalitions (see
+        `_chain_contributions`). The importance is the mean of the marginal contributions throughout the permutations
+        and its standard error is kept as well. Permutations are shared by all the samples, so that each coalition is
+        grouped only once per permutation
+
+        :param batch_size:  Integer, not used since the memory needed doesn't depend on the number of coalitions
+        :param params:      Dictionary, containing the output of the train method
+        :return:            Tuple of numpy matrices, containing the estimated importance (n_samples x n_features x
+                            n_target_cols), phi0 and the ground truth (both n_samples x n_target_cols)
+        """
+        coalitions_data = params[LIDE._COALITIONS_DATA]
+        query_codes = np.asfortranarray(coalitions_data['query_codes'])
+        codes = np.asfortranarray(coalitions_data['codes'])
+        targets = np.asfortranarray(coalitions_data['targets'], dtype=np.float64)
+        num_features = codes.shape[1]
+        permutations = self.__sample_permutations(
+            num_features=num_features,
+            num_permutations=self.explainer_params.get(LIDESampled._NUM_PERMUTATIONS,
+                                                       LIDESampled._DEFAULT_NUM_PERMUTATIONS),
+            seed=self.explainer_params.get(LIDESampled._SEED, LIDESampled._DEFAULT_SEED))
+
+        # Mean and sum of squared deviations of the marginal contributions are updated with each permutation (Welford)
+        shape = (len(query_codes), num_features, targets.shape[1])
+        mean, squared_deviations = np.zeros(shape), np.zeros(shape)
+        contributions = np.empty(shape)
+        pbar = tqdm(permutations, disable=not self._verbose)
+        pbar.set_description('Explanation')
+        for k, permutation in enumerate(pbar, start=1):
+            phi0, ground_truth = self._chain_contributions(coalitions_data=coalitions_data, codes=codes,
+                                                           targets=targets, query_codes=query_codes,
+                                                           permutation=permutation, contributions=contributions)
+            delta = contributions - mean
+            mean += delta / k
+            squared_deviations += delta * (contributions - mean)
+
+        if len(permutations) > 1:
+            std_errors = np.sqrt(squared_deviations / (len(permutations) - 1) / len(permutations))
+        else:
+            std_errors = np.full(shape, np.nan)
+        self._importance_std_errors = std_errors.astype(self._dtype)
+        xgprint(self._verbose, 'INFO:     Importance estimated from {} permutations, standard error: mean {:.6f}, max '
+                               '{:.6f}'.format(len(permutations), np.nanmean(std_errors), np.nanmax(std_errors)))
+
+        return mean.astype(self._dtype), phi0.astype(self._dtype), ground_truth.astype(self._dtype)
+
+    def train(self, df: pd.DataFrame,
+              num_samples_to_explain: int) -> Dict[str, Union[pd.DataFrame, np.ndarray]]:
+        """
+        This method takes care of the train part, which consists of sampling the DataFrame to be explained and encoding
+        it along with the train DataFrame. No coalitions worth is computed in advance
+
+        :param df:                      Pandas DataFrame, containing the loaded dataset with the selected features
+        :param num_samples_to_explain:  Integer, representing the number of samples to be (globally) explained
+
+        :return:                        Dictionary containing two elements:
+                                        - df_to_explain:    Pandas DataFrame, consisting of a sample of the train pandas
+                                                            DataFrame
+                                        - coalitions_data:  Dictionary, containing the encoded train and explain data
+        """
+        df_2_explain, coalitions_data = self._prepare_coalitions_data(df=df,
+                                                                      num_samples_to_explain=num_samples_to_explain)
+        return {
+            LIDE._DF_TO_EXPLAIN: df_2_explain,
+            LIDE._COALITIONS_DATA: coalitions_data
+        }
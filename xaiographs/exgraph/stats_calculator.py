@@ -17,14 +17,16 @@ see https://www.gnu.org/licenses/."""
 
 
 import itertools
-from typing import Any, List, NamedTuple, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, NamedTuple, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
 from xaiographs.common.constants import COUNT, FEATURE_NAME, ID, IMPORTANCE_SUFFIX, NODE_COUNT, NODE_NAME, \
     NODE_NAME_RATIO, TARGET
-from xaiographs.common.utils import filter_by_ids, xgprint
+from xaiographs.common.utils import FeatureEncoding, SharedArray, attach_shared_array, create_shared_array, \
+    get_n_jobs, get_node_codes, xgprint
 
 # CONSTANTS
 NODE_1 = 'node_1'
@@ -32,6 +34,57 @@ NODE_2 = 'node_2'
 NODE_NAME_RATIO_RANK = 'node_name_ratio_rank'
 TOTAL_COUNT = 'total_count'
 
+# When edges are counted in parallel, feature pairs are split into (at least) this number of shards per process, so
+# that processes finishing early can take over the remaining shards
+SHARDS_PER_JOB = 4
+
+
+def _count_pairs(codes_1: np.ndarray, codes_2: np.ndarray, num_codes_1: int,
+                 num_codes_2: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    This function counts the co-occurrences of the codes of two features. Both codes are combined into a single one,
+    so that co-occurrences are counted with a single bincount (or by sorting the combined codes, whenever the number of
+    possible pairs is larger than the number of rows)
+
+    :param codes_1:     Numpy array of integers, containing the codes of the first feature for each row
+    :param codes_2:     Numpy array of integers, containing the codes of the second feature for each row
+    :param num_codes_1: Integer, representing the number of codes of the first feature
+    :param num_codes_2: Integer, representing the number of codes of the second feature
+    :return:            Tuple of numpy arrays, containing the sorted combined codes (code_1 * num_codes_2 + code_2) of
+                        the pairs found and their counts
+    """
+    pair_codes = codes_1 * num_codes_2 + codes_2
+    if num_codes_1 * num_codes_2 <= len(pair_codes):
+        pair_counts = np.bincount(pair_codes, minlength=num_codes_1 * num_codes_2)
+        pair_codes = np.flatnonzero(pair_counts)
+        return pair_codes, pair_counts[pair_codes]
+    return np.unique(pair_codes, return_counts=True)
+
+
+def _count_pairs_task(shared_codes: SharedArray, num_codes: List[int],
+                      pairs: List[Tuple[int, int]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    This function counts the co-occurrences of the codes of each of the given feature pairs (see `_count_pairs`). It's
+    run by the processes of the pool: codes are read from shared memory, so that only their description is sent to the
+    processes
+
+    :param shared_codes:    Tuple, describing the shared matrix of feature codes (n_rows x n_features)
+    :param num_codes:       List of integers, containing the number of codes of each feature
+    :param pairs:           List of tuples, containing the feature pairs to be counted
+    :return:                List of tuples, containing the sorted combined codes and the counts of each feature pair
+    """
+    shared_memory, feature_codes = attach_shared_array(shared_codes)
+    try:
+        pair_counts = [_count_pairs(codes_1=feature_codes[:, i], codes_2=feature_codes[:, j], num_codes_1=num_codes[i],
+                                    num_codes_2=num_codes[j]) for i, j in pairs]
+
+        # Views on the shared memory block must be released before closing it
+        del feature_codes
+    finally:
+        shared_memory.close()
+
+    return pair_counts
+
 
 class StatsResults(NamedTuple):
     """StatsResults provides the structure to store both, global and local calculated statistics
@@ -47,7 +100,8 @@ class StatsCalculator(object):
     """
     def __init__(self, df: pd.DataFrame, top1_targets: np.ndarray, feature_cols: List[str],
                  float_feature_cols: List[str],  target_cols: List[str], sample_ids_mask: np.ndarray,
-                 sample_ids: List[Any], verbose: int = 0):
+                 sample_ids: List[Any], verbose: int = 0, n_jobs: int = 1,
+                 encoding: Optional[FeatureEncoding] = None):
         """
         Constructor method for StatsCalculator
 
@@ -60,6 +114,10 @@ class StatsCalculator(object):
         :param target_cols:         List of strings, containing the column names for the target/s
         :param sample_ids:          List of integers, representing the ids which will be part of the sample
         :param verbose:             Verbosity level, where any value greater than 0 means the message is printed
+        :param n_jobs:              Integer, representing the number of processes used to count the edges. Negative
+                                    values are relative to the number of CPUs (-1 means all of them)
+        :param encoding:            NamedTuple, containing the features encoded for the whole dataset, whose codes are
+                                    used instead of encoding the features again (default: None)
         """
         self.__df = df
         self.__top1_targets = top1_targets
@@ -69,67 +127,76 @@ class StatsCalculator(object):
         self.__sample_ids_mask = sample_ids_mask
         self.__sample_ids = sample_ids
         self.__verbose = verbose
+        self.__n_jobs = n_jobs
+        self.__encoding = encoding
         xgprint(self.__verbose, 'INFO: Instantiating StatsCalculator:')
 
-    def __calculate_edges_stats(self) -> StatsResults:
+    def __calculate_edges_stats(self, node_codes: np.ndarray, node_names: np.ndarray) -> StatsResults:
         """
         This method computes the local and global edges statistics for a given pandas DataFrame. These calculations
         consist on the number of appearances of each edge for each top1 target in the global case which are, then,
-        propagated to the local case. Bear in mind that, for the local edges, a sample ids mask will be applied so that
-        only certain ids will be taken into account
+        propagated to the local case. Bear in mind that global edges are counted from every row, whereas local edges
+        are only built for the rows selected by the sample ids mask
 
-        :return:    StatsResult object, comprising both, the local and the global information related to the graph edges
+        :param node_codes:  Numpy matrix of integers, containing the node code of each row and feature
+        :param node_names:  Numpy array, containing the sorted node names
+        :return:            StatsResult object, comprising both, the local and the global information related to the
+                            graph edges
         """
         xgprint(self.__verbose, 'INFO:     StatsCalculator: calculating edges stats ...')
-        # A copy is done to avoid mutation side effects
-        df_example = self.__df.copy()
-
-        # First, edges global stats are computed. For each feature column name, all feature_value node names are
-        # generated (float feature values require special treatment)
-        for feature_col in self.__feature_cols:
-            if feature_col in self.__float_feature_cols:
-                # TODO: Para ciertos float, la representación puede dispararse en cuanto a número de decimales
-                #  Habría que ver una manera de especificar el tope de precisión a garantizar para las features con
-                #  valores de ese tipo
-                df_example[feature_col] = feature_col + '_' + df_example[feature_col].apply(
-                    "{:.02f}".format).map(str)
-            else:
-                df_example[feature_col] = feature_col + '_' + df_example[feature_col].map(str)
-
-        # Now all possible feature_value combinations (order doesn't matter) are generated
-        df_example[TARGET] = self.__top1_targets
-        feature_cols_combinations = itertools.combinations(self.__feature_cols, 2)
-        df_global_graph_edges_list = []
-        df_local_graph_edges_list = []
-        for feature_cols_tuple in feature_cols_combinations:
-            feature_cols_pair = list(feature_cols_tuple)
-
-            # Same loop is used to generate local and global parts: ID is taken into account for the local part
-            # top1_target is taken into account for the global part in which counting is done
-            df_local_graph_edges_list.append(df_example[[ID, TARGET] + feature_cols_pair].rename(
-                columns={feature_cols_pair[0]: NODE_1, feature_cols_pair[1]: NODE_2}))
-            df_global_graph_edges_list.append(
-                df_example[feature_cols_pair].value_counts().reset_index(name=COUNT).rename(
-                    columns={feature_cols_pair[0]: NODE_1, feature_cols_pair[1]: NODE_2}))
-
-        df_global_graph_edges = pd.concat(df_global_graph_edges_list).sort_values(
-            by=[NODE_1, NODE_2]).reset_index(drop=True)
-
-        # Once global stats are ready, local examples can be joined on those, so that the global count can be applied
-        # to them
-        df_local_graph_edges_raw = pd.concat(df_local_graph_edges_list).sort_values(
-            by=[ID, NODE_1, NODE_2]).reset_index(drop=True)
-
-        # Sample ids mask is applied
-        df_local_graph_edges_sample_raw = filter_by_ids(df=df_local_graph_edges_raw,
-                                                        sample_id_mask=self.__sample_ids_mask,
-                                                        n_repetitions=int(len(df_local_graph_edges_raw)/len(self.__df)))
+        # Node codes are compacted for each feature, keeping their order, so that the co-occurrences of each pair of
+        # features are counted over its own (small) set of possible pairs
+        feature_nodes = []
+        feature_codes = np.empty_like(node_codes)
+        for i in range(node_codes.shape[1]):
+            nodes = np.flatnonzero(np.bincount(node_codes[:, i], minlength=len(node_names)))
+            code_map = np.zeros(len(node_names), dtype=np.int64)
+            code_map[nodes] = np.arange(len(nodes))
+            feature_nodes.append(nodes)
+            feature_codes[:, i] = code_map[node_codes[:, i]]
+
+        # Sampled rows are sorted by ID, since local edges are sorted by ID and then by node names
+        ids = self.__df[ID].to_numpy()
+        sample_rows = np.flatnonzero(self.__sample_ids_mask)
+        sample_rows = sample_rows[np.argsort(ids[sample_rows], kind='stable')]
+
+        # All possible feature_value combinations (order doesn't matter) are counted over every row. Local edges are
+        # only built for the sampled rows, taking their count from the global ones. Both are kept as node codes
+        pairs = list(itertools.combinations(range(node_codes.shape[1]), 2))
+        num_codes = [len(nodes) for nodes in feature_nodes]
+        global_edges, global_counts, local_edges, local_counts = [], [], [], []
+        edge_counts = self.__count_edges(feature_codes=feature_codes, num_codes=num_codes, pairs=pairs)
+        for (i, j), (pair_codes, pair_counts) in zip(pairs, edge_counts):
+            global_edges.append(np.stack((feature_nodes[i][pair_codes // num_codes[j]],
+                                          feature_nodes[j][pair_codes % num_codes[j]]), axis=1))
+            global_counts.append(pair_counts)
+            local_edges.append(node_codes[sample_rows][:, [i, j]])
+            local_counts.append(pair_counts[np.searchsorted(pair_codes, feature_codes[sample_rows, i] * num_codes[j] +
+                                                            feature_codes[sample_rows, j])])
+        global_edges = np.concatenate(global_edges)
+        global_counts = np.concatenate(global_counts)
+        order = np.lexsort((global_edges[:, 1], global_edges[:, 0]))
+        node_names = node_names.astype(object)
+        df_global_graph_edges = pd.DataFrame({NODE_1: node_names[global_edges[order, 0]],
+                                              NODE_2: node_names[global_edges[order, 1]],
+                                              COUNT: global_counts[order]})
+
+        # Each sampled row edges are sorted by node names
+        num_pairs = len(local_edges)
+        local_edges = np.stack(local_edges, axis=1).reshape(-1, 2)
+        local_counts = np.stack(local_counts, axis=1).reshape(-1)
+        blocks = np.repeat(np.arange(len(sample_rows)), num_pairs)
+        order = np.lexsort((local_edges[:, 1], local_edges[:, 0], blocks))
+        rows = sample_rows[blocks]
+        df_local_graph_edges_sample = pd.DataFrame({ID: ids[rows],
+                                                    TARGET: np.asarray(self.__top1_targets, dtype=object)[rows],
+                                                    NODE_1: node_names[local_edges[order, 0]],
+                                                    NODE_2: node_names[local_edges[order, 1]],
+                                                    COUNT: local_counts[order]})
 
         # IDs present in resulting sample must match te sample ids
-        assert np.array_equal(np.unique(np.sort(df_local_graph_edges_sample_raw[ID].astype('str').values)),
+        assert np.array_equal(np.unique(np.sort(df_local_graph_edges_sample[ID].astype('str').values)),
                               np.sort(self.__sample_ids)), "Something went wrong when sampling local edges"
-        df_local_graph_edges_sample = df_local_graph_edges_sample_raw.merge(df_global_graph_edges, how='left',
-                                                                            on=[NODE_1, NODE_2])
         return StatsResults(global_stats=df_global_graph_edges, local_stats=df_local_graph_edges_sample)
 
     def __calculate_global_target_distribution(self) -> pd.DataFrame:
@@ -143,7 +210,8 @@ class StatsCalculator(object):
                                            axis=1),
                             columns=[TARGET, COUNT])
 
-    def __calculate_nodes_stats(self) -> Tuple[StatsResults, np.ndarray]:
+    def __calculate_nodes_stats(self, node_codes: np.ndarray, node_names: np.ndarray) -> Tuple[StatsResults,
+                                                                                               np.ndarray]:
         """
         This method computes the local and global nodes statistics. For the moment there's no actual aggregation to
         compute for the local case, but only a table containing feature_value pairs for each ID, together with their
@@ -151,39 +219,34 @@ class StatsCalculator(object):
         for each feature_value pair, this will become the global case. Bear in mind that, for the local nodes, a sample
         ids mask will be applied so only certain ids will be taken into account
 
-        :return:    StatsResult object comprising both, the local and the global information related to the graph nodes
-                    and a numpy matrix containing for each ID-node pairs, their top1 target and the name of the column
-                    containing the importance value
+        :param node_codes:  Numpy matrix of integers, containing the node code of each row and feature
+        :param node_names:  Numpy array, containing the sorted node names
+        :return:            StatsResult object comprising both, the local and the global information related to the
+                            graph nodes and a numpy matrix containing for each ID-node pairs, their top1 target and the
+                            name of the column containing the importance value
         """
         xgprint(self.__verbose, 'INFO:     StatsCalculator: calculating nodes stats ...')
-        all_columns = list(self.__df.columns)
-        df_values = self.__df.values
-        graph_nodes_info = []
-
-        # First, for each feature column name, all feature_value node names are generated (float feature values require
-        # special treatment)
-        for i, row in enumerate(df_values):
-            for feature_col in self.__feature_cols:
-                feature_value_raw = row[all_columns.index(feature_col)]
-                if feature_col in self.__float_feature_cols:
-                    # TODO: Para ciertos float, la representación puede dispararse en cuanto a número de decimales
-                    #  Habría que ver una manera de especificar el tope de precisión a garantizar para las features con
-                    #  valores de ese tipo
-                    feature_value = '_'.join([feature_col, "{:.02f}".format(feature_value_raw)])
-                else:
-                    feature_value = '_'.join([feature_col, str(feature_value_raw)])
-
-                graph_nodes_info.append([row[0], feature_value, feature_col, self.__top1_targets[i],
-                                         '_'.join([self.__top1_targets[i], feature_col]) + IMPORTANCE_SUFFIX])
-        graph_nodes_info = np.array(graph_nodes_info)
+        num_features = len(self.__feature_cols)
+        ids = self.__df[ID].astype(str).to_numpy()
+
+        # ID-node pairs are listed row by row and feature by feature. Importance column names are only built once for
+        # each top1 target and feature
+        targets, target_codes = np.unique(self.__top1_targets, return_inverse=True)
+        importance_cols = np.array([['_'.join([target, feature_col]) + IMPORTANCE_SUFFIX
+                                     for feature_col in self.__feature_cols] for target in targets], dtype=str)
+        graph_nodes_info = np.stack((np.repeat(ids, num_features).astype(str), node_names[node_codes.ravel()],
+                                     importance_cols[target_codes.reshape(-1)].ravel()), axis=1)
 
         # For the moment this is all the information for the local graph nodes statistics. This will be used later,
-        # combined with the Importance calculation part
-        df_local_graph_nodes = pd.DataFrame(graph_nodes_info[:, :-1], columns=[ID, NODE_NAME, FEATURE_NAME, TARGET])
-        # Sample ids mask is applied to the local nodes before returning the information
-        df_local_graph_nodes_sample = filter_by_ids(df=df_local_graph_nodes,
-                                                    sample_id_mask=self.__sample_ids_mask,
-                                                    n_repetitions=int(len(df_local_graph_nodes) / len(self.__df)))
+        # combined with the Importance calculation part. Sample ids mask is applied to the local nodes before
+        # building the information
+        sample_rows = np.flatnonzero(self.__sample_ids_mask)
+        df_local_graph_nodes_sample = pd.DataFrame(
+            {ID: np.repeat(ids[sample_rows], num_features),
+             NODE_NAME: node_names.astype(object)[node_codes[sample_rows].ravel()],
+             FEATURE_NAME: np.tile(np.array(self.__feature_cols, dtype=object), len(sample_rows)),
+             TARGET: np.repeat(np.asarray(self.__top1_targets, dtype=object)[sample_rows], num_features)},
+            index=(sample_rows.reshape(-1, 1) * num_features + np.arange(num_features)).ravel())
 
         # IDs present in resulting sample must match te sample ids
         assert np.array_equal(np.unique(np.sort(df_local_graph_nodes_sample[ID].astype('str').values)),
@@ -191,14 +254,50 @@ class StatsCalculator(object):
 
         # For the global part, feature_value frequencies are computed. Note that thw whole local nodes information is
         # taken into account
-        df_global_graph_nodes = df_local_graph_nodes.groupby(NODE_NAME)[NODE_NAME].count().reset_index(name=NODE_COUNT)
+        df_global_graph_nodes = pd.DataFrame({NODE_NAME: node_names.astype(object),
+                                              NODE_COUNT: np.bincount(node_codes.ravel(), minlength=len(node_names))})
         df_global_graph_nodes[TOTAL_COUNT] = len(self.__df)
         df_global_graph_nodes[NODE_NAME_RATIO] = df_global_graph_nodes[NODE_COUNT] / df_global_graph_nodes[TOTAL_COUNT]
         df_global_graph_nodes[NODE_NAME_RATIO_RANK] = (
             df_global_graph_nodes[NODE_NAME_RATIO].rank(method='dense', ascending=False).astype(int))
 
-        return StatsResults(global_stats=df_global_graph_nodes, local_stats=df_local_graph_nodes_sample), np.delete(
-            graph_nodes_info, [2, 3], axis=1)
+        return StatsResults(global_stats=df_global_graph_nodes, local_stats=df_local_graph_nodes_sample), \
+            graph_nodes_info
+
+    def __count_edges(self, feature_codes: np.ndarray, num_codes: List[int],
+                      pairs: List[Tuple[int, int]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        This method counts the co-occurrences of the codes of each feature pair (see `_count_pairs`). When more than
+        one job is requested, feature pairs are split into shards which are counted by a pool of processes. Feature
+        codes are placed in shared memory only once, so the result doesn't depend on the number of jobs
+
+        :param feature_codes:   Numpy matrix of integers, containing the codes of each row and feature
+        :param num_codes:       List of integers, containing the number of codes of each feature
+        :param pairs:           List of tuples, containing the feature pairs to be counted
+        :return:                List of tuples, containing the sorted combined codes and the counts of each feature
+                                pair, in the same order as the pairs
+        """
+        n_jobs = get_n_jobs(self.__n_jobs)
+        if n_jobs == 1 or len(pairs) < 2:
+            return [_count_pairs(codes_1=feature_codes[:, i], codes_2=feature_codes[:, j], num_codes_1=num_codes[i],
+                                 num_codes_2=num_codes[j]) for i, j in pairs]
+
+        # Pairs are dealt out to the shards, so that pairs of high cardinality features are spread over them. Codes
+        # are shared in column-major order, as they're accessed column by column
+        num_shards = min(len(pairs), SHARDS_PER_JOB * n_jobs)
+        shared_memory, shared_codes = create_shared_array(feature_codes.shape, feature_codes.dtype, feature_codes,
+                                                          order='F')
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [executor.submit(_count_pairs_task, shared_codes, num_codes, pairs[shard::num_shards])
+                           for shard in range(num_shards)]
+                pair_counts = [None] * len(pairs)
+                for shard, future in enumerate(futures):
+                    pair_counts[shard::num_shards] = future.result()
+            return pair_counts
+        finally:
+            shared_memory.close()
+            shared_memory.unlink()
 
     def calculate_stats(self) -> Tuple[StatsResults, StatsResults, pd.DataFrame, np.ndarray]:
         """
@@ -209,8 +308,12 @@ class StatsCalculator(object):
                  nodes statistics, a pandas DataFrame to store target values counts and a numpy array containing for
                  all the ID-node pairs, their top1 target and the name of the column containing the importance value
         """
-        edges_stats = self.__calculate_edges_stats()
-        nodes_stats, nodes_importance_columns = self.__calculate_nodes_stats()
+        # Features are encoded into node codes once, so that node names are only formatted for the distinct nodes
+        node_codes, node_names = get_node_codes(df=self.__df, feature_cols=self.__feature_cols,
+                                                float_feature_cols=self.__float_feature_cols, encoding=self.__encoding)
+        edges_stats = self.__calculate_edges_stats(node_codes=node_codes, node_names=node_names)
+        nodes_stats, nodes_importance_columns = self.__calculate_nodes_stats(node_codes=node_codes,
+                                                                             node_names=node_names)
         target_distribution = self.__calculate_global_target_distribution()
 
         return edges_stats, nodes_stats, target_distribution, nodes_importance_columns